@@ -1,28 +1,81 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 import os
 
+from utils import dbpool, metrics
+
 # Load .env first
 load_dotenv()
 
 # Then get the value
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
-print("DATABASE URL:", SQLALCHEMY_DATABASE_URL)
+
+# Pool sizing / recycling / statement timeout come from env (DB_POOL_SIZE, ... see utils/dbpool.py)
+POOL_SETTINGS = dbpool.settings()
+_statement_timeout = POOL_SETTINGS["statement_timeout_ms"]
 
 # Now create the engine
 #engine = create_engine(SQLALCHEMY_DATABASE_URL)
+_options = "-c search_path=public"  # <- ensures CREATEs go into public
+if _statement_timeout:
+    _options += f" -c statement_timeout={_statement_timeout}"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"options": "-c search_path=public"}  # <- ensures CREATEs go into public
+    connect_args={"options": _options},
+    poolclass=dbpool.TimedQueuePool,
+    **dbpool.engine_kwargs(POOL_SETTINGS),
 )
+metrics.instrument_engine(engine)  # query count / DB time per request, see utils/metrics.py
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
-    print("connect successful")
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+# ---------------------------------------------------------------
+# Async engine (asyncpg) for the `async def` routers
+#   Same database, own connection pool. Queries are awaited on the event loop instead of
+#   holding one of the threadpool's threads for the whole request.
+#   The sync engine above stays for create_all / migrations tools, the dashboard and the
+#   COPY based bulk import / streaming export (psycopg2 only).
+# ---------------------------------------------------------------
+
+def _async_url(url: str):
+    """postgresql[+psycopg2]://... -> postgresql+asyncpg://..., plus the asyncpg connect args."""
+    u = make_url(url).set(drivername="postgresql+asyncpg")
+    server_settings = {"search_path": "public"}
+    if _statement_timeout:
+        server_settings["statement_timeout"] = str(_statement_timeout)
+    connect_args = {"server_settings": server_settings}
+    # libpq's sslmode (e.g. ?sslmode=require on hosted databases) is asyncpg's `ssl`
+    sslmode = u.query.get("sslmode")
+    if sslmode:
+        u = u.difference_update_query(["sslmode"])
+        connect_args["ssl"] = sslmode
+    return u, connect_args
+
+_ASYNC_URL, _ASYNC_CONNECT_ARGS = _async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(
+    _ASYNC_URL,
+    connect_args=_ASYNC_CONNECT_ARGS,
+    poolclass=dbpool.TimedAsyncQueuePool,
+    **dbpool.engine_kwargs(POOL_SETTINGS),
+)
+
+metrics.instrument_engine(async_engine.sync_engine)
+
+# expire_on_commit=False: attributes can't be lazy-loaded in async code, so objects
+# (e.g. the current user) keep their loaded values after a commit
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,14 +1,26 @@
 from fastapi import FastAPI, Response, status, HTTPException, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
+from database import engine, async_engine, Base, SessionLocal, POOL_SETTINGS
 import models
-from routers import user, auth, trends, recent, summary, vitals, appointment, availability, facility, vapi
+from utils import cache, partitions, dbpool, metrics, hasing, rollups
+from routers import user, auth, trends, recent, summary, vitals, dashboard, export, appointment, availability, facility, vapi
 
 
 app = FastAPI()
 
 models.Base.metadata.create_all(bind=engine) #create table 
 
+# create the upcoming monthly vitals partitions (no-op until migrations/0002 is applied)
+with SessionLocal() as db:
+    partitions.maintain(db)
+    db.commit()
+
+# upgraded database: fill the daily rollups the 30d / all summaries and daily trends read
+with SessionLocal() as db:
+    rollups.backfill_if_empty(db)
+    db.commit()
+
 
 ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -16,6 +28,12 @@ ALLOWED_ORIGINS = [
     "https://healthcare-patient-dashboard.vercel.app",
 ]
 
+# per-route latency / SQL statement counts for GET /metrics (added first = innermost,
+# CORS preflights answered by the CORS middleware are not counted)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.add_collector(cache.collect)
+metrics.add_collector(lambda: dbpool.collect({"sync": engine, "async": async_engine}))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
@@ -26,6 +44,13 @@ app.add_middleware(
 )
 
 
+# login / signup while the password hashing pool is full (utils/hasing.py): refuse at once
+@app.exception_handler(hasing.HashingBusy)
+async def hashing_busy(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Too many logins in progress, try again shortly"},
+                        headers={"Retry-After": "1"})
+
+
 # ---- Include routers ----
 app.include_router(auth.router)      # /auth
 app.include_router(user.router)      # /users (or whatever you set)
@@ -33,6 +58,8 @@ app.include_router(vitals.router)    # /vitals
 app.include_router(summary.router)   # /vitals/summary (per your file)
 app.include_router(trends.router)    # /vitals/trends
 app.include_router(recent.router)    # /vitals/recent
+app.include_router(dashboard.router) # /vitals/dashboard (summary + trends + recent in one call)
+app.include_router(export.router)    # /vitals/export (streamed CSV / NDJSON download)
 
 # Appointments platform
 app.include_router(appointment.router)   # /appointments
@@ -47,4 +74,26 @@ app.include_router(vapi.router)
 @app.get("/") 
 def root():
     #the data get send back to the client
-    return {"message": "Hello World kinoko from HealthDashboard! :3"}
\ No newline at end of file
+    return {"message": "Hello World kinoko from HealthDashboard! :3"}
+
+
+# response cache counters (hits / misses / evictions / invalidations) of this worker
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+
+# connection pools of this worker: in use / idle / overflow, checkout wait histogram (ms), timeouts
+@app.get("/db/pool")
+def db_pool_stats():
+    return {
+        "settings": POOL_SETTINGS,
+        "sync": dbpool.pool_status(engine),
+        "async": dbpool.pool_status(async_engine),
+    }
+
+
+# Prometheus scrape endpoint: all workers of the deployment when METRICS_DIR is set
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
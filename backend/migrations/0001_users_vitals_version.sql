@@ -0,0 +1,7 @@
+-- 0001 : per-user vitals data version (ETag / If-None-Match on the vitals read endpoints)
+--
+-- New databases get this column from models.Base.metadata.create_all() in main.py;
+-- existing ones need it added by hand:
+--   psql "$DATABASE_URL" -f migrations/0001_users_vitals_version.sql
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS vitals_version INTEGER NOT NULL DEFAULT 0;
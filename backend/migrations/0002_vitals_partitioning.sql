@@ -0,0 +1,161 @@
+-- 0002 : monthly range partitioning of vitals on recorded_at
+--
+-- Every vitals read filters on (user_id, recorded_at), so with one partition per UTC month
+-- the planner prunes a 7d / 30d query down to the 1-3 months it overlaps.
+--
+--   vitals                 partitioned parent, PRIMARY KEY (id, recorded_at)
+--                          (a partition key has to be part of the primary key; ids still come
+--                          from the same vitals_id_seq, so they stay unique in practice)
+--   vitals_pYYYYMM         one partition per month, [first of month, first of next month) UTC
+--   vitals_default         catch-all for rows outside every partition (e.g. an old device
+--                          history imported through /vitals/bulk); emptied by the maintenance
+--                          function, which moves such rows into a proper month partition
+--
+-- Maintenance: SELECT * FROM vitals_maintain_partitions(months_ahead => 3, retain_months => NULL);
+--   - creates the partitions of this month and the next `months_ahead` months
+--   - moves rows stranded in vitals_default into their month's partition
+--   - retain_months: DETACHes (does not drop) partitions older than that many months; the
+--     detached vitals_pYYYYMM tables can be archived / dropped by hand. The daily rollups of
+--     those months are kept, so long-range summaries still include them.
+-- The backend runs it at startup (utils/partitions.py); schedule it too if the API runs for
+-- months without a restart:  python -m utils.partitions maintain
+--
+-- The ORM model is unchanged: new databases get a plain vitals table from create_all(),
+-- running this file converts it (existing rows are copied into the partitions):
+--   psql "$DATABASE_URL" -f migrations/0002_vitals_partitioning.sql
+-- Running it again on an already partitioned table only (re)creates the functions.
+
+BEGIN;
+
+-- create (or fill from vitals_default) the partition of the month starting at `m`
+CREATE OR REPLACE FUNCTION vitals_create_partition(m date) RETURNS text
+LANGUAGE plpgsql AS $$
+DECLARE
+    name text := 'vitals_p' || to_char(m, 'YYYYMM');
+    lo timestamptz := date_trunc('month', m)::timestamp AT TIME ZONE 'UTC';
+    hi timestamptz := (date_trunc('month', m) + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(name) IS NOT NULL THEN
+        RETURN NULL;  -- exists (attached, or detached by retention and left alone)
+    END IF;
+
+    IF to_regclass('vitals_default') IS NOT NULL
+       AND EXISTS (SELECT 1 FROM vitals_default WHERE recorded_at >= lo AND recorded_at < hi) THEN
+        -- rows of this month landed in the default partition: move them, then attach
+        EXECUTE format('CREATE TABLE %I (LIKE vitals INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', name);
+        EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (recorded_at >= %L AND recorded_at < %L)',
+                       name, name || '_bounds', lo, hi);
+        EXECUTE format('WITH moved AS (DELETE FROM vitals_default WHERE recorded_at >= %L AND recorded_at < %L RETURNING *)
+                        INSERT INTO %I SELECT * FROM moved', lo, hi, name);
+        EXECUTE format('ALTER TABLE vitals ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', name, lo, hi);
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', name, name || '_bounds');
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF vitals FOR VALUES FROM (%L) TO (%L)', name, lo, hi);
+    END IF;
+    RETURN name;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION vitals_maintain_partitions(months_ahead integer DEFAULT 3, retain_months integer DEFAULT NULL)
+RETURNS TABLE (action text, partition_name text)
+LANGUAGE plpgsql AS $$
+DECLARE
+    this_month date := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+    m date;
+    created text;
+    r record;
+BEGIN
+    -- one maintainer at a time (every API worker runs this at startup)
+    PERFORM pg_advisory_xact_lock(hashtext('vitals_maintain_partitions'));
+
+    FOR m IN
+        SELECT g::date FROM generate_series(this_month, this_month + make_interval(months => months_ahead), interval '1 month') g
+        UNION
+        SELECT DISTINCT date_trunc('month', recorded_at AT TIME ZONE 'UTC')::date FROM vitals_default
+        ORDER BY 1
+    LOOP
+        created := vitals_create_partition(m);
+        IF created IS NOT NULL THEN
+            action := 'created'; partition_name := created; RETURN NEXT;
+        END IF;
+    END LOOP;
+
+    IF retain_months IS NOT NULL THEN
+        FOR r IN
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'vitals'::regclass AND c.relname ~ '^vitals_p[0-9]{6}$'
+            ORDER BY c.relname
+        LOOP
+            IF to_date(substr(r.relname, 9), 'YYYYMM') + interval '1 month'
+               <= this_month - make_interval(months => retain_months) THEN
+                EXECUTE format('ALTER TABLE vitals DETACH PARTITION %I', r.relname);
+                action := 'detached'; partition_name := r.relname; RETURN NEXT;
+            END IF;
+        END LOOP;
+    END IF;
+END;
+$$;
+
+
+-- one-time conversion of the plain table created by create_all()
+DO $$
+DECLARE
+    first_month date;
+    last_month date;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'vitals'::regclass) THEN
+        RAISE NOTICE 'vitals is already partitioned';
+        RETURN;
+    END IF;
+
+    ALTER TABLE vitals RENAME TO vitals_unpartitioned;
+    ALTER SEQUENCE vitals_id_seq OWNED BY NONE;  -- keep the id sequence when the old table is dropped
+
+    CREATE TABLE vitals (
+        id integer NOT NULL DEFAULT nextval('vitals_id_seq'),
+        user_id integer NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        recorded_at timestamptz NOT NULL,
+        systolic_bp integer,
+        diastolic_bp integer,
+        heart_rate integer,
+        temperature double precision,
+        glucose double precision,
+        notes text,
+        created_at timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (id, recorded_at)
+    ) PARTITION BY RANGE (recorded_at);
+    ALTER SEQUENCE vitals_id_seq OWNED BY vitals.id;
+    CREATE TABLE vitals_default PARTITION OF vitals DEFAULT;
+
+    -- a partition for every month between the oldest and newest reading, then copy the rows over
+    SELECT date_trunc('month', min(recorded_at) AT TIME ZONE 'UTC')::date,
+           date_trunc('month', max(recorded_at) AT TIME ZONE 'UTC')::date
+      INTO first_month, last_month
+      FROM vitals_unpartitioned;
+    IF first_month IS NOT NULL THEN
+        PERFORM vitals_create_partition(g::date)
+           FROM generate_series(first_month, last_month, interval '1 month') g;
+    END IF;
+
+    INSERT INTO vitals (id, user_id, recorded_at, systolic_bp, diastolic_bp, heart_rate,
+                        temperature, glucose, notes, created_at)
+    SELECT id, user_id, recorded_at, systolic_bp, diastolic_bp, heart_rate,
+           temperature, glucose, notes, created_at
+      FROM vitals_unpartitioned;
+
+    DROP TABLE vitals_unpartitioned;
+
+    -- indexes after the copy (faster than maintaining them row by row); created on the parent,
+    -- PostgreSQL adds them to every current and future partition
+    CREATE INDEX ix_vitals_user_recorded_id ON vitals (user_id, recorded_at, id);
+    CREATE INDEX ix_vitals_user_id ON vitals (user_id);
+    CREATE INDEX ix_vitals_recorded_at ON vitals (recorded_at);
+END;
+$$;
+
+SELECT * FROM vitals_maintain_partitions();
+
+COMMIT;
+
+ANALYZE vitals;
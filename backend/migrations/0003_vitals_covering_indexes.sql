@@ -0,0 +1,37 @@
+-- 0003 : covering + BRIN indexes for vitals, drop the redundant single-column ones
+--
+--   ix_vitals_user_recorded_covering : (user_id, recorded_at, id) INCLUDE (the five metrics)
+--       every hot query is WHERE user_id = ? AND recorded_at >= ? ORDER BY recorded_at (, id);
+--       summary / trends / rollup refreshes only need the metrics -> index-only scans
+--   ix_vitals_created_at_brin : BRIN on created_at, rows are appended in created_at order so a
+--       few kB index answers "rows added since ..." (ingest audits, incremental analytics pulls)
+--
+-- Dropped: ix_vitals_id (duplicate of the primary key), ix_vitals_user_id and
+-- ix_vitals_recorded_at (prefixes / subsumed by the covering index) and
+-- ix_vitals_user_recorded_id (the covering index has the same key columns).
+--
+-- Works on the plain table (create_all) and on the partitioned one (migrations/0002); on a
+-- partitioned table the indexes are created on the parent and cascade to every partition.
+-- The CREATE INDEX statements block writes to vitals while they build; on a large plain table
+-- run them by hand with CREATE INDEX CONCURRENTLY instead.
+--   psql "$DATABASE_URL" -f migrations/0003_vitals_covering_indexes.sql
+-- Check the plans afterwards:  python -m utils.explain
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS ix_vitals_user_recorded_covering
+    ON vitals (user_id, recorded_at, id)
+    INCLUDE (systolic_bp, diastolic_bp, heart_rate, temperature, glucose);
+
+CREATE INDEX IF NOT EXISTS ix_vitals_created_at_brin
+    ON vitals USING brin (created_at);
+
+DROP INDEX IF EXISTS ix_vitals_user_recorded_id;
+DROP INDEX IF EXISTS ix_vitals_user_id;
+DROP INDEX IF EXISTS ix_vitals_recorded_at;
+DROP INDEX IF EXISTS ix_vitals_id;
+
+COMMIT;
+
+-- index-only scans need an up-to-date visibility map
+VACUUM (ANALYZE) vitals;
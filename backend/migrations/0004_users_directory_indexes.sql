@@ -0,0 +1,25 @@
+-- 0004 : indexes for the user directory (GET /users/ : search + role filter, keyset pagination)
+--
+--   ix_users_username_trgm / ix_users_email_trgm : GIN trigram indexes, serve
+--       username ILIKE '%abc%' / 'abc%' (and the same on email) at any position in the string
+--   ix_users_role_username : (role, username), one role browsed in username order
+--       (all roles: the unique index on username already gives that order)
+--
+-- New databases get them from models.Base.metadata.create_all() in main.py (the trigram ones
+-- only where the pg_trgm extension is available, see models.py); existing ones need them added
+-- by hand. pg_trgm is a trusted extension: the database owner can create it, no superuser needed.
+-- CREATE INDEX blocks writes to users while it builds; on a large table run the statements by
+-- hand with CREATE INDEX CONCURRENTLY instead.
+--   psql "$DATABASE_URL" -f migrations/0004_users_directory_indexes.sql
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_users_role_username ON users (role, username);
+
+COMMIT;
+
+ANALYZE users;
@@ -0,0 +1,37 @@
+-- 0005 : database-enforced "no overlapping confirmed appointments per provider"
+--
+--   excl_appointment_provider_overlap : EXCLUDE USING gist
+--       (provider_id WITH =, tstzrange(start_at, end_at) WITH &&) WHERE (status = 'confirmed')
+--       two concurrent approvals of overlapping slots can't both commit any more: the second
+--       one fails with an exclusion violation (the API answers 409 "Time slot not available").
+--       Ranges are [start, end): back-to-back appointments (10:00-10:30, 10:30-11:00) are fine.
+--
+-- Run it on new databases too (after the first start has created the tables): the app never
+-- creates the btree_gist extension itself, models.py only adds the constraint to a new table when
+-- the extension is already there. Safe to run again. btree_gist is a trusted extension: the
+-- database owner can create it, no superuser needed.
+--
+-- Fails if confirmed appointments already overlap. List them first and cancel / reschedule:
+--   SELECT a.id, b.id, a.provider_id, a.start_at, a.end_at, b.start_at, b.end_at
+--   FROM appointments a JOIN appointments b
+--     ON a.provider_id = b.provider_id AND a.id < b.id
+--    AND tstzrange(a.start_at, a.end_at) && tstzrange(b.start_at, b.end_at)
+--   WHERE a.status = 'confirmed' AND b.status = 'confirmed';
+--
+--   psql "$DATABASE_URL" -f migrations/0005_appointments_no_overlap.sql
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'excl_appointment_provider_overlap') THEN
+        ALTER TABLE appointments ADD CONSTRAINT excl_appointment_provider_overlap
+            EXCLUDE USING gist (provider_id WITH =, tstzrange(start_at, end_at) WITH &&)
+            WHERE (status = 'confirmed');
+    END IF;
+END
+$$;
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- 0006 : give the partitioned vitals table's primary key its usual name back
+--
+-- migrations/0002 builds the partitioned vitals while the old plain table (renamed
+-- vitals_unpartitioned) still owns the name vitals_pkey, so the new key comes out as
+-- vitals_pkey1 and keeps that name after the old table is dropped. Renames it to vitals_pkey,
+-- as on a plain vitals table from create_all().
+--
+-- Only acts on a database converted by 0002 whose key is still vitals_pkey1; a no-op anywhere
+-- else and safe to run again. Renaming takes a brief lock on vitals, no data is rewritten.
+--   psql "$DATABASE_URL" -f migrations/0006_vitals_pkey_name.sql
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'vitals'::regclass AND conname = 'vitals_pkey1')
+       AND to_regclass('vitals_pkey') IS NULL THEN
+        ALTER TABLE vitals RENAME CONSTRAINT vitals_pkey1 TO vitals_pkey;
+    END IF;
+END;
+$$;
+
+COMMIT;
@@ -1,11 +1,12 @@
 from database import Base
 from sqlalchemy import (
-    Column, Integer, String, Text, Float, ForeignKey, DateTime,
+    Column, Integer, String, Text, Float, ForeignKey, DateTime, Date,
     Enum as SAEnum, Index, UniqueConstraint, CheckConstraint, func
 )
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql import text
 from sqlalchemy.orm import relationship
+from sqlalchemy import event
 from datetime import datetime
 import enum
 
@@ -44,18 +45,65 @@ class User(Base):
     )
 
     role = Column(String, nullable=False, server_default="patient")  # "patient" | "provider" | "staff"
+
+    # bumped on every vitals create / update / delete, used for ETags (see utils/conditional.py)
+    vitals_version = Column(Integer, nullable=False, server_default="0")
     __table_args__ = (
         CheckConstraint("role IN ('patient','provider','staff')", name="chk_user_role"),
+        # user directory (GET /users/): one role browsed in username order (keyset pagination)
+        Index("ix_users_role_username", "role", "username"),
     )
 
+# user directory search (username / email ILIKE '%...%'): GIN trigram indexes. They need the
+# pg_trgm extension (trusted, the database owner can create it), which some PostgreSQL builds
+# don't ship, so they are created here only if it is available (search then still works, with
+# a scan). Runs when create_all() creates the users table; existing databases: migrations/0004
+USER_SEARCH_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)",
+)
+
+@event.listens_for(User.__table__, "after_create")
+def _create_user_search_indexes(table, connection, **kw):
+    if connection.exec_driver_sql("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").first() is None:
+        return
+    connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for ddl in USER_SEARCH_INDEXES:
+        connection.exec_driver_sql(ddl)
+
+# ---------------------------
+# LOGIN SESSIONS (refresh tokens, see utils/sessions.py)
+# ---------------------------
+class UserSession(Base):
+    __tablename__ = "user_sessions"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # SHA-256 (hex) of the refresh token, the token itself is never stored
+    token_hash = Column(String(64), nullable=False, unique=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)  # rotated, logged out or revoked
+
+    __table_args__ = (
+        # bulk revocation: UPDATE ... WHERE user_id = ? AND revoked_at IS NULL
+        Index("ix_user_sessions_user_active", "user_id", postgresql_where=text("revoked_at IS NULL")),
+    )
+
+# Readings at or above these values count as "flagged" on the dashboard
+FLAG_SYSTOLIC_BP = 140      # mmHg (stage 2 hypertension)
+FLAG_TEMPERATURE = 100.4    # °F (fever)
+
 class Vital(Base):
     __tablename__ = "vitals"
 
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     # Make timestamps timezone-aware (UTC in DB)
-    recorded_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    recorded_at = Column(DateTime(timezone=True), nullable=False)
 
     systolic_bp = Column(Integer, nullable=True)
     diastolic_bp = Column(Integer, nullable=True)
@@ -68,6 +116,61 @@ class Vital(Base):
 
     user = relationship("User", back_populates="vitals")
 
+    __table_args__ = (
+        # every hot read: WHERE user_id = ? AND recorded_at >= ? ORDER BY recorded_at, id
+        # (also serves keyset pagination and user_id-only lookups). The metrics are carried in
+        # the leaf pages, so summary / trends / rollup refreshes are index-only scans.
+        Index(
+            "ix_vitals_user_recorded_covering", "user_id", "recorded_at", "id",
+            postgresql_include=["systolic_bp", "diastolic_bp", "heart_rate", "temperature", "glucose"],
+        ),
+        # rows are appended roughly in created_at order: a tiny BRIN index serves "rows added since"
+        Index("ix_vitals_created_at_brin", "created_at", postgresql_using="brin"),
+    )
+
+
+class VitalDailyRollup(Base):
+    """
+    Per-user, per-day (UTC) aggregate of the vitals table.
+
+    Kept in sync inside the same transaction as every vitals write (see utils/rollups.py),
+    so summary / trends can read O(days) rows instead of O(readings).
+    """
+    __tablename__ = "vital_daily_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)   # UTC calendar day of recorded_at
+
+    entries = Column(Integer, nullable=False, default=0)
+    flagged_entries = Column(Integer, nullable=False, default=0)
+    last_recorded_at = Column(DateTime(timezone=True), nullable=True)
+
+    # per metric: how many non-null readings + sum / min / max of them
+    systolic_bp_count = Column(Integer, nullable=False, default=0)
+    systolic_bp_sum = Column(Float, nullable=True)
+    systolic_bp_min = Column(Integer, nullable=True)
+    systolic_bp_max = Column(Integer, nullable=True)
+
+    diastolic_bp_count = Column(Integer, nullable=False, default=0)
+    diastolic_bp_sum = Column(Float, nullable=True)
+    diastolic_bp_min = Column(Integer, nullable=True)
+    diastolic_bp_max = Column(Integer, nullable=True)
+
+    heart_rate_count = Column(Integer, nullable=False, default=0)
+    heart_rate_sum = Column(Float, nullable=True)
+    heart_rate_min = Column(Integer, nullable=True)
+    heart_rate_max = Column(Integer, nullable=True)
+
+    temperature_count = Column(Integer, nullable=False, default=0)
+    temperature_sum = Column(Float, nullable=True)
+    temperature_min = Column(Float, nullable=True)
+    temperature_max = Column(Float, nullable=True)
+
+    glucose_count = Column(Integer, nullable=False, default=0)
+    glucose_sum = Column(Float, nullable=True)
+    glucose_min = Column(Float, nullable=True)
+    glucose_max = Column(Float, nullable=True)
+
 # ---------------------------
 # PROVIDERS / APPTS
 # ---------------------------
@@ -187,3 +290,21 @@ class Appointment(Base):
             name="chk_appt_visit_type_location",
         ),
     )
+
+# No two *confirmed* appointments of a provider may overlap. Enforced by the database, so two
+# concurrent approvals can't both pass the check in routers/appointment.py: the second commit
+# fails with an IntegrityError naming this constraint (answered with 409). `provider_id WITH =`
+# in a GiST index needs the btree_gist extension, which migrations/0005 installs (and adds the
+# constraint to a table created without it). create_all() only adds the constraint to a new
+# table when btree_gist is already installed in the database.
+APPOINTMENT_OVERLAP_CONSTRAINT = "excl_appointment_provider_overlap"
+APPOINTMENT_OVERLAP_DDL = (
+    f"ALTER TABLE appointments ADD CONSTRAINT {APPOINTMENT_OVERLAP_CONSTRAINT} "
+    "EXCLUDE USING gist (provider_id WITH =, tstzrange(start_at, end_at) WITH &&) "
+    "WHERE (status = 'confirmed')"
+)
+
+@event.listens_for(Appointment.__table__, "after_create")
+def _create_appointment_overlap_constraint(table, connection, **kw):
+    if connection.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'btree_gist'").first() is not None:
+        connection.exec_driver_sql(APPOINTMENT_OVERLAP_DDL)
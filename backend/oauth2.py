@@ -1,11 +1,15 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from dataclasses import replace
 from datetime import datetime, timedelta
 
 import models,schemas,database
+from utils.principals import Principal, cache as principal_cache, tokens as verified_tokens
 from fastapi import HTTPException, status, Depends
 
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from dotenv import load_dotenv
@@ -60,6 +64,11 @@ def verify_access_token(token: str, credentials_exception):
     Returns:
         TokenData: Contains the decoded user ID from token.
     """
+    # same token seen before and not expired yet: its signature was already checked
+    cached = verified_tokens.get(token)
+    if cached is not None:
+        return cached
+
     try:
         # decode the JWT token using secret and algorithms
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -70,6 +79,7 @@ def verify_access_token(token: str, credentials_exception):
         if id is None:
             raise credentials_exception 
         token_data = schemas.TokenData(id=id)
+        verified_tokens.set(token, payload.get("exp"), token_data)
 
     # if token is invalid or expired
     except JWTError as e:
@@ -78,6 +88,14 @@ def verify_access_token(token: str, credentials_exception):
     return token_data  # Return the token data if verification is successful
 
 
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
 def get_current_user(token: str = Depends(oauth2_scheme),db: Session = Depends(database.get_db)):
     """
     Get the current user from the JWT token.
@@ -91,11 +109,7 @@ def get_current_user(token: str = Depends(oauth2_scheme),db: Session = Depends(d
     Raises:
         credentials_exception: If the token is invalid or expired.
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    credentials_exception = _credentials_exception()
 
     # verify and decode the token
     token = verify_access_token(token, credentials_exception)
@@ -107,3 +121,77 @@ def get_current_user(token: str = Depends(oauth2_scheme),db: Session = Depends(d
     
     # return the user object
     return user
+
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    """
+    Same as get_current_user, for the `async def` endpoints (AsyncSession, no thread needed).
+
+    FastAPI caches dependencies per request, so the endpoint's own
+    Depends(database.get_async_db) gets this same session.
+    """
+    credentials_exception = _credentials_exception()
+    token = verify_access_token(token, credentials_exception)
+
+    user = (await db.execute(select(models.User).where(models.User.id == token.id))).scalar_one_or_none()
+    if user is None:
+        raise credentials_exception
+    return user
+
+
+# ---------------------------------------------------------------
+# Principals: the authenticated user without a users query per request
+#   get_principal / get_principal_async : id / role / email / username from the per-worker
+#       principal cache (utils/principals.py), the users row is only read on a miss
+#   get_versioned_principal(_async)     : + the current vitals_version (one-column lookup),
+#       for the routes that build ETags / response cache keys from it
+# Routes that need the full ORM user (e.g. /users/me) keep get_current_user.
+# ---------------------------------------------------------------
+
+def _token_user_id(token: str) -> int:
+    return int(verify_access_token(token, _credentials_exception()).id)
+
+
+def get_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> Principal:
+    user_id = _token_user_id(token)
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = db.get(models.User, user_id)
+        if user is None:
+            raise _credentials_exception()
+        principal = Principal.from_user(user)
+        principal_cache.set(principal)
+    return principal
+
+
+async def get_principal_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)) -> Principal:
+    user_id = _token_user_id(token)
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = await db.get(models.User, user_id)
+        if user is None:
+            raise _credentials_exception()
+        principal = Principal.from_user(user)
+        principal_cache.set(principal)
+    return principal
+
+
+def _with_version(principal: Principal, version) -> Principal:
+    if version is None:  # deleted since it was cached
+        principal_cache.invalidate(principal.id)
+        raise _credentials_exception()
+    return replace(principal, vitals_version=version)
+
+
+def get_versioned_principal(principal: Principal = Depends(get_principal), db: Session = Depends(database.get_db)) -> Principal:
+    version = db.execute(
+        select(models.User.vitals_version).where(models.User.id == principal.id)
+    ).scalar_one_or_none()
+    return _with_version(principal, version)
+
+
+async def get_versioned_principal_async(principal: Principal = Depends(get_principal_async), db: AsyncSession = Depends(database.get_async_db)) -> Principal:
+    version = (await db.execute(
+        select(models.User.vitals_version).where(models.User.id == principal.id)
+    )).scalar_one_or_none()
+    return _with_version(principal, version)
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 import models, schemas, oauth2
-from database import get_db
+from database import get_async_db
+from utils import schedule
 
 router = APIRouter(prefix="/appointments", tags=["Appointments"])
 
-def _has_overlap(
-    db: Session,
+MAX_FREE_RANGE = timedelta(days=62)
+
+async def _has_overlap(
+    db: AsyncSession,
     provider_id: int,
     start: datetime,
     end: datetime,
@@ -17,50 +22,73 @@ def _has_overlap(
     statuses: list[models.ApptStatus] | None = None,
     exclude_id: int | None = None,
 ) -> bool:
-    q = db.query(models.Appointment).filter(
-        models.Appointment.provider_id == provider_id,
-        models.Appointment.start_at < end,
-        models.Appointment.end_at   > start,
-    )
-    if statuses:
-        q = q.filter(models.Appointment.status.in_(statuses))
-    if exclude_id:
-        q = q.filter(models.Appointment.id != exclude_id)
-    return db.query(q.exists()).scalar()
+    # any status unless `statuses` is given; always a database query (it decides a write),
+    # see utils/schedule.py
+    return await db.run_sync(schedule.has_overlap, provider_id, start, end,
+                             statuses=statuses, exclude_id=exclude_id)
+
+async def _commit_or_409(db: AsyncSession) -> None:
+    # the check above can race with a concurrent approval / reschedule: the database constraint
+    # (models.APPOINTMENT_OVERLAP_CONSTRAINT) has the last word
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if schedule.is_overlap_violation(e):
+            raise HTTPException(status_code=409, detail="Time slot not available")
+        raise
 
 @router.get("/mine", response_model=List[schemas.AppointmentOut])
-def my_appointments(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user),
+async def my_appointments(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
     active_only: bool = Query(True),  # default to hiding cancelled/denied
 ):
-    q = db.query(models.Appointment).filter(
+    q = select(models.Appointment).where(
         models.Appointment.patient_id == current_user.id
     )
     if active_only:
-        q = q.filter(models.Appointment.status.in_([
+        q = q.where(models.Appointment.status.in_([
             models.ApptStatus.requested,
             models.ApptStatus.confirmed,
         ]))
-    return q.order_by(models.Appointment.start_at.asc()).all()
+    return (await db.execute(q.order_by(models.Appointment.start_at.asc()))).scalars().all()
 
 @router.get("/provider", response_model=List[schemas.AppointmentOut])
-def provider_appointments(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user),
+async def provider_appointments(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
     start_from: Optional[datetime] = Query(None),
 ):
-    q = db.query(models.Appointment).filter(models.Appointment.provider_id == current_user.id)
+    q = select(models.Appointment).where(models.Appointment.provider_id == current_user.id)
     if start_from:
-        q = q.filter(models.Appointment.start_at >= start_from)
-    return q.order_by(models.Appointment.start_at.asc()).all()
+        q = q.where(models.Appointment.start_at >= start_from)
+    return (await db.execute(q.order_by(models.Appointment.start_at.asc()))).scalars().all()
+
+@router.get("/providers/{provider_id}/free", response_model=List[schemas.FreeSlot])
+async def provider_free_slots(
+    provider_id: int,
+    start_from: Optional[datetime] = Query(None),   # default: now
+    until: Optional[datetime] = Query(None),        # default: 14 days after start_from
+    db: AsyncSession = Depends(get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
+):
+    # the provider's availability minus its confirmed appointments
+    start = start_from or datetime.now(timezone.utc)
+    end = until or start + timedelta(days=14)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="until must be after start_from")
+    if end - start > MAX_FREE_RANGE:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_FREE_RANGE.days} days at a time")
+    slots = await db.run_sync(schedule.free_slots, provider_id, start, end)
+    return [{"start_at": s, "end_at": e} for s, e in slots]
 
 @router.post("/", response_model=schemas.AppointmentOut, status_code=status.HTTP_201_CREATED)
-def create_appointment(payload: schemas.AppointmentCreate,
-                       db: Session = Depends(get_db),
-                       current_user: models.User = Depends(oauth2.get_current_user)):
+async def create_appointment(payload: schemas.AppointmentCreate,
+                             db: AsyncSession = Depends(get_async_db),
+                             current_user: oauth2.Principal = Depends(oauth2.get_principal_async)):
 
-    provider = db.query(models.User).filter(models.User.id == payload.provider_id).first()
+    provider = await db.get(models.User, payload.provider_id)
     if not provider or provider.role != "provider":
         raise HTTPException(status_code=404, detail="Provider not found")
 
@@ -74,7 +102,7 @@ def create_appointment(payload: schemas.AppointmentCreate,
         raise HTTPException(status_code=400, detail="telehealth must not include facility_id")
 
     # Allow multiple *requested* at the same time; only block if a confirmed appt clashes
-    if _has_overlap(db, payload.provider_id, payload.start_at, payload.end_at,
+    if await _has_overlap(db, payload.provider_id, payload.start_at, payload.end_at,
                     statuses=[models.ApptStatus.confirmed]):
         raise HTTPException(status_code=409, detail="Time slot not available")
 
@@ -91,17 +119,17 @@ def create_appointment(payload: schemas.AppointmentCreate,
         status=models.ApptStatus.requested, 
         video_url=None,
     )
-    db.add(appt); db.commit(); db.refresh(appt)
+    db.add(appt); await db.commit(); await db.refresh(appt)
     return appt
 
 @router.patch("/{appt_id}", response_model=schemas.AppointmentOut)
-def update_appointment(
+async def update_appointment(
     appt_id: int,
     payload: schemas.AppointmentUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
 ):
-    appt = db.get(models.Appointment, appt_id)
+    appt = await db.get(models.Appointment, appt_id)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
 
@@ -116,22 +144,25 @@ def update_appointment(
     new_end = data.get("end_at", appt.end_at)
     if new_end <= new_start:
         raise HTTPException(status_code=400, detail="end_at must be after start_at")
-    if (new_start != appt.start_at or new_end != appt.end_at) and _has_overlap(db, appt.provider_id, new_start, new_end):
+    # cancelled / denied appointments don't hold their slot; the appointment itself doesn't either
+    if (new_start != appt.start_at or new_end != appt.end_at) and await _has_overlap(
+            db, appt.provider_id, new_start, new_end,
+            statuses=[models.ApptStatus.requested, models.ApptStatus.confirmed], exclude_id=appt.id):
         raise HTTPException(status_code=409, detail="Time slot not available")
 
     for k, v in data.items():
         setattr(appt, k, v)
 
-    db.commit()
-    db.refresh(appt)
+    await _commit_or_409(db)
+    await db.refresh(appt)
     return appt
 
 @router.patch("/{appt_id}/approve", response_model=schemas.AppointmentOut)
-def approve_appointment(appt_id: int,
-                        db: Session = Depends(get_db),
-                        current_user: models.User = Depends(oauth2.get_current_user)):
+async def approve_appointment(appt_id: int,
+                              db: AsyncSession = Depends(get_async_db),
+                              current_user: oauth2.Principal = Depends(oauth2.get_principal_async)):
 
-    appt = db.get(models.Appointment, appt_id)
+    appt = await db.get(models.Appointment, appt_id)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     if appt.provider_id != current_user.id and current_user.role != "staff":
@@ -140,7 +171,7 @@ def approve_appointment(appt_id: int,
         raise HTTPException(status_code=400, detail=f"Cannot approve from status={appt.status}")
 
     # Make sure we don't collide with other confirmed bookings
-    if _has_overlap(db, appt.provider_id, appt.start_at, appt.end_at,
+    if await _has_overlap(db, appt.provider_id, appt.start_at, appt.end_at,
                     statuses=[models.ApptStatus.confirmed],
                     exclude_id=appt.id):
         raise HTTPException(status_code=409, detail="Time slot not available")
@@ -150,31 +181,31 @@ def approve_appointment(appt_id: int,
     # (Optional) if telehealth, set a video URL here
     # appt.video_url = generate_meeting_link(...)
 
-    db.commit(); db.refresh(appt)
+    await _commit_or_409(db); await db.refresh(appt)
     return appt
 
 @router.patch("/{appt_id}/cancel", status_code=status.HTTP_204_NO_CONTENT)
-def cancel_appointment(
+async def cancel_appointment(
     appt_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
 ):
-    appt = db.get(models.Appointment, appt_id)
+    appt = await db.get(models.Appointment, appt_id)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     if current_user.id not in (appt.patient_id, appt.provider_id):
         raise HTTPException(status_code=403, detail="Forbidden")
 
     appt.status = models.ApptStatus.cancelled
-    db.commit()
+    await db.commit()
     return None
 
 @router.patch("/{appt_id}/deny", status_code=204)
-def deny_appointment(appt_id: int,
-                     db: Session = Depends(get_db),
-                     current_user: models.User = Depends(oauth2.get_current_user)):
+async def deny_appointment(appt_id: int,
+                           db: AsyncSession = Depends(get_async_db),
+                           current_user: oauth2.Principal = Depends(oauth2.get_principal_async)):
 
-    appt = db.get(models.Appointment, appt_id)
+    appt = await db.get(models.Appointment, appt_id)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     if appt.provider_id != current_user.id and current_user.role != "staff":
@@ -183,5 +214,5 @@ def deny_appointment(appt_id: int,
         raise HTTPException(status_code=400, detail=f"Cannot deny from status={appt.status}")
 
     appt.status = models.ApptStatus.denied
-    db.commit()
+    await db.commit()
     return None
\ No newline at end of file
@@ -1,16 +1,17 @@
 
 
 #import neccessary modules and classes to run the backend
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 
 
 #import database and other utils for authencation 
-from database import get_db
+from database import get_async_db
 import models, schemas, oauth2
-from utils import hasing
+from utils import hasing, sessions, ingest, provisioning
 
 #create routes instance for authentication related routes
 router = APIRouter(
@@ -21,22 +22,25 @@ router = APIRouter(
 # Define a POST route for user login with expected response type of Token schema
 @router.post("/login", response_model=schemas.Token)  # set the response model to Token schema  
 
-def login(user_credentials: OAuth2PasswordRequestForm = Depends() ,db:Session = Depends(get_db)):
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends() ,db: AsyncSession = Depends(get_async_db)):
     """
     Authenticates a user and returns a JWT access token if credentials are valid.
 
     Args:
         user_credentials (OAuth2PasswordRequestForm): Form containing 'username' and 'password' fields.
-        db (Session): SQLAlchemy database session injected via dependency.
+        db (AsyncSession): SQLAlchemy async database session injected via dependency.
 
     Returns:
         dict: A JSON response with the access token and token type.
 
     Raises:
         HTTPException: If the user is not found or password is incorrect.
+        hasing.HashingBusy: If too many hashes are queued (answered with 503 in main.py).
     """
     #retrieve the user from the datavase using the provided email (username field in the form [login.jsx])
-    user = db.query(models.User).filter(models.User.email == user_credentials.username).first()
+    user = (await db.execute(
+        select(models.User).where(models.User.email == user_credentials.username)
+    )).scalars().first()
     
     # If no user is found, raise a 403 Forbidden error
     if not user:
@@ -46,33 +50,116 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends() ,db:Session =
         )
     
     #if the password does not match the hashed password in the database, raise 403 error
-    if not hasing.verify_password(user_credentials.password, user.password):
+    #(bcrypt runs in the hashing process pool, the event loop keeps serving other requests)
+    valid, new_hash = await hasing.verify_and_update_async(user_credentials.password, user.password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid credentials"
         )
+
+    #stored hash uses an old scheme / fewer rounds than configured: save the upgraded one
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
     
     #Generate the JWT access token with the user's ID as the payload 
     access_token = oauth2.create_access_token(data={"sub": str(user.id), "role":user.role})
 
+    #refresh token: renew the access token at /token/refresh without logging in again
+    refresh_token = await sessions.issue(db, user.id)
     
     return {"access_token": access_token, 
             "token_type": "bearer", 
             "email": user.email,
             "username": user.username,
-            "role": user.role
+            "role": user.role,
+            "refresh_token": refresh_token
         }
 
-def require_staff(u=Depends(oauth2.get_current_user)):
+
+# Exchange a refresh token for a new access token (+ a new refresh token, the old one stops working)
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_token(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    rotated = await sessions.rotate(db, body.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token"
+        )
+    user_id, new_refresh_token = rotated
+
+    #role / email / username for the response: the principal cache, or one primary key lookup
+    principal = oauth2.principal_cache.get(user_id)
+    if principal is None:
+        user = await db.get(models.User, user_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired refresh token"
+            )
+        principal = oauth2.Principal.from_user(user)
+        oauth2.principal_cache.set(principal)
+
+    access_token = oauth2.create_access_token(data={"sub": str(principal.id), "role": principal.role})
+    return {"access_token": access_token,
+            "token_type": "bearer",
+            "email": principal.email,
+            "username": principal.username,
+            "role": principal.role,
+            "refresh_token": new_refresh_token
+        }
+
+
+# Log out: the refresh token can't be used any more (the access token still runs until it expires)
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    await sessions.revoke(db, body.refresh_token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+# Log out everywhere: revoke every refresh token of the current user
+@router.post("/sessions/revoke-all")
+async def revoke_my_sessions(current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
+                             db: AsyncSession = Depends(get_async_db)):
+    return {"revoked": await sessions.revoke_user(db, current_user.id)}
+
+def require_staff(u=Depends(oauth2.get_principal)):
     if getattr(u, "role", "patient") != "staff":
         raise HTTPException(403, "Staff only")
     return u
 
 @router.post("/admin/providers", response_model=schemas.UserOut)
-def create_provider(u: schemas.UserCreate,
-                    _staff=Depends(require_staff),
-                    db: Session = Depends(get_db)):
+async def create_provider(u: schemas.UserCreate,
+                          _staff=Depends(require_staff),
+                          db: AsyncSession = Depends(get_async_db)):
     user = models.User(email=u.email, username=u.username,
-                       password=hasing.hash_password(u.password), role="provider")
-    db.add(user); db.commit(); db.refresh(user)
-    return user
\ No newline at end of file
+                       password=await hasing.hash_password_async(u.password), role="provider")
+    db.add(user); await db.commit(); await db.refresh(user)
+    return user
+
+# Staff: create many patient / provider accounts at once (clinic onboarding)
+@router.post("/admin/users/bulk", response_model=schemas.BulkUsersResult)
+async def bulk_create_users(request: Request,
+                            role: str = Query("patient", pattern="^(patient|provider)$"),  # for rows without a role
+                            format: Optional[str] = Query(None, pattern="^(json|ndjson|csv)$"),  # overrides the Content-Type
+                            _staff=Depends(require_staff),
+                            db: AsyncSession = Depends(get_async_db)):
+    """
+    Body: a JSON array, NDJSON or CSV (header row: email, username, password and optionally role),
+    raw or as a multipart `file` upload. New accounts are created, existing emails / usernames
+    are reported as duplicates and invalid rows by row number (see utils/provisioning.py).
+    """
+    body, fmt = await ingest.read_upload(request, format)
+    try:
+        return await provisioning.provision(db, ingest.parse_records(body, fmt, required_column="email"), role)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+# Staff: revoke every refresh token of a user (compromised account, offboarding, ...)
+@router.post("/admin/users/{user_id}/sessions/revoke")
+async def revoke_user_sessions(user_id: int,
+                               _staff=Depends(require_staff),
+                               db: AsyncSession = Depends(get_async_db)):
+    return {"revoked": await sessions.revoke_user(db, user_id)}
@@ -10,7 +10,7 @@ from database import get_db
 router = APIRouter(prefix="/availability", tags=["Availability"])
 
 # ---- role guard (keep here or move to a deps.py) ----
-def require_provider(u: models.User = Depends(oauth2.get_current_user)):
+def require_provider(u: oauth2.Principal = Depends(oauth2.get_principal)):
     if getattr(u, "role", "patient") != "provider":
         raise HTTPException(status_code=403, detail="Provider only")
     return u
@@ -33,7 +33,7 @@ def list_availability(
 
 @router.get("/mine", response_model=List[schemas.AvailabilityOut])
 def my_availability(
-    current: models.User = Depends(require_provider),
+    current: oauth2.Principal = Depends(require_provider),
     db: Session = Depends(get_db),
 ):
     return (db.query(models.Availability)
@@ -45,7 +45,7 @@ def my_availability(
 @router.post("/", response_model=schemas.AvailabilityOut, status_code=status.HTTP_201_CREATED)
 def create_availability(
     payload: schemas.AvailabilityCreate,   # <-- in this option, remove provider_id from the schema
-    current: models.User = Depends(require_provider),
+    current: oauth2.Principal = Depends(require_provider),
     db: Session = Depends(get_db),
 ):
     row = models.Availability(
@@ -59,7 +59,7 @@ def create_availability(
 def update_availability(
     availability_id: int,
     payload: schemas.AvailabilityUpdate,
-    current: models.User = Depends(require_provider),
+    current: oauth2.Principal = Depends(require_provider),
     db: Session = Depends(get_db),
 ):
     row = (db.query(models.Availability)
@@ -76,7 +76,7 @@ def update_availability(
 @router.delete("/{availability_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_availability(
     availability_id: int,
-    current: models.User = Depends(require_provider),
+    current: oauth2.Principal = Depends(require_provider),
     db: Session = Depends(get_db),
 ):
     row = (db.query(models.Availability)
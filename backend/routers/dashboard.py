@@ -0,0 +1,49 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.orm import Session
+
+import schemas, oauth2
+from database import get_db
+from utils import conditional, cache
+from routers.summary import compute_summary
+from routers.trends import compute_trends
+from routers.recent import compute_recent
+
+# PURPOSE : everything the dashboard page needs in ONE request
+#   (instead of summary + trends + recent = 3 round trips, 3 JWT decodes, 3 user lookups)
+
+router = APIRouter(prefix="/vitals", tags=["dashboard"])
+
+
+# GET /vitals/dashboard endpoint
+# Summary, trend points and recent entries, all read from the same transaction snapshot
+@router.get("/dashboard", response_model=schemas.DashboardResponse)
+def get_dashboard(
+    request: Request,
+    current_user: oauth2.Principal = Depends(oauth2.get_versioned_principal),
+    range: str = Query("7d", enum=["7d", "30d", "all"]),
+    limit: int = Query(10, ge=1, le=100),                       # number of recent entries
+    max_points: Optional[int] = Query(None, ge=20, le=10000),   # trend downsampling, same as /vitals/trends
+    db: Session = Depends(get_db),
+):
+    user_id = current_user.id
+
+    def build():
+        # close the transaction used by the auth lookup, then open a REPEATABLE READ one:
+        # all three reads below see one consistent snapshot, so a vital saved mid-request
+        # can't show up in the recent list but be missing from the summary
+        db.rollback()
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        try:
+            return {
+                "summary": compute_summary(db, user_id, range),
+                "points": compute_trends(db, user_id, range, max_points=max_points)["points"],
+                "items": compute_recent(db, user_id, limit)["items"],
+            }
+        finally:
+            db.rollback()  # read-only, just release the snapshot
+
+    # 304 straight away if nothing changed since the client's copy, then try the response cache
+    return conditional.conditional_json(request, current_user, lambda: cache.cached_json(
+        current_user, "dashboard", {"range": range, "limit": limit, "max_points": max_points}, build,
+    ))
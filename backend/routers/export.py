@@ -0,0 +1,144 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import List, Literal, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import BigInteger, cast, func, select
+
+import models, oauth2
+from database import SessionLocal
+from utils import columnar
+from utils.responses import dumps_lines
+
+# API router
+router = APIRouter(prefix="/vitals", tags=["export"])
+
+# rows fetched from the server-side cursor per round trip (= per chunk sent to the client)
+EXPORT_BATCH = 2000
+# Arrow / Parquet: bigger batches, each one becomes a record batch / Parquet row group
+COLUMNAR_BATCH = 50_000
+# patients per cohort export (one IN list, one long-running cursor)
+EXPORT_MAX_USERS = 1000
+
+# same names as schemas.VitalsCreate (+ id / created_at), so an export can be fed back to /vitals/bulk
+EXPORT_COLUMNS = ("id", "recorded_at", "systolic_bp", "diastolic_bp", "heart_rate",
+                  "temperature", "glucose", "notes", "created_at")
+ExportColumn = Literal["id", "user_id", "recorded_at", "systolic_bp", "diastolic_bp", "heart_rate",
+                       "temperature", "glucose", "notes", "created_at"]
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", **columnar.MEDIA_TYPES}
+
+
+# timestamps for the CSV are rendered by PostgreSQL, as text in the same ISO / UTC "Z" shape
+# as the JSON output (skips datetime parsing in the driver and isoformat() per cell);
+# for Arrow / Parquet they are sent as epoch microseconds, typed by utils/columnar.py
+_ISO_UTC = 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"'
+
+def _export_column(name: str, format: str):
+    c = getattr(models.Vital, name)
+    if name in columnar.TIMESTAMP_COLUMNS:
+        if format == "csv":
+            return func.to_char(func.timezone("UTC", c), _ISO_UTC).label(name)
+        if format in columnar.FORMATS:
+            return cast(func.extract("epoch", c) * 1_000_000, BigInteger).label(name)
+    return c
+
+def _export_select(user_ids: Sequence[int], columns: Sequence[str], format: str,
+                   start: Optional[datetime], end: Optional[datetime]):
+    V = models.Vital
+    stmt = (
+        select(*[_export_column(c, format) for c in columns])
+        .where(V.user_id.in_(user_ids) if len(user_ids) > 1 else V.user_id == user_ids[0])
+        .order_by(V.user_id, V.recorded_at, V.id)
+    )
+    if start is not None:
+        stmt = stmt.where(V.recorded_at >= start)
+    if end is not None:
+        stmt = stmt.where(V.recorded_at < end)
+    return stmt
+
+
+# helper functions : one batch of rows -> bytes
+def _csv_chunk(rows, columns) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue().encode()
+
+def _ndjson_chunk(rows, columns) -> bytes:
+    return dumps_lines(dict(zip(columns, row)) for row in rows)
+
+
+def stream_export(
+    user_ids: Sequence[int],
+    format: str,
+    columns: Sequence[str] = EXPORT_COLUMNS,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Generator of the export body, batch by batch.
+
+    Opens its own session: the request's get_db session is closed before a StreamingResponse
+    starts sending. stream_results makes psycopg2 use a server-side (named) cursor, so only
+    one batch of rows is held in memory at any time, whatever the size of the history.
+    """
+    batch = COLUMNAR_BATCH if format in columnar.FORMATS else EXPORT_BATCH
+    with SessionLocal() as db:
+        # Core execution on the session's connection: plain tuples, no ORM row processing
+        conn = db.connection().execution_options(stream_results=True, yield_per=batch)
+        result = conn.execute(_export_select(user_ids, columns, format, start, end))
+        partitions = result.partitions()
+
+        if format in columnar.FORMATS:
+            yield from columnar.stream(partitions, columns, format)
+            return
+
+        encode = _csv_chunk if format == "csv" else _ndjson_chunk
+        if format == "csv":
+            yield (",".join(columns) + "\n").encode()
+        for rows in partitions:
+            yield encode(rows, columns)
+
+
+# GET /vitals/export endpoint
+# Whole history (or a recorded_at window) as a CSV / NDJSON download, or Parquet / Arrow IPC
+# for analytics. Staff can export a cohort by passing user_ids (the user_id column is added).
+@router.get("/export")
+def export_vitals(
+    current_user: oauth2.Principal = Depends(oauth2.get_principal),
+    format: Literal["csv", "ndjson", "parquet", "arrow"] = Query("csv"),
+    columns: Optional[List[ExportColumn]] = Query(None, description="projection, default: all columns"),
+    user_ids: Optional[List[int]] = Query(None, description="staff only: cohort to export"),
+    start: Optional[datetime] = Query(None, description="recorded_at >= start"),
+    end: Optional[datetime] = Query(None, description="recorded_at < end"),
+):
+    if format in columnar.FORMATS and not columnar.available():
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=f"{format} export needs pyarrow installed on the server")
+
+    if user_ids:
+        if current_user.role != "staff":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Staff only")
+        user_ids = sorted(set(user_ids))
+        if len(user_ids) > EXPORT_MAX_USERS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"At most {EXPORT_MAX_USERS} user_ids per export")
+    else:
+        user_ids = [current_user.id]
+
+    # keep the requested columns in table order, always tag rows with the patient for a cohort
+    wanted = set(columns or EXPORT_COLUMNS)
+    if len(user_ids) > 1:
+        wanted.add("user_id")
+    cols = [c for c in ("user_id",) + EXPORT_COLUMNS if c in wanted]
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d")
+    who = current_user.id if user_ids == [current_user.id] else "cohort"
+    filename = f"vitals-{who}-{stamp}.{format}"
+    return StreamingResponse(
+        stream_export(user_ids, format, cols, start, end),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
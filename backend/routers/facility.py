@@ -11,7 +11,7 @@ router = APIRouter(prefix="/facilities", tags=["Facilities"])
 def list_facilities(db: Session = Depends(get_db)):
     return db.query(models.Facility).order_by(models.Facility.name.asc()).all()
 
-def require_staff(u: models.User = Depends(oauth2.get_current_user)):
+def require_staff(u: oauth2.Principal = Depends(oauth2.get_principal)):
     if getattr(u, "role", "patient") != "staff":
         raise HTTPException(status_code=403, detail="Staff only")
     return u
@@ -19,7 +19,7 @@ def require_staff(u: models.User = Depends(oauth2.get_current_user)):
 @router.post("/", response_model=schemas.FacilityOut, status_code=status.HTTP_201_CREATED)
 def create_facility(
     payload: schemas.FacilityCreate,
-    _staff: models.User = Depends(require_staff),  # require staff
+    _staff: oauth2.Principal = Depends(require_staff),  # require staff
     db: Session = Depends(get_db),
 ):
     row = models.Facility(**payload.model_dump())
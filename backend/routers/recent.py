@@ -1,44 +1,134 @@
-from fastapi import APIRouter, Depends, Query
+import base64
+import json
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import models, schemas, oauth2
-from database import get_db
+from database import get_async_db
+from utils import conditional
+from utils.responses import FastJSONResponse
 
 # API router
 router = APIRouter(prefix="/vitals", tags=["recent"])
 
+# only the columns a RecentEntry needs, selected as plain tuples (SQLAlchemy Core, no ORM entities)
+def _entry_select():
+    V = models.Vital
+    return select(V.id, V.recorded_at, V.systolic_bp, V.diastolic_bp, V.heart_rate, V.temperature, V.notes)
+
+# helper function : DB row -> dict shaped like schemas.RecentEntry
+def _entry(v) -> dict:
+    return {
+        "id": v.id,
+        "date": v.recorded_at,
+        "systolic": v.systolic_bp,
+        "diastolic": v.diastolic_bp,
+        "heart_rate": v.heart_rate,
+        "temperature": v.temperature,
+        "notes": v.notes,
+    }
+
+
+# helper functions : opaque history cursor <-> (recorded_at, id) position
+def _encode_cursor(v) -> str:
+    raw = json.dumps({"t": v.recorded_at.isoformat(), "i": v.id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _recent_stmt(user_id: int, limit: int):
+    # the latest 'limit' vitals for the specified user, ordered by recorded date (most recent first)
+    return (
+        _entry_select()
+        .where(models.Vital.user_id == user_id)
+        .order_by(models.Vital.recorded_at.desc())
+        .limit(limit)
+    )
+
+# Latest entries for a user (also reused by the combined dashboard endpoint)
+# Returns a plain dict shaped like schemas.RecentResponse, ready for FastJSONResponse.
+def compute_recent(db: Session, user_id: int, limit: int) -> dict:
+    rows = db.execute(_recent_stmt(user_id, limit)).all()
+
+    # return the recent entries, each converted straight into a dict
+    return {"items": [_entry(v) for v in rows]}
+
+
 # GET /vitals/recent endpoint
 # Returns the most recent vitals entries for a user
 @router.get("/recent", response_model=schemas.RecentResponse)
-def get_recent(
-    current_user: models.User = Depends(oauth2.get_current_user),
+async def get_recent(
+    request: Request,
+    current_user: oauth2.Principal = Depends(oauth2.get_versioned_principal_async),
     limit: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user_id = current_user.id
-
-     # Query the latest 'limit' vitals for the specified user, ordered by recorded date (most recent first)
-    rows = (
-        db.query(models.Vital)
-        .filter(models.Vital.user_id == user_id)
-        .order_by(models.Vital.recorded_at.desc())
-        .limit(limit)
-        .all()
+    return await conditional.conditional_json_async(
+        request, current_user, lambda: db.run_sync(compute_recent, current_user.id, limit)
     )
 
-      # Convert each database record into a RecentEntry schema object for the response
-    items = [
-        schemas.RecentEntry(
-            id=v.id,
-            date=v.recorded_at,
-            systolic=v.systolic_bp,
-            diastolic=v.diastolic_bp,
-            heart_rate=v.heart_rate,
-            temperature=v.temperature,
-            notes=v.notes,
-        )
-        for v in rows
-    ]
-
-    # return the recent entries wrapped in a RecentResponse schema
-    return schemas.RecentResponse(items=items)
+
+# GET /vitals/history endpoint
+# Keyset (cursor) pagination over the whole history, newest first.
+#   - position = (recorded_at, id), so every page is an index range scan of `limit` rows, at any depth (no OFFSET)
+#   - direction=older : rows before the cursor (default, "load more")
+#   - direction=newer : rows after the cursor (going back up)
+#   - start / end     : optional recorded_at bounds, [start, end)
+# Items are always returned newest first. next_cursor continues in the same direction
+# (None when there is nothing more), prev_cursor turns around.
+@router.get("/history", response_model=schemas.HistoryResponse)
+async def get_history(
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    direction: Literal["older", "newer"] = Query("older"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    V = models.Vital
+    position = tuple_(V.recorded_at, V.id)
+
+    q = _entry_select().where(V.user_id == current_user.id)
+    if start is not None:
+        q = q.where(V.recorded_at >= start)
+    if end is not None:
+        q = q.where(V.recorded_at < end)
+
+    if direction == "older":
+        if cursor:
+            q = q.where(position < tuple_(*_decode_cursor(cursor)))
+        q = q.order_by(V.recorded_at.desc(), V.id.desc())
+    else:
+        if cursor:
+            q = q.where(position > tuple_(*_decode_cursor(cursor)))
+        q = q.order_by(V.recorded_at.asc(), V.id.asc())
+
+    # one extra row tells us whether another page exists
+    rows = (await db.execute(q.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = _encode_cursor(rows[-1]) if has_more else None
+    prev_cursor = _encode_cursor(rows[0]) if rows and cursor else None
+
+    if direction == "newer":
+        rows.reverse()  # present newest first either way
+
+    return FastJSONResponse({
+        "items": [_entry(v) for v in rows],
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    })
@@ -1,10 +1,12 @@
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, Query
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, and_, or_, literal, union_all, cast, Integer
 
 import models, schemas, oauth2
-from database import get_db
+from database import get_async_db
+from utils import rollups, conditional, cache
 
 
 # the API router for vitals endpoints
@@ -18,26 +20,167 @@ def _date_window(range_param: str):
         return datetime.utcnow() - timedelta(days=30)
     return None  # all
 
-# Main endpoint: Returns a summary of the user's vitals over a selected time range
-@router.get("/summary", response_model=schemas.SummaryResponse)
-def get_summary(
-    current_user: models.User = Depends(oauth2.get_current_user),   # get user from auth token
-    range: str = Query("7d", enum=["7d", "30d", "all"]),            # time window for the summary display
-    db: Session = Depends(get_db),                                  # database session
-):
-    user_id = current_user.id
-    start = _date_window(range) # Determine the start date for filtering
-
-    #print("Generating summary for user:", user_id, "over range:", range)
-    # Query all vitals for this user (optionally filter by date window)
-    q = db.query(models.Vital).filter(models.Vital.user_id == user_id)
-    if start:
-        q = q.filter(models.Vital.recorded_at >= start)
-    vitals = q.all()
-
-    # If there are no vitals, return an empty summary response
-    if not vitals:
-        return schemas.SummaryResponse(
+
+# [Helper function] : build ONE aggregate statement for the whole summary
+#   - every stat is an AVG / MAX / COUNT(*) FILTER (...) over the same scan
+#   - the database does the math, so memory stays constant no matter how much history the user has
+def _summary_stmt(user_id: int, range_param: str, now: datetime):
+    V = models.Vital
+    start = _date_window(range_param)
+
+    # rows inside the selected window (range=all -> every row, no FILTER needed)
+    def in_window(agg, *extra):
+        conds = ([V.recorded_at >= start] if start else []) + list(extra)
+        return agg.filter(and_(*conds)) if conds else agg
+
+    # "flagged" = high blood pressure or fever (same rule as before)
+    flagged = or_(
+        V.systolic_bp >= models.FLAG_SYSTOLIC_BP,
+        V.temperature >= models.FLAG_TEMPERATURE,
+    )
+
+    week_start = now - timedelta(days=7)
+
+    columns = [
+        in_window(func.avg(V.systolic_bp)).label("avg_systolic"),
+        in_window(func.avg(V.diastolic_bp)).label("avg_diastolic"),
+        in_window(func.max(V.heart_rate)).label("max_hr"),
+        in_window(func.avg(V.temperature)).label("avg_temp"),
+        in_window(func.count()).label("entries"),
+        in_window(func.max(V.recorded_at)).label("last_entry_at"),
+        in_window(func.count(), flagged).label("flagged_entries"),
+        func.count().filter(V.recorded_at >= week_start).label("entries_this_week"),
+    ]
+
+    # Temperature trend: compare this window's average vs the previous window of the same size
+    window_days = {"7d": 7, "30d": 30}.get(range_param)
+    lower_bound = week_start if start is None else min(start, week_start)
+    if window_days:
+        prev_start = now - timedelta(days=2 * window_days)  # start of previous window
+        mid = now - timedelta(days=window_days)             # start of current window
+        columns += [
+            func.avg(V.temperature).filter(V.recorded_at >= prev_start, V.recorded_at < mid).label("prev_temp"),
+            func.avg(V.temperature).filter(V.recorded_at >= mid).label("curr_temp"),
+        ]
+        lower_bound = min(lower_bound, prev_start)
+
+    stmt = select(*columns).where(V.user_id == user_id)
+
+    # only scan what any of the FILTERs can use (range=all has to scan everything anyway)
+    if start is not None:
+        stmt = stmt.where(V.recorded_at >= lower_bound)
+    return stmt
+
+
+# ---------------------------------------------------------------
+# Rollup-backed summary (30d / all)
+#   A span [lo, hi) is split into whole UTC days, read from vital_daily_rollups,
+#   plus the partial days at both edges, read from raw vitals.
+#   Every piece produces the same columns, so one UNION ALL + outer aggregate
+#   still answers the whole summary in a single statement.
+# ---------------------------------------------------------------
+
+def _raw_part(user_id: int, label: str, lo, hi):
+    V = models.Vital
+    stmt = select(
+        literal(label).label("part"),
+        func.count().label("entries"),
+        func.count(V.systolic_bp).label("sys_n"), func.sum(V.systolic_bp).label("sys_sum"),
+        func.count(V.diastolic_bp).label("dia_n"), func.sum(V.diastolic_bp).label("dia_sum"),
+        func.max(V.heart_rate).label("hr_max"),
+        func.count(V.temperature).label("temp_n"), func.sum(V.temperature).label("temp_sum"),
+        func.count().filter(or_(
+            V.systolic_bp >= models.FLAG_SYSTOLIC_BP,
+            V.temperature >= models.FLAG_TEMPERATURE,
+        )).label("flagged"),
+        func.max(V.recorded_at).label("last_at"),
+    ).where(V.user_id == user_id)
+    if lo is not None:
+        stmt = stmt.where(V.recorded_at >= lo)
+    if hi is not None:
+        stmt = stmt.where(V.recorded_at < hi)
+    return stmt
+
+
+def _rollup_part(user_id: int, label: str, day_lo, day_hi):
+    R = models.VitalDailyRollup
+    stmt = select(
+        literal(label).label("part"),
+        func.sum(R.entries).label("entries"),
+        func.sum(R.systolic_bp_count).label("sys_n"), func.sum(R.systolic_bp_sum).label("sys_sum"),
+        func.sum(R.diastolic_bp_count).label("dia_n"), func.sum(R.diastolic_bp_sum).label("dia_sum"),
+        func.max(R.heart_rate_max).label("hr_max"),
+        func.sum(R.temperature_count).label("temp_n"), func.sum(R.temperature_sum).label("temp_sum"),
+        func.sum(R.flagged_entries).label("flagged"),
+        func.max(R.last_recorded_at).label("last_at"),
+    ).where(R.user_id == user_id)
+    if day_lo is not None:
+        stmt = stmt.where(R.day >= day_lo)
+    if day_hi is not None:
+        stmt = stmt.where(R.day < day_hi)
+    return stmt
+
+
+def _span_parts(user_id: int, label: str, lo, hi):
+    """[lo, hi) -> raw head + rollup days + raw tail (None = unbounded on that side)"""
+    day_lo = None
+    if lo is not None:
+        day_lo = rollups.day_of(lo)
+        if rollups.day_start(day_lo) < lo:
+            day_lo += timedelta(days=1)   # lo is mid-day: that day is only partially covered
+    day_hi = rollups.day_of(hi) if hi is not None else None
+
+    # span shorter than a whole day -> raw only
+    if day_lo is not None and day_hi is not None and day_lo >= day_hi:
+        return [_raw_part(user_id, label, lo, hi)]
+
+    parts = []
+    if lo is not None and rollups.day_start(day_lo) > lo:
+        parts.append(_raw_part(user_id, label, lo, rollups.day_start(day_lo)))
+    parts.append(_rollup_part(user_id, label, day_lo, day_hi))
+    if hi is not None and rollups.day_start(day_hi) < hi:
+        parts.append(_raw_part(user_id, label, rollups.day_start(day_hi), hi))
+    return parts
+
+
+def _rollup_summary_stmt(user_id: int, range_param: str, now: datetime):
+    now = now.replace(tzinfo=timezone.utc)
+    window_days = {"7d": 7, "30d": 30}.get(range_param)
+    start = now - timedelta(days=window_days) if window_days else None
+
+    parts = _span_parts(user_id, "curr", start, None)
+    if window_days:
+        parts += _span_parts(user_id, "prev", now - timedelta(days=2 * window_days), start)
+    parts.append(_raw_part(user_id, "week", now - timedelta(days=7), None))
+
+    p = union_all(*parts).subquery()
+    curr, prev, week = p.c.part == "curr", p.c.part == "prev", p.c.part == "week"
+
+    def ratio(total, count, where):
+        return func.sum(total).filter(where) / func.nullif(func.sum(count).filter(where), 0)
+
+    def total(col, where):
+        return cast(func.coalesce(func.sum(col).filter(where), 0), Integer)
+
+    return select(
+        ratio(p.c.sys_sum, p.c.sys_n, curr).label("avg_systolic"),
+        ratio(p.c.dia_sum, p.c.dia_n, curr).label("avg_diastolic"),
+        func.max(p.c.hr_max).filter(curr).label("max_hr"),
+        ratio(p.c.temp_sum, p.c.temp_n, curr).label("avg_temp"),
+        total(p.c.entries, curr).label("entries"),
+        func.max(p.c.last_at).filter(curr).label("last_entry_at"),
+        total(p.c.flagged, curr).label("flagged_entries"),
+        total(p.c.entries, week).label("entries_this_week"),
+        ratio(p.c.temp_sum, p.c.temp_n, prev).label("prev_temp"),
+        ratio(p.c.temp_sum, p.c.temp_n, curr).label("curr_temp"),
+    )
+
+
+# [Helper function] : turn the single aggregate row into a dict shaped like schemas.SummaryResponse
+def _summary_from_row(row) -> dict:
+    # If there are no vitals in the window, return an empty summary response
+    if not row.entries:
+        return dict(
             avg_bp=None,
             max_hr=None,
             avg_temp=None,
@@ -47,86 +190,53 @@ def get_summary(
             flagged_entries=0,
         )
 
-    # --- Compute averages and summary stats ---
-    systolics = [v.systolic_bp for v in vitals if v.systolic_bp is not None]
-    diastolics = [v.diastolic_bp for v in vitals if v.diastolic_bp is not None]
-    heart_rates = [v.heart_rate for v in vitals if v.heart_rate is not None]
-    temperatures = [v.temperature for v in vitals if v.temperature is not None]
-
     # Calculate average blood pressure, if enough data
     avg_bp = None
-    if systolics and diastolics:
-        avg_bp = schemas.AvgBP(
-            systolic=round(sum(systolics) / len(systolics), 1),
-            diastolic=round(sum(diastolics) / len(diastolics), 1),
+    if row.avg_systolic is not None and row.avg_diastolic is not None:
+        avg_bp = dict(
+            systolic=round(float(row.avg_systolic), 1),
+            diastolic=round(float(row.avg_diastolic), 1),
         )
-    
-    # Maximum heart rate and average temperature
-    max_hr = max(heart_rates) if heart_rates else None
-    avg_temp = round(sum(temperatures) / len(temperatures), 1) if temperatures else None
-
-    # --- Temperature trend calculation ---
-    # Compares average temperature in this window vs previous window of same size
-    temp_trend = None
-    if range in ["7d", "30d"] and temperatures:
-        window_days = 7 if range == "7d" else 30
-        now = datetime.utcnow()
-        prev_start = now - timedelta(days=2 * window_days)  # start of previous window
-        mid = now - timedelta(days=window_days)             # start of current window
 
-        # previous window query
-        prev_q = db.query(models.Vital).filter(
-            models.Vital.user_id == user_id,
-            models.Vital.recorded_at >= prev_start,
-            models.Vital.recorded_at < mid,
-            models.Vital.temperature.isnot(None),
-        )
+    avg_temp = round(float(row.avg_temp), 1) if row.avg_temp is not None else None
 
-        # Current window query
-        curr_q = db.query(models.Vital).filter(
-            models.Vital.user_id == user_id,
-            models.Vital.recorded_at >= mid,
-            models.Vital.temperature.isnot(None),
-        )
+    # Compare the two window averages to set the trend
+    temp_trend = None
+    prev_temp = getattr(row, "prev_temp", None)
+    curr_temp = getattr(row, "curr_temp", None)
+    if avg_temp is not None and prev_temp is not None and curr_temp is not None:
+        temp_trend = "up" if curr_temp > prev_temp else "down"
 
-        # List of previous and current window temperature values
-        prev_vals = [v.temperature for v in prev_q.all()]
-        curr_vals = [v.temperature for v in curr_q.all()]
-
-        # Compare the two averages to set the trend
-        if prev_vals and curr_vals:
-            if sum(curr_vals) / len(curr_vals) > sum(prev_vals) / len(prev_vals):
-                temp_trend = "up"
-            else:
-                temp_trend = "down"
-
-      # --- Entries in the last week ---
-    week_start = datetime.utcnow() - timedelta(days=7)
-    entries_this_week = (
-        db.query(models.Vital)
-        .filter(models.Vital.user_id == user_id, models.Vital.recorded_at >= week_start)
-        .count()
+    return dict(
+        avg_bp=avg_bp,
+        max_hr=row.max_hr,
+        avg_temp=avg_temp,
+        temp_trend=temp_trend,
+        entries_this_week=row.entries_this_week,
+        last_entry_at=row.last_entry_at,
+        flagged_entries=row.flagged_entries,
     )
 
-    # --- Find the date/time of the latest entry ---
-    last_entry_at = max(v.recorded_at for v in vitals)
 
-    # --- Count "flagged" entries (e.g., high blood pressure or fever) ---
-    flagged_entries = sum(
-        1 for v in vitals if
-        (v.systolic_bp is not None and v.systolic_bp >= 140) or
-        (v.temperature is not None and v.temperature >= 100.4)
-    )
+# Compute the summary for a user in a single round trip (also reused by other routers)
+#   7d      -> straight aggregate over the raw vitals (small window, the index is enough)
+#   30d/all -> daily rollups + raw edges, O(days) instead of O(readings)
+def compute_summary(db: Session, user_id: int, range_param: str) -> dict:
+    build = _summary_stmt if range_param == "7d" else _rollup_summary_stmt
+    row = db.execute(build(user_id, range_param, datetime.utcnow())).one()
+    return _summary_from_row(row)
 
-    # --- Return summary as a Pydantic response object ---
-    
 
-    return schemas.SummaryResponse(
-        avg_bp=avg_bp,
-        max_hr=max_hr,
-        avg_temp=avg_temp,
-        temp_trend=temp_trend,
-        entries_this_week=entries_this_week,
-        last_entry_at=last_entry_at,
-        flagged_entries=flagged_entries,
-    )
+# Main endpoint: Returns a summary of the user's vitals over a selected time range
+# (async: the aggregate runs through the AsyncSession, compute_summary is reused via run_sync)
+@router.get("/summary", response_model=schemas.SummaryResponse)
+async def get_summary(
+    request: Request,
+    current_user: oauth2.Principal = Depends(oauth2.get_versioned_principal_async),  # user from auth token (+ vitals_version)
+    range: str = Query("7d", enum=["7d", "30d", "all"]),                             # time window for the summary display
+    db: AsyncSession = Depends(get_async_db),                                        # database session
+):
+    return await conditional.conditional_json_async(request, current_user, lambda: cache.cached_json_async(
+        current_user, "summary", {"range": range},
+        lambda: db.run_sync(compute_summary, current_user.id, range),
+    ))
@@ -1,15 +1,31 @@
+from collections import namedtuple
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, Query
+from typing import List, Literal, Optional, Sequence
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import numpy as np
 
 import models, schemas, oauth2
-from database import get_db
+from database import get_async_db
+from utils import rollups, downsample, rolling, conditional, cache
 
 # PURPOSE : Returns a time series of all points for the frontend to plot trends.
 
 # API router for /vitals endpoints, tagged "trends"
 router = APIRouter(prefix="/vitals", tags=["trends"])
 
+# trend metric name -> Vital column
+METRIC_COLUMNS = {
+    "systolic": "systolic_bp",
+    "diastolic": "diastolic_bp",
+    "heart_rate": "heart_rate",
+    "temperature": "temperature",
+    "glucose": "glucose",
+}
+
 # helper function : returns the start data for a given range (7d, 30d, or all)
 def _date_window(range_param: str):
     if range_param == "7d":
@@ -18,54 +34,193 @@ def _date_window(range_param: str):
         return datetime.utcnow() - timedelta(days=30)
     return None  # If 'all', return None to not filter by date
 
+# columns the chart needs, in this order (no notes / created_at / ORM bookkeeping)
+_TREND_COLUMNS = ("recorded_at",) + tuple(METRIC_COLUMNS.values())
+_DailyRow = namedtuple("_DailyRow", _TREND_COLUMNS)
+
+# helper function : one point per day, read from the daily rollup table (O(days) rows)
+def _daily_rows(db: Session, user_id: int, start):
+    R = models.VitalDailyRollup
+    cols = [R.day]
+    for col in METRIC_COLUMNS.values():
+        cols += [getattr(R, f"{col}_sum"), getattr(R, f"{col}_count")]
+    stmt = select(*cols).where(R.user_id == user_id).order_by(R.day.asc())
+    if start:
+        stmt = stmt.where(R.day >= rollups.day_of(start))
+
+    def avg(total, count, as_int):
+        if not count:
+            return None
+        value = total / count
+        return round(value) if as_int else round(value, 1)
+
+    # shape each day like a raw reading so the point-building code below stays the same
+    int_cols = {"systolic_bp", "diastolic_bp", "heart_rate"}
+    out = []
+    for r in db.execute(stmt):
+        values = [avg(r[1 + 2 * i], r[2 + 2 * i], col in int_cols) for i, col in enumerate(METRIC_COLUMNS.values())]
+        out.append(_DailyRow(rollups.day_start(r[0]), *values))
+    return out
+
+# helper function : raw readings as plain tuples, oldest first (SQLAlchemy Core, no ORM entities)
+def _raw_stmt(user_id: int, start):
+    V = models.Vital
+    stmt = (
+        select(*[getattr(V, c) for c in _TREND_COLUMNS])
+        .where(V.user_id == user_id)
+        .order_by(V.recorded_at.asc())
+    )
+    # If start is set, only include records on or after that date
+    if start:
+        stmt = stmt.where(V.recorded_at >= start)
+    return stmt
+
+def _raw_rows(db: Session, user_id: int, start):
+    return db.execute(_raw_stmt(user_id, start)).all()
+
+# helper function : float array -> list with one decimal, NaN -> None
+def _floats(arr: np.ndarray) -> list:
+    return [None if x != x else round(x, 1) for x in arr.tolist()]
+
+
+# helper function : the rows a trend series is built from (the only part that touches the database)
+def _trend_rows(db: Session, user_id: int, range_param: str, granularity: str = "auto"):
+    start = _date_window(range_param)
+
+    if granularity == "auto":
+        granularity = "raw" if range_param == "7d" else "daily"
+
+    return _daily_rows(db, user_id, start) if granularity == "daily" else _raw_rows(db, user_id, start)
+
+
+# helper function : rows -> trend payload (NumPy rolling stats + LTTB, CPU only)
+def _trend_points(
+    rows,
+    max_points: Optional[int] = None,
+    stats: Sequence[str] = (),
+    window: str = "7",
+    metrics: Sequence[str] = tuple(METRIC_COLUMNS),
+) -> dict:
+    # Pull each column out once; metrics become NumPy arrays (NaN = not recorded)
+    columns = list(zip(*rows)) if rows else [()] * len(_TREND_COLUMNS)
+    times = np.array([d.timestamp() for d in columns[0]], dtype=float)
+    series = {name: rolling.to_array(columns[i + 1]) for i, name in enumerate(METRIC_COLUMNS)}
+
+    # 7-point rolling systolic avg (kept for the existing chart), over the FULL series
+    systolic_roll7 = rolling.rolling_stats(times, series["systolic"], ("mean",), points=7)["mean"]
+
+    # Requested rolling stats for the requested metrics, one vectorized pass per metric
+    rolled = {}
+    if stats:
+        try:
+            points_w, seconds_w = rolling.parse_window(window)
+            rolled = {
+                name: rolling.rolling_stats(times, series[name], stats, points=points_w, seconds=seconds_w)
+                for name in dict.fromkeys(metrics)
+            }
+        except ValueError as e:  # window too long / median over too many readings
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # Optionally keep at most max_points rows (LTTB per series, spikes survive)
+    keep = downsample.downsample_rows(
+        rows,
+        x_of=lambda v: v.recorded_at.timestamp(),
+        series={
+            "systolic": lambda v: v.systolic_bp,
+            "diastolic": lambda v: v.diastolic_bp,
+            "heart_rate": lambda v: v.heart_rate,
+            "temperature": lambda v: v.temperature,
+            "glucose": lambda v: v.glucose,
+        },
+        max_points=max_points,
+    )
+
+    # Serialize the kept rows straight into dicts (no Pydantic object per point)
+    roll7 = _floats(systolic_roll7[keep])
+    rolled_lists = {
+        name: {stat: _floats(arr[keep]) for stat, arr in by_stat.items()}
+        for name, by_stat in rolled.items()
+    }
+    points = []
+    for n, i in enumerate(keep):
+        recorded_at, systolic, diastolic, heart_rate, temperature, glucose = rows[i]
+        points.append({
+            "date": recorded_at,
+            "systolic": systolic,
+            "diastolic": diastolic,
+            "heart_rate": heart_rate,
+            "temperature": temperature,
+            "glucose": glucose,
+            "systolic_roll7": roll7[n],
+            "rolling": {
+                name: {stat: values[n] for stat, values in by_stat.items()}
+                for name, by_stat in rolled_lists.items()
+            } or None,
+        })
+
+    # Return all computed points (ready for charting in frontend)
+    return {"points": points}
+
+
+# Build the trend series for a user (also reused by the combined dashboard endpoint)
+# Returns a plain dict shaped like schemas.TrendsResponse, ready for FastJSONResponse.
+def compute_trends(
+    db: Session,
+    user_id: int,
+    range_param: str,
+    granularity: str = "auto",
+    max_points: Optional[int] = None,
+    stats: Sequence[str] = (),
+    window: str = "7",
+    metrics: Sequence[str] = tuple(METRIC_COLUMNS),
+) -> dict:
+    rows = _trend_rows(db, user_id, range_param, granularity)
+    return _trend_points(rows, max_points, stats, window, metrics)
+
+
+# async version for the endpoint: rows through the AsyncSession, then the NumPy work in the
+# threadpool (a range=all raw series can take a while, it must not stall the event loop)
+async def compute_trends_async(
+    db: AsyncSession,
+    user_id: int,
+    range_param: str,
+    granularity: str = "auto",
+    max_points: Optional[int] = None,
+    stats: Sequence[str] = (),
+    window: str = "7",
+    metrics: Sequence[str] = tuple(METRIC_COLUMNS),
+) -> dict:
+    rows = await db.run_sync(_trend_rows, user_id, range_param, granularity)
+    return await run_in_threadpool(_trend_points, rows, max_points, stats, window, metrics)
+
+
 # GET /vitals/trends endpoint
 # Returns vitals trend data (time series) for a user
+#   granularity=raw   -> one point per reading
+#   granularity=daily -> one point per day (daily averages from the rollup table)
+#   granularity=auto  -> raw for 7d, daily for 30d / all
+#   max_points        -> downsample (LTTB) to at most this many points, e.g. the chart width in px
+#   stats / window / metrics -> rolling mean / median / std per metric, e.g.
+#       ?stats=mean&stats=std&window=7d&metrics=systolic&metrics=heart_rate
 @router.get("/trends", response_model=schemas.TrendsResponse)
-def get_trends(
-    current_user: models.User = Depends(oauth2.get_current_user),
+async def get_trends(
+    request: Request,
+    current_user: oauth2.Principal = Depends(oauth2.get_versioned_principal_async),
     range: str = Query("7d", enum=["7d", "30d", "all"]),
-    db: Session = Depends(get_db),
+    granularity: str = Query("auto", enum=["auto", "raw", "daily"]),
+    max_points: Optional[int] = Query(None, ge=20, le=10000),   # cap for chart payload size (None = every point)
+    stats: List[Literal["mean", "median", "std"]] = Query([]),  # rolling stats to add to each point
+    window: str = Query("7", pattern=r"^\d+[dh]?$"),             # "7" = last 7 readings, "7d" / "12h" = time window
+    metrics: List[Literal["systolic", "diastolic", "heart_rate", "temperature", "glucose"]] = Query(
+        ["systolic", "diastolic", "heart_rate", "temperature", "glucose"]
+    ),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    
-    user_id = current_user.id
-    start = _date_window(range)
-
-    # Build query: get all vitals for the user, sorted by date ascending
-    q = (
-        db.query(models.Vital)
-        .filter(models.Vital.user_id == user_id)
-        .order_by(models.Vital.recorded_at.asc())
-    )
-
-    # If start is set, only include records on or after that date
-    if start:
-        q = q.filter(models.Vital.recorded_at >= start)
-
-    rows = q.all()
-
-    # Build points + 7-point rolling systolic avg
-    points = [] # list to store output points
-    window = [] # rolling window for calculating average
-    for v in rows:
-        # update rolling window for systolic BP
-        if v.systolic_bp is not None:
-            window.append(v.systolic_bp)
-            if len(window) > 7:
-                window.pop(0)
-            systolic_roll7 = sum(window) / len(window)
-        else:
-            systolic_roll7 = None
-
-        # Create and append the TrendPoint for this record
-        points.append(
-            schemas.TrendPoint(
-                date=v.recorded_at,
-                systolic=v.systolic_bp,
-                diastolic=v.diastolic_bp,
-                heart_rate=v.heart_rate,
-                temperature=v.temperature,
-                systolic_roll7=round(systolic_roll7, 1) if systolic_roll7 else None,
-            )
-        )
-    # Return all computed points as a TrendsResponse (ready for charting in frontend)
-    return schemas.TrendsResponse(points=points)
+    params = {
+        "range": range, "granularity": granularity, "max_points": max_points,
+        "stats": ",".join(stats), "window": window, "metrics": ",".join(metrics),
+    }
+    return await conditional.conditional_json_async(request, current_user, lambda: cache.cached_json_async(
+        current_user, "trends", params,
+        lambda: compute_trends_async(db, current_user.id, range, granularity, max_points, stats, window, metrics),
+    ))
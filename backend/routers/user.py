@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 import models, schemas, oauth2
 
@@ -8,10 +11,11 @@ from utils import hasing
 
 
 
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
-from typing import List
+from database import get_async_db
+from utils.responses import FastJSONResponse
 
 
 router = APIRouter(
@@ -25,16 +29,75 @@ router = APIRouter(
 def read_me(current_user: models.User = Depends(oauth2.get_current_user)):
     return current_user
 
-@router.get("/", response_model=List[schemas.UserOut])  #get all users
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
-    return users
+# helper functions : opaque directory cursor <-> username of the last row (usernames are unique)
+def _encode_cursor(username: str) -> str:
+    return base64.urlsafe_b64encode(username.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def _like_pattern(q: str, match: str) -> str:
+    # backslash is PostgreSQL's default LIKE escape character
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%" if match == "prefix" else "%" + escaped + "%"
+
+# one directory page (+1 row to know if there is a next one), also checked by utils/explain.py
+def _directory_stmt(q: Optional[str], match: str, role: Optional[str], after: Optional[str], limit: int):
+    U = models.User
+    stmt = select(U.id, U.email, U.username, U.role, U.created_at)
+    if q:
+        pattern = _like_pattern(q, match)
+        stmt = stmt.where(or_(U.username.ilike(pattern), U.email.ilike(pattern)))
+    if role:
+        stmt = stmt.where(U.role == role)
+    if after is not None:
+        stmt = stmt.where(U.username > after)
+    return stmt.order_by(U.username).limit(limit + 1)
+
+
+# User directory, keyset paginated in username order (every page is `limit` rows, at any depth)
+#   - q     : case-insensitive search in username and email, prefix ("ali%") or substring ("%ali%"),
+#             served by the trigram indexes (migrations/0004)
+#   - role  : only this role (served by the (role, username) index)
+# Staff and providers see every account; patients only find providers (to book appointments).
+@router.get("/", response_model=schemas.UserDirectoryPage)
+async def get_users(
+    q: Optional[str] = Query(None, min_length=1, max_length=100),
+    match: Literal["substring", "prefix"] = Query("substring"),
+    role: Optional[Literal["patient", "provider", "staff"]] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=100),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if current_user.role == "patient":
+        if role not in (None, "provider"):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Patients can only list providers")
+        role = "provider"
+
+    after = _decode_cursor(cursor) if cursor else None
+    rows = (await db.execute(_directory_stmt(q, match, role, after, limit))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return FastJSONResponse({
+        "items": [row._asdict() for row in rows],
+        "next_cursor": _encode_cursor(rows[-1].username) if has_more else None,
+    })
 
 
 @router.get("/{id}", response_model=schemas.UserOut)  #get a user by id
-def get_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
-    if user is None:
+async def get_user(
+    id: int,
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.get(models.User, id)
+    # same rule as the directory: patients only see providers (and themselves); anything else
+    # answers like a missing id, so ids can't be probed
+    if user is None or (current_user.role == "patient" and user.role != "provider" and user.id != current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with id {id} not found"
@@ -44,13 +107,13 @@ def get_user(id: int, db: Session = Depends(get_db)):
 
 #create a new user
 @router.post("/", response_model=schemas.UserOut, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     #print("here!")
     #hashing the password
-    if db.query(models.User).filter(models.User.email == user.email).first():
+    if (await db.execute(select(models.User.id).where(models.User.email == user.email))).first():
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = hasing.hash_password(user.password)  #hash the password using bcrypt
+    hashed_password = await hasing.hash_password_async(user.password)  #hash the password using bcrypt (hashing process pool)
     user.password = hashed_password 
     
     #new_user = models.User(**user.dict())
@@ -61,8 +124,8 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         role=user.role  
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
@@ -3,14 +3,16 @@ from __future__ import annotations
 
 import os
 import json
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from database import get_db
 import models
+from utils import schedule
 
 router = APIRouter(prefix="/vapi", tags=["Vapi"])
 
@@ -180,6 +182,24 @@ async def vapi_tool_calls(
                 } for r in rows]
                 ok({"slots": slots})
 
+            # --------------------------
+            # list_free_slots
+            # --------------------------
+            elif name == "list_free_slots":
+                if "provider_id" not in args:
+                    err("provider_id is required"); continue
+                provider_id = int(args["provider_id"])
+                start_from = _parse_iso(args["start_from"]) if args.get("start_from") else datetime.now(timezone.utc)
+                until = _parse_iso(args["until"]) if args.get("until") else start_from + timedelta(days=14)
+                if until <= start_from:
+                    err("until must be after start_from"); continue
+                if until - start_from > timedelta(days=62):
+                    err("at most 62 days at a time"); continue
+
+                slots = schedule.free_slots(db, provider_id, start_from, until)
+                ok({"provider_id": provider_id,
+                    "free": [{"start_at": _iso(s), "end_at": _iso(e)} for s, e in slots]})
+
             # --------------------------
             # create_appointment
             # --------------------------
@@ -210,13 +230,8 @@ async def vapi_tool_calls(
                 if visit_type == models.VisitType.telehealth and facility_id is not None:
                     err("telehealth must not include facility_id"); continue
 
-                conflict = db.query(models.Appointment).filter(
-                    models.Appointment.provider_id == provider_id,
-                    models.Appointment.start_at < end_at,
-                    models.Appointment.end_at > start_at,
-                    models.Appointment.status == models.ApptStatus.confirmed,
-                ).first()
-                if conflict:
+                if schedule.has_overlap(db, provider_id, start_at, end_at,
+                                        statuses=[models.ApptStatus.confirmed]):
                     err("Time slot not available", 409); continue
 
                 appt = models.Appointment(
@@ -274,7 +289,14 @@ async def vapi_tool_calls(
 
                 for k, v in data.items():
                     setattr(appt, k, v)
-                db.commit(); db.refresh(appt)
+                try:
+                    db.commit()
+                except IntegrityError as e:
+                    db.rollback()
+                    if not schedule.is_overlap_violation(e):
+                        raise
+                    err("Time slot not available", 409); continue
+                db.refresh(appt)
 
                 ok({
                     "appointment_id": appt.id,
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, status, Response, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_async_db
 import models, schemas, oauth2
 from datetime import datetime
+from typing import Optional
+from utils import rollups, conditional, cache, ingest
 
 
 # API router for all vitals endpoint
@@ -16,10 +21,10 @@ router = APIRouter(
 # Create a new vital entry
 # -----------------------------
 @router.post("/", response_model=schemas.VitalsOut)
-def create_vital(
+async def create_vital(
     vital: schemas.VitalsCreate,    # the vitals data sent from the frontend (validate by Pydantic schema)
-    current_user: models.User = Depends(oauth2.get_current_user),  # the ID of the user for whome the vital is being recoding
-    db: Session = Depends(get_db)   # SQLAlchemy session dependency (injected automatically)
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),  # the ID of the user for whome the vital is being recoding
+    db: AsyncSession = Depends(get_async_db)   # async SQLAlchemy session dependency (injected automatically)
 ):
     # create the instance for vital to add into the database later
     # instance will all relevant fields
@@ -37,27 +42,66 @@ def create_vital(
     )
 
     db.add(db_vital)        # add new obj to the database session
-    db.commit()             # commit the command
-    db.refresh(db_vital)    # refresh the database / update
+    await db.flush()        # write the row first, then fold it into the rollup
+    # the rollup / version helpers are plain Session code: run_sync runs them on this
+    # session's connection, in the same transaction
+    await db.run_sync(rollups.record_insert, db_vital)   # keep the daily rollup in the same transaction
+    await db.run_sync(conditional.bump_version, current_user.id)  # cached summary / trends / recent are now stale
+    await db.commit()       # commit the command
+    await cache.invalidate_user_async(current_user.id)  # drop cached summary / trends of this user
+    await db.refresh(db_vital)    # refresh the database / update
     return db_vital         # return the object/instance
 
+# -----------------------------
+# Bulk import (device history, spreadsheet)
+# -----------------------------
+@router.post("/bulk", response_model=schemas.BulkVitalsResult)
+async def bulk_create_vitals(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson|csv)$"),  # overrides the Content-Type
+    current_user: oauth2.Principal = Depends(oauth2.get_principal),
+    db: Session = Depends(get_db),
+):
+    """
+    Body: a JSON array, NDJSON (application/x-ndjson) or CSV (text/csv, header row with the
+    VitalsCreate field names), raw or as a multipart `file` upload.
+    Valid rows are inserted, invalid ones are reported by row number.
+    At most UPLOAD_MAX_BYTES (413) and INGEST_MAX_ROWS rows (400) per upload. Rows are committed
+    in chunks: on a database error the 500 detail says how many were stored and `stopped_at_row`,
+    the first row that wasn't (send the rest again from there).
+    """
+    body, fmt = await ingest.read_upload(request, format)
+
+    # parsing, validation and COPY are blocking, keep them off the event loop
+    # (COPY needs psycopg2, so this endpoint keeps the sync session)
+    user_id = current_user.id
+    try:
+        return await run_in_threadpool(ingest.ingest, db, user_id, ingest.parse_records(body, fmt))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ingest.IngestAborted as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"message": "Database error, import stopped", **e.result},
+        )
+
 # -----------------------------
 # Update an existing vital entry
 # -----------------------------
 @router.put("/{vital_id}", response_model=schemas.VitalsOut)
-def update_vital(
+async def update_vital(
     vital_id: int,
-    current_user: models.User = Depends(oauth2.get_current_user),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
     payload: schemas.VitalUpdate = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):  
     
     user_id = current_user.id
     # Fetch the target vital entry by ID from the database
-    v = db.query(models.Vital).filter(
+    v = (await db.execute(select(models.Vital).where(
         models.Vital.id == vital_id,
         models.Vital.user_id == user_id  # ensure the user owns this entry
-        ).first()
+        ))).scalar_one_or_none()
 
     # If not found or the user doesn't own this entry, raise 404
     if not v:
@@ -67,32 +111,42 @@ def update_vital(
     updates = payload.model_dump(exclude_unset=True)
     allowed = {"recorded_at","systolic_bp","diastolic_bp","heart_rate","temperature","glucose","notes"}
     
+    old_day = rollups.day_of(v.recorded_at)  # the reading may move to another day
     for field, value in updates.items():
         if field in allowed:
             setattr(v, field, value)
 
-    db.commit()
-    db.refresh(v)
+    await db.flush()
+    await db.run_sync(rollups.refresh_days, user_id, {old_day, rollups.day_of(v.recorded_at)})
+    await db.run_sync(conditional.bump_version, user_id)
+    await db.commit()
+    await cache.invalidate_user_async(user_id)
+    await db.refresh(v)
     return v
 
 # -----------------------------
 # Delete an existing vital entry
 # -----------------------------
 @router.delete("/{vital_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_vital(
+async def delete_vital(
     vital_id: int,
-    current_user: models.User = Depends(oauth2.get_current_user),
-    db: Session = Depends(get_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_principal_async),
+    db: AsyncSession = Depends(get_async_db),
 ):
     user_id = current_user.id
-    v = db.query(models.Vital).filter(
+    v = (await db.execute(select(models.Vital).where(
         models.Vital.id == vital_id,
         models.Vital.user_id == user_id
-    ).first()
+    ))).scalar_one_or_none()
 
     if not v:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vital not found")
 
-    db.delete(v)
-    db.commit()
+    day = rollups.day_of(v.recorded_at)
+    await db.delete(v)
+    await db.flush()
+    await db.run_sync(rollups.refresh_days, user_id, {day})
+    await db.run_sync(conditional.bump_version, user_id)
+    await db.commit()
+    await cache.invalidate_user_async(user_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr, conint, BaseModel, ConfigDict, field_validator
 from datetime import datetime
 
-from typing import Optional, List, Literal
+from typing import Optional, List, Literal, Dict
 
 
 # --------------------------
@@ -19,6 +19,12 @@ class UserCreate(BaseModel):
     password: str                 # plain here; hash in service layer
     role: Literal["user", "patient", "provider", "admin"]
 
+class UserProvision(BaseModel):   # one row of POST /admin/users/bulk
+    email: EmailStr
+    username: str
+    password: str
+    role: Literal["patient", "provider"] = "patient"
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -33,6 +39,10 @@ class UserOut(BaseModel):
     class Config:
         orm_mode = True
 
+class UserDirectoryPage(BaseModel):   # GET /users/
+    items: List[UserOut]                 # username order
+    next_cursor: Optional[str] = None    # None = last page
+
 
 # == TOKEN SCHEMAS ==
 class Token(BaseModel):
@@ -41,6 +51,10 @@ class Token(BaseModel):
     email: EmailStr
     username: str
     role: str
+    refresh_token: Optional[str] = None  # exchange at /token/refresh for a new access token
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     id: Optional[int] | None = None  #id can be None if not provided, using union type for optional id
@@ -64,6 +78,33 @@ class VitalsCreate(VitalsBase):
 class VitalUpdate(VitalsBase):
     pass
 
+class BulkRowError(BaseModel):
+    row: int                 # 1-based record / CSV data line number
+    errors: List[str]
+
+class BulkVitalsResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkRowError] = []   # first 1000 rejected rows
+
+class BulkUserCreated(BaseModel):
+    row: int
+    id: int
+    email: EmailStr
+
+class BulkUserDuplicate(BaseModel):
+    row: int
+    email: EmailStr
+    reason: str              # "email exists" / "username exists" / "repeated in upload" / ...
+
+class BulkUsersResult(BaseModel):
+    created: int
+    duplicates: int
+    failed: int
+    users: List[BulkUserCreated] = []
+    duplicate_rows: List[BulkUserDuplicate] = []   # first 1000
+    errors: List[BulkRowError] = []                # first 1000 rejected rows
+
 class VitalsOut(VitalsBase):
     id: int
     user_id: int
@@ -93,7 +134,9 @@ class TrendPoint(BaseModel):
     diastolic: Optional[int]
     heart_rate: Optional[int]
     temperature: Optional[float]
+    glucose: Optional[float] = None
     systolic_roll7: Optional[float]
+    rolling: Optional[Dict[str, Dict[str, Optional[float]]]] = None  # metric -> {"mean": .., "median": .., "std": ..}
 
 class TrendsResponse(BaseModel):
     points: List[TrendPoint]
@@ -113,6 +156,18 @@ class RecentEntry(BaseModel):
 
 class RecentResponse(BaseModel):
     items: list[RecentEntry]
+
+
+class HistoryResponse(BaseModel):
+    items: List[RecentEntry]               # newest first
+    next_cursor: Optional[str] = None      # keep going in the same direction (None = end reached)
+    prev_cursor: Optional[str] = None      # turn around (pass with the opposite direction)
+
+
+class DashboardResponse(BaseModel):
+    summary: SummaryResponse
+    points: List[TrendPoint]     # same as TrendsResponse.points
+    items: List[RecentEntry]     # same as RecentResponse.items
     
 
 
@@ -215,3 +270,7 @@ class AppointmentOut(BaseModel):
     updated_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class FreeSlot(BaseModel):
+    start_at: datetime
+    end_at: datetime
+
@@ -0,0 +1,95 @@
+# tests/conftest.py
+# Run from the backend folder: python -m pytest tests
+# The modules under test import database.py, which builds (but doesn't connect) the engines from
+# DATABASE_URL: a placeholder is enough for tests that never touch the database.
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql://test@localhost/test")
+
+# Tests against a real PostgreSQL (skipped unless TEST_DATABASE_URL is set) may apply
+# migrations and add their own users; they delete the users again, the schema changes stay.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+BACKGROUND_PATIENTS = 50
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+
+def split_sql(script: str):
+    """Top-level statements of a migration (`;` outside quotes, $$ bodies and -- comments)."""
+    statements, current, i = [], [], 0
+    quote = None  # "'" or "$$" while inside one
+    while i < len(script):
+        if quote is None and script.startswith("--", i):
+            i = script.find("\n", i)
+            i = len(script) if i < 0 else i
+            continue
+        if script.startswith("$$", i) and quote in (None, "$$"):
+            quote = None if quote else "$$"
+            current.append("$$")
+            i += 2
+            continue
+        ch = script[i]
+        if ch == "'" and quote in (None, "'"):
+            quote = None if quote else "'"
+        if ch == ";" and quote is None:
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    statements.append("".join(current).strip())
+    return [s for s in statements if s]
+
+
+def apply_migration(engine, name: str) -> None:
+    """Run migrations/<name> statement by statement (it has its own BEGIN / COMMIT, VACUUM)."""
+    with open(os.path.join(MIGRATIONS, name)) as f:
+        statements = split_sql(f.read())
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        cursor = conn.connection.cursor()  # no parameters: the `%` in format() strings stay as they are
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+@pytest.fixture(scope="module")
+def vitals_user():
+    """(engine, user id) of a scratch patient with two years of readings every 10 minutes up to
+    now, among BACKGROUND_PATIENTS others with the last 90 days every 30 minutes (so one patient
+    is a small part of each month, as in production). Inserted in time order with
+    created_at = recorded_at, like device uploads arriving as they are taken."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(TEST_DATABASE_URL)
+    tag = uuid.uuid4().hex[:12]
+    with engine.begin() as conn:
+        ids = conn.execute(text(
+            "INSERT INTO users (email, username, password) "
+            "SELECT 'vitals-' || :tag || '-' || g || '@example.invalid', 'vitals-' || :tag || '-' || g, '!' "
+            "FROM generate_series(0, :n) g ORDER BY g RETURNING id"
+        ), {"tag": tag, "n": BACKGROUND_PATIENTS}).scalars().all()
+        uid, others = ids[0], ids[1:]
+        conn.execute(text(
+            "INSERT INTO vitals (user_id, recorded_at, created_at, systolic_bp, diastolic_bp, heart_rate) "
+            "SELECT user_id, t, t, 120 + (random() * 30)::int, 80, 70 FROM ("
+            "  SELECT :uid AS user_id, t "
+            "  FROM generate_series(now() - interval '730 days', now(), interval '10 minutes') t"
+            "  UNION ALL"
+            "  SELECT u, t FROM unnest(CAST(:others AS int[])) u,"
+            "  generate_series(now() - interval '90 days', now(), interval '30 minutes') t"
+            ") s ORDER BY t"
+        ), {"uid": uid, "others": others})
+    try:
+        yield engine, uid
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM users WHERE id = ANY(:ids)"), {"ids": ids})  # vitals cascade
+        engine.dispose()
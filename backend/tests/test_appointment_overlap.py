@@ -0,0 +1,149 @@
+# tests/test_appointment_overlap.py
+# Concurrent approvals through the real handler (routers.appointment.approve_appointment: the
+# pre-check, _commit_or_409, schedule.is_overlap_violation) against the real appointments table:
+# many threads approve overlapping requested appointments of the same providers at once, no
+# provider may end up double-booked.
+#
+# Needs a PostgreSQL database with the app's tables and migrations/0005 applied; skipped unless
+# TEST_DATABASE_URL points at one. The test creates its own providers / patient (and their
+# appointments, far in the future) and deletes them again.
+#   TEST_DATABASE_URL=postgresql://... python -m pytest tests/test_appointment_overlap.py
+import asyncio
+import os
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+import database, models
+from routers import appointment
+from utils import schedule
+from utils.principals import Principal
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+THREADS = 32
+PROVIDERS = 4
+SLOTS = 25      # half-hour slots per provider
+PER_SLOT = 6    # requests per slot, every other one shifted by 15 minutes
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture
+def requested():
+    """PROVIDERS scratch providers with SLOTS x PER_SLOT overlapping requested appointments each:
+    yields ({appointment id: provider id}, provider principals by id)."""
+    engine = create_engine(TEST_DATABASE_URL)
+    tag = uuid.uuid4().hex[:12]
+    with Session(engine) as db:
+        installed = db.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conname = :name"
+        ), {"name": models.APPOINTMENT_OVERLAP_CONSTRAINT}).first()
+        assert installed, "apply migrations/0005_appointments_no_overlap.sql to the test database"
+
+        users = [models.User(email=f"overlap-{tag}-{i}@example.invalid", username=f"overlap-{tag}-{i}",
+                             password="!", role="provider" if i else "patient")
+                 for i in range(PROVIDERS + 1)]
+        db.add_all(users)
+        db.flush()
+        patient, providers = users[0], users[1:]
+
+        day = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=400)
+        appts = [
+            models.Appointment(patient_id=patient.id, provider_id=p.id,
+                               start_at=day + timedelta(minutes=30 * k + 15 * (r % 2)),
+                               end_at=day + timedelta(minutes=30 * k + 15 * (r % 2) + 30),
+                               visit_type=models.VisitType.telehealth, status=models.ApptStatus.requested)
+            for p in providers for k in range(SLOTS) for r in range(PER_SLOT)
+        ]
+        db.add_all(appts)
+        db.commit()
+        ids = {a.id: a.provider_id for a in appts}
+        principals = {p.id: Principal(id=p.id, role="provider", email=p.email, username=p.username)
+                      for p in providers}
+        user_ids = [u.id for u in users]
+    try:
+        yield ids, principals
+    finally:
+        with Session(engine) as db:
+            db.execute(delete(models.User).where(models.User.id.in_(user_ids)))  # appointments cascade
+            db.commit()
+        engine.dispose()
+
+
+def _approve_all(chunk, providers, principals, outcomes, lock):
+    """One thread: its own event loop, engine and session per request, like a uvicorn worker."""
+    async def run():
+        url, connect_args = database._async_url(TEST_DATABASE_URL)
+        engine = create_async_engine(url, connect_args=connect_args, pool_size=1, max_overflow=0)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            for appt_id in chunk:
+                async with sessions() as db:
+                    try:
+                        await appointment.approve_appointment(appt_id, db=db,
+                                                              current_user=principals[providers[appt_id]])
+                        outcome = "approved"
+                    except HTTPException as e:
+                        outcome = e.status_code
+                with lock:
+                    outcomes.append(outcome)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_concurrent_approvals_never_double_book(requested, monkeypatch):
+    ids, principals = requested
+
+    violations = []  # approvals that passed the pre-check and lost at commit
+    real = schedule.is_overlap_violation
+
+    def counted(err):
+        hit = real(err)
+        violations.append(hit)
+        return hit
+
+    monkeypatch.setattr(schedule, "is_overlap_violation", counted)
+
+    order = list(ids)
+    random.Random(0).shuffle(order)
+    outcomes, lock = [], threading.Lock()
+    with ThreadPoolExecutor(THREADS) as pool:
+        for f in [pool.submit(_approve_all, order[t::THREADS], ids, principals, outcomes, lock)
+                  for t in range(THREADS)]:
+            f.result()
+
+    assert len(outcomes) == len(ids)
+    assert set(outcomes) <= {"approved", 409}
+    assert all(violations)  # every IntegrityError was the overlap constraint
+
+    engine = create_engine(TEST_DATABASE_URL)
+    try:
+        with Session(engine) as db:
+            A, B = models.Appointment.__table__.alias("a"), models.Appointment.__table__.alias("b")
+            doubles = db.execute(
+                select(A.c.id, B.c.id)
+                .join(B, (A.c.provider_id == B.c.provider_id) & (A.c.id < B.c.id))
+                .where(A.c.provider_id.in_(list(principals)),
+                       A.c.start_at < B.c.end_at, A.c.end_at > B.c.start_at,
+                       A.c.status == models.ApptStatus.confirmed, B.c.status == models.ApptStatus.confirmed)
+            ).all()
+            confirmed = db.execute(
+                select(models.Appointment.id).where(models.Appointment.id.in_(list(ids)),
+                                                    models.Appointment.status == models.ApptStatus.confirmed)
+            ).all()
+    finally:
+        engine.dispose()
+
+    assert doubles == []
+    assert outcomes.count("approved") == len(confirmed)
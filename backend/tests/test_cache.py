@@ -0,0 +1,122 @@
+# tests/test_cache.py
+# utils/cache.py against an in-process stand-in for Redis (no server needed).
+import asyncio
+import fnmatch
+import threading
+
+import pytest
+
+from utils import cache
+from utils.principals import Principal
+
+
+class FakeRedis:
+    """The few redis.Redis methods RedisBackend uses, on a dict; records the calling threads."""
+
+    def __init__(self):
+        self.data = {}
+        self.threads = set()
+
+    def _seen(self):
+        self.threads.add(threading.get_ident())
+
+    def hget(self, name, key):
+        self._seen()
+        return self.data.get(name, {}).get(key)
+
+    def hset(self, name, key, value):
+        self._seen()
+        self.data.setdefault(name, {})[key] = value
+
+    def hdel(self, name, key):
+        self._seen()
+        self.data.get(name, {}).pop(key, None)
+
+    def expire(self, name, seconds):
+        self._seen()
+
+    def delete(self, name):
+        self._seen()
+        self.data.pop(name, None)
+
+    def scan_iter(self, match):
+        self._seen()
+        return [n for n in list(self.data) if fnmatch.fnmatch(n, match)]
+
+
+@pytest.fixture
+def redis_backend(monkeypatch):
+    backend = cache.RedisBackend(client=FakeRedis(), ttl=60)
+    monkeypatch.setattr(cache, "backend", backend)
+    return backend
+
+
+def test_redis_backend_is_shared_between_workers():
+    client = FakeRedis()
+    worker_a, worker_b = cache.RedisBackend(client=client), cache.RedisBackend(client=client)
+    worker_a.set(1, "summary:v1:range=7d", b'{"ok":1}')
+    assert worker_b.get(1, "summary:v1:range=7d") == b'{"ok":1}'
+    assert worker_b.get(2, "summary:v1:range=7d") is None
+
+
+def test_redis_backend_expiry_and_invalidation():
+    backend = cache.RedisBackend(client=FakeRedis(), ttl=-1)  # already expired when written
+    backend.set(1, "k", b"body")
+    assert backend.get(1, "k") is None
+    assert backend.stats.snapshot()["evictions"] == 1
+
+    backend.ttl = 60
+    backend.set(1, "k", b"body")
+    backend.set(2, "k", b"other")
+    backend.invalidate_user(1)
+    assert backend.get(1, "k") is None
+    assert backend.get(2, "k") == b"other"
+
+
+def test_memory_backend_lru():
+    backend = cache.MemoryBackend(max_entries=2, ttl=60)
+    backend.set(1, "a", b"a")
+    backend.set(1, "b", b"b")
+    backend.get(1, "a")          # a is now the most recently used
+    backend.set(1, "c", b"c")    # evicts b
+    assert backend.get(1, "b") is None
+    assert backend.get(1, "a") == b"a"
+    assert backend.stats.snapshot()["evictions"] == 1
+
+
+def test_cached_json_async_hits_and_invalidation(redis_backend):
+    user = Principal(id=7, role="patient", email="p@x.com", username="p", vitals_version=3)
+    builds = []
+
+    async def build():
+        builds.append(1)
+        return {"n": len(builds)}
+
+    async def scenario():
+        first = await cache.cached_json_async(user, "summary", {"range": "7d"}, build)
+        second = await cache.cached_json_async(user, "summary", {"range": "7d"}, build)
+        await cache.invalidate_user_async(user.id)
+        third = await cache.cached_json_async(user, "summary", {"range": "7d"}, build)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == second == b'{"n":1}'
+    assert third == b'{"n":2}'
+    counters = redis_backend.stats.snapshot()
+    assert (counters["hits"], counters["misses"], counters["invalidations"]) == (1, 2, 1)
+
+
+def test_blocking_backend_runs_off_the_event_loop(redis_backend):
+    user = Principal(id=7, role="patient", email="p@x.com", username="p", vitals_version=1)
+
+    async def build():
+        return {}
+
+    async def scenario():
+        await cache.cached_json_async(user, "trends", {}, build)
+        await cache.invalidate_user_async(user.id)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert redis_backend.client.threads
+    assert loop_thread not in redis_backend.client.threads
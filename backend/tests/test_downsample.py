@@ -0,0 +1,79 @@
+# tests/test_downsample.py
+# utils/downsample.py (LTTB) on plain lists, no database.
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from utils import downsample
+
+
+def _rows(n, gap_every=None):
+    """Rows 10 minutes apart with two series; with gap_every, heart_rate is only on every Nth row."""
+    return [
+        SimpleNamespace(
+            t=float(i * 600),
+            systolic=120 + 15 * math.sin(i / 25) + (60 if i == n // 3 else 0),  # one spike
+            heart_rate=None if gap_every and i % gap_every else 70 + 10 * math.cos(i / 40),
+        )
+        for i in range(n)
+    ]
+
+
+SERIES = {"systolic": lambda r: r.systolic, "heart_rate": lambda r: r.heart_rate}
+
+
+def test_lttb_keeps_first_last_and_threshold():
+    xs = [float(i) for i in range(1000)]
+    ys = [math.sin(i / 10) for i in range(1000)]
+    kept = downsample.lttb_indices(xs, ys, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert kept == sorted(set(kept))
+
+
+def test_lttb_keeps_a_spike():
+    ys = [1.0] * 500
+    ys[123] = 50.0
+    assert 123 in downsample.lttb_indices([float(i) for i in range(500)], ys, 20)
+
+
+@pytest.mark.parametrize("n, threshold", [(10, 10), (10, 50), (10, 2), (0, 5)])
+def test_lttb_passthrough(n, threshold):
+    assert downsample.lttb_indices(list(map(float, range(n))), [0.0] * n, threshold) == list(range(n))
+
+
+@pytest.mark.parametrize("max_points", [None, 0, 300, 1000])
+def test_rows_passthrough_when_they_fit(max_points):
+    rows = _rows(300)
+    assert downsample.downsample_rows(rows, lambda r: r.t, SERIES, max_points) == list(range(300))
+
+
+@pytest.mark.parametrize("max_points", [1, 2, 3, 5, 20, 101, 500])
+def test_union_of_several_series_stays_within_budget(max_points):
+    rows = _rows(2000)
+    series = {**SERIES, "flat": lambda r: 80.0, "ramp": lambda r: r.t / 600}
+    keep = downsample.downsample_rows(rows, lambda r: r.t, series, max_points)
+    assert len(keep) <= max_points
+    assert keep == sorted(set(keep))
+    if max_points >= 2:
+        assert keep[0] == 0 and keep[-1] == len(rows) - 1
+
+
+def test_none_gaps_are_skipped_per_series():
+    rows = _rows(3000, gap_every=7)  # heart_rate only on every 7th row
+    keep = downsample.downsample_rows(rows, lambda r: r.t, SERIES, 100)
+    assert len(keep) <= 100
+    assert keep[0] == 0 and keep[-1] == len(rows) - 1
+    assert rows.index(max(rows, key=lambda r: r.systolic)) in keep  # the spike survives
+    # the heart_rate share only picks rows that have a heart_rate
+    hr_keep = downsample.downsample_rows(rows, lambda r: r.t, {"heart_rate": SERIES["heart_rate"]}, 50)
+    assert all(rows[i].heart_rate is not None for i in hr_keep)
+
+
+def test_all_series_empty():
+    rows = _rows(500)
+    for r in rows:
+        r.heart_rate = None
+    keep = downsample.downsample_rows(rows, lambda r: r.t, {"heart_rate": SERIES["heart_rate"]}, 40)
+    assert len(keep) == 40 and keep[0] == 0 and keep[-1] == 499
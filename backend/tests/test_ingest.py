@@ -0,0 +1,147 @@
+# tests/test_ingest.py
+# utils/ingest.py parsing, validation and upload limits (no database).
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from utils import ingest
+
+READINGS = [
+    {"recorded_at": "2024-05-01T08:00:00Z", "systolic_bp": 120, "diastolic_bp": 80},
+    {"recorded_at": "2024-05-01T09:00:00", "heart_rate": 72, "notes": "after coffee"},
+]
+
+
+def _request(body: bytes, content_type: str, content_length: bool = True, chunk: int = 1000) -> Request:
+    """A raw ASGI request whose body arrives in `chunk` sized messages."""
+    headers = [(b"content-type", content_type.encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    messages = [{"type": "http.request", "body": body[i:i + chunk], "more_body": i + chunk < len(body)}
+                for i in range(0, len(body), chunk)] or [{"type": "http.request", "body": b""}]
+
+    async def receive():
+        return messages.pop(0)
+
+    return Request({"type": "http", "method": "POST", "path": "/vitals/bulk", "headers": headers}, receive)
+
+
+def _read(request, **kw):
+    return asyncio.run(ingest.read_upload(request, **kw))
+
+
+# ---------------------------
+# parse_records
+# ---------------------------
+
+def test_json_array():
+    body = b'[{"recorded_at": "2024-05-01T08:00:00Z"}, {"recorded_at": "2024-05-02T08:00:00Z"}]'
+    assert [row for row, _ in ingest.parse_records(body, "json")] == [1, 2]
+    for bad in (b"[{", b'{"recorded_at": "2024-05-01"}'):
+        with pytest.raises(ValueError):
+            list(ingest.parse_records(bad, "json"))
+
+
+def test_ndjson_numbers_skip_blank_lines_and_bad_lines_are_row_errors():
+    body = b'{"a": 1}\n\n{"a": 2\r\n{"a": 3}\n'
+    out = list(ingest.parse_records(body, "ndjson"))
+    assert [row for row, _ in out] == [1, 2, 3]
+    assert out[0][1] == {"a": 1} and out[2][1] == {"a": 3}
+    assert isinstance(out[1][1], ingest.RowError)
+
+
+def test_csv_rows_after_the_header_with_empty_cells_as_missing():
+    body = "\ufeffrecorded_at , heart_rate,glucose\n2024-05-01T08:00:00Z,72,\n2024-05-02T08:00:00Z,,5.4\n"
+    out = list(ingest.parse_records(body.encode(), "csv"))
+    assert out == [
+        (1, {"recorded_at": "2024-05-01T08:00:00Z", "heart_rate": "72", "glucose": None}),
+        (2, {"recorded_at": "2024-05-02T08:00:00Z", "heart_rate": None, "glucose": "5.4"}),
+    ]
+
+
+@pytest.mark.parametrize("body, fmt", [
+    (b"heart_rate\n72\n", "csv"),       # no recorded_at column
+    (b"", "csv"),
+    (b"recorded_at\n\xff\n", "csv"),    # not UTF-8
+    (b"[]", "xml"),
+])
+def test_body_that_is_not_the_format_raises(body, fmt):
+    with pytest.raises(ValueError):
+        list(ingest.parse_records(body, fmt))
+
+
+def test_csv_required_column_is_configurable():
+    out = list(ingest.parse_records(b"email\na@example.com\n", "csv", required_column="email"))
+    assert out == [(1, {"email": "a@example.com"})]
+
+
+# ---------------------------
+# validate_batch
+# ---------------------------
+
+def test_validate_batch_keeps_good_rows_and_reports_bad_ones():
+    batch = [
+        (1, READINGS[0]),
+        (2, READINGS[1]),
+        (3, {"systolic_bp": 120}),                                   # no recorded_at
+        (4, {"recorded_at": "2024-05-01T10:00:00Z", "heart_rate": "fast"}),
+        (5, ingest.RowError("invalid JSON: unexpected end")),
+        (6, [1, 2]),
+    ]
+    rows, errors = ingest.validate_batch(7, batch)
+
+    assert rows == [
+        (7, datetime(2024, 5, 1, 8, tzinfo=timezone.utc), 120, 80, None, None, None, None),
+        # naive timestamps are taken as UTC, notes kept
+        (7, datetime(2024, 5, 1, 9, tzinfo=timezone.utc), None, None, 72, None, None, "after coffee"),
+    ]
+    assert [row for row, _ in errors] == [3, 4, 5, 6]
+    assert errors[0][1][0].startswith("recorded_at:")
+    assert errors[1][1][0].startswith("heart_rate:")
+    assert errors[2][1] == ["invalid JSON: unexpected end"]
+    assert errors[3][1] == ["expected an object"]
+
+
+def test_validate_batch_from_csv_strings():
+    body = b"recorded_at,systolic_bp,notes\n2024-05-01T08:00:00Z,118,\n"
+    rows, errors = ingest.validate_batch(1, ingest.parse_records(body, "csv"))
+    assert errors == []
+    assert rows[0][2] == 118 and rows[0][7] is None
+
+
+def test_row_limit_is_checked_before_anything_is_written():
+    records = ((i, dict(READINGS[0])) for i in range(1, 12))
+    with pytest.raises(ValueError):
+        ingest.ingest(None, 1, records, max_rows=10)  # no session needed: nothing is written
+
+
+# ---------------------------
+# read_upload
+# ---------------------------
+
+def test_read_upload_raw_body_and_format():
+    body = b'{"recorded_at": "2024-05-01T08:00:00Z"}\n'
+    assert _read(_request(body, "application/x-ndjson; charset=utf-8")) == (body, "ndjson")
+    assert _read(_request(body, "text/plain"), format="ndjson") == (body, "ndjson")
+    with pytest.raises(HTTPException) as e:
+        _read(_request(body, "text/plain"))
+    assert e.value.status_code == 415
+
+
+def test_read_upload_multipart_file_name():
+    body = (b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"export.CSV\"\r\n"
+            b"Content-Type: application/octet-stream\r\n\r\nrecorded_at\r\n2024-05-01\r\n--b--\r\n")
+    data, fmt = _read(_request(body, "multipart/form-data; boundary=b"))
+    assert (data, fmt) == (b"recorded_at\r\n2024-05-01", "csv")
+
+
+@pytest.mark.parametrize("content_length", [True, False])
+def test_read_upload_over_the_limit_is_413(content_length):
+    body = b"x" * 5000
+    with pytest.raises(HTTPException) as e:
+        _read(_request(body, "text/csv", content_length=content_length), max_bytes=4096)
+    assert e.value.status_code == 413
+    assert _read(_request(body, "text/csv", content_length=content_length), max_bytes=5000) == (body, "csv")
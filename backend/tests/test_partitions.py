@@ -0,0 +1,55 @@
+# tests/test_partitions.py
+# Partition pruning on the monthly vitals partitions (migrations/0002): EXPLAIN of the 7d / 30d
+# summary and trends statements must not read any month before their window. Real database,
+# skipped unless TEST_DATABASE_URL is set; converts its vitals table if it isn't partitioned yet.
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from conftest import apply_migration
+from routers import summary, trends
+from utils import partitions
+
+
+@pytest.fixture(scope="module")
+def partitioned(vitals_user):
+    engine, user_id = vitals_user
+    apply_migration(engine, "0002_vitals_partitioning.sql")
+    with Session(engine) as db:
+        partitions.maintain(db)
+        db.commit()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE vitals"))
+    return engine, user_id
+
+
+def _cases(user_id):
+    # same arguments the endpoints build (naive UTC "now", see compute_summary / trends._date_window)
+    naive_now = datetime.utcnow()
+    now = naive_now.replace(tzinfo=timezone.utc)
+    return [
+        # (label, statement, oldest timestamp the statement may need)
+        ("summary 7d", summary._summary_stmt(user_id, "7d", naive_now), now - timedelta(days=14)),
+        ("summary 30d", summary._rollup_summary_stmt(user_id, "30d", naive_now), now - timedelta(days=60)),
+        ("trends 7d raw", trends._raw_stmt(user_id, trends._date_window("7d")), now - timedelta(days=7)),
+        ("trends 30d raw", trends._raw_stmt(user_id, trends._date_window("30d")), now - timedelta(days=30)),
+    ]
+
+
+@pytest.mark.parametrize("label", ["summary 7d", "summary 30d", "trends 7d raw", "trends 30d raw"])
+def test_windowed_reads_skip_older_months(partitioned, label):
+    engine, user_id = partitioned
+    with Session(engine) as db:
+        assert partitions.is_partitioned(db)
+        months = [p for p in partitions.partitions(db) if p != partitions.DEFAULT_PARTITION]
+        _, stmt, oldest = next(c for c in _cases(user_id) if c[0] == label)
+        scanned = partitions.scanned_partitions(db, stmt)["scanned"]
+        db.rollback()
+
+    assert len(months) >= 24  # two years of readings: there is something to prune
+    # timestamps are converted to UTC by the server, allow a day of slack at the lower edge
+    stale = [p for p in scanned if partitions._older_than(p, oldest - timedelta(days=1))]
+    assert not stale, f"{label} reads months before its window: {stale}"
+    assert len(scanned) < len(months) // 2
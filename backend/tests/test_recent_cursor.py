@@ -0,0 +1,130 @@
+# tests/test_recent_cursor.py
+# routers/recent.py history cursors: opaque (recorded_at, id) positions, 400 on anything else.
+# The paging test walks GET /vitals/history on a real database (skipped unless TEST_DATABASE_URL is set).
+import asyncio
+import base64
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+import database, models
+from routers import recent
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("recorded_at", [
+    datetime(2024, 5, 1, 8, 30, tzinfo=timezone.utc),
+    datetime(2024, 5, 1, 8, 30, 15, 123456, tzinfo=timezone(timedelta(hours=-7))),
+    datetime(2024, 5, 1, 8, 30),  # naive
+])
+def test_cursor_round_trip(recorded_at):
+    cursor = recent._encode_cursor(SimpleNamespace(recorded_at=recorded_at, id=987654))
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor  # safe in a query string
+    assert recent._decode_cursor(cursor) == (recorded_at, 987654)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor!",
+    "%%%",
+    _b64(b"\xff\xfe"),                                        # not UTF-8
+    _b64(b"{not json"),
+    _b64(b"[1, 2]"),
+    _b64(b'"2024-05-01"'),
+    _b64(json.dumps({"t": "2024-05-01T08:30:00"}).encode()),  # no id
+    _b64(json.dumps({"i": 3}).encode()),                      # no timestamp
+    _b64(json.dumps({"t": "yesterday", "i": 3}).encode()),
+    _b64(json.dumps({"t": "2024-05-01T08:30:00", "i": "x"}).encode()),
+    _b64(json.dumps({"t": 1714552200, "i": 3}).encode()),
+    _b64(json.dumps({"t": "2024-05-01T08:30:00", "i": None}).encode()),
+])
+def test_malformed_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        recent._decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+# ---------------------------
+# next / prev cursors against a real database (skipped unless TEST_DATABASE_URL is set)
+# ---------------------------
+
+@pytest.fixture
+def history_user():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    engine = create_engine(TEST_DATABASE_URL)
+    tag = uuid.uuid4().hex[:12]
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    with Session(engine) as db:
+        user = models.User(email=f"history-{tag}@example.invalid", username=f"history-{tag}", password="!")
+        db.add(user)
+        db.flush()
+        # 23 readings, two pairs sharing a timestamp so the id breaks the tie
+        times = [start + timedelta(hours=h) for h in range(21)] + [start + timedelta(hours=5)] * 2
+        db.add_all(models.Vital(user_id=user.id, recorded_at=t, heart_rate=60 + i) for i, t in enumerate(times))
+        db.commit()
+        uid = user.id
+    try:
+        yield TEST_DATABASE_URL, uid
+    finally:
+        with Session(engine) as db:
+            db.execute(delete(models.Vital).where(models.Vital.user_id == uid))
+            db.execute(delete(models.User).where(models.User.id == uid))
+            db.commit()
+        engine.dispose()
+
+
+def _pages(url, uid, direction, cursor=None, limit=5):
+    """Follow next_cursor from `cursor` to the end: [(items, next_cursor, prev_cursor)] per page."""
+    async def main():
+        async_url, connect_args = database._async_url(url)
+        engine = create_async_engine(async_url, connect_args=connect_args)
+        pages, current = [], cursor
+        try:
+            async with AsyncSession(engine) as db:
+                while True:
+                    response = await recent.get_history(
+                        current_user=SimpleNamespace(id=uid), cursor=current, limit=limit,
+                        direction=direction, start=None, end=None, db=db)
+                    body = json.loads(response.body)
+                    pages.append((body["items"], body["next_cursor"], body["prev_cursor"]))
+                    current = body["next_cursor"]
+                    if current is None:
+                        return pages
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def _key(item):
+    return item["date"], item["id"]
+
+
+def test_history_walks_older_then_back_newer(history_user):
+    url, uid = history_user
+    older = _pages(url, uid, "older")
+    items = [it for page, _, _ in older for it in page]
+    assert len(items) == 23 and len(older) == 5
+    assert [_key(it) for it in items] == sorted((_key(it) for it in items), reverse=True)
+    assert older[0][2] is None  # first page: nothing to turn around to
+
+    # from the last page, prev_cursor walks back up: the same rows, page by page, newest first
+    newer = _pages(url, uid, "newer", cursor=older[-1][2])
+    back = [it for page, _, _ in reversed(newer) for it in page]
+    assert [_key(it) for it in back] == [_key(it) for it in items[: len(back)]]
+    assert len(back) == 23 - len(older[-1][0])
+    assert newer[-1][1] is None
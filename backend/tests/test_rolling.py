@@ -0,0 +1,89 @@
+# tests/test_rolling.py
+# utils/rolling.py against a plain-Python reference loop (no database).
+import statistics
+
+import numpy as np
+import pytest
+
+from utils import rolling
+
+
+def _reference(times, values, stat, points=None, seconds=None):
+    """Per row: the stat over the window of real readings ending at that row (None if missing)."""
+    out, window = [], []
+    for t, x in zip(times, values):
+        if x is None:
+            out.append(None)
+            continue
+        window.append((t, x))
+        if points is not None:
+            window = window[-points:]
+        else:
+            window = [(wt, wx) for wt, wx in window if wt > t - seconds]
+        xs = [wx for _, wx in window]
+        out.append({"mean": statistics.fmean, "median": statistics.median,
+                    "std": statistics.pstdev}[stat](xs))
+    return out
+
+
+def _series(n=400, seed=1):
+    rng = np.random.default_rng(seed)
+    times = np.cumsum(rng.integers(60, 4 * 3600, n)).astype(float)  # irregular spacing
+    values = [None if rng.random() < 0.4 else float(rng.normal(120, 15)) for _ in range(n)]
+    return times, values
+
+
+def _assert_matches(got, expected):
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        if e is None:
+            assert np.isnan(g)
+        else:
+            assert g == pytest.approx(e, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("stat", rolling.STATS)
+@pytest.mark.parametrize("points", [1, 3, 7, 50])
+def test_count_windows_match_reference(stat, points):
+    times, values = _series()
+    got = rolling.rolling_stats(times, rolling.to_array(values), (stat,), points=points)[stat]
+    _assert_matches(got, _reference(times, values, stat, points=points))
+
+
+@pytest.mark.parametrize("stat", rolling.STATS)
+@pytest.mark.parametrize("seconds", [3600.0, 86400.0, 7 * 86400.0])
+def test_time_windows_match_reference(stat, seconds):
+    times, values = _series()
+    got = rolling.rolling_stats(times, rolling.to_array(values), (stat,), seconds=seconds)[stat]
+    _assert_matches(got, _reference(times, values, stat, seconds=seconds))
+
+
+def test_systolic_roll7_matches_the_old_pop_loop():
+    times, values = _series(1000)
+    got = rolling.rolling_stats(times, rolling.to_array(values), ("mean",), points=7)["mean"]
+    _assert_matches(got, rolling._loop_roll7(values))
+
+
+def test_median_in_several_chunks(monkeypatch):
+    monkeypatch.setattr(rolling, "_MEDIAN_CHUNK_CELLS", 50)
+    times, values = _series()
+    got = rolling.rolling_stats(times, rolling.to_array(values), ("median",), points=7)["median"]
+    _assert_matches(got, _reference(times, values, "median", points=7))
+
+
+def test_no_readings():
+    out = rolling.rolling_stats(np.arange(3.0), rolling.to_array([None, None, None]), rolling.STATS, points=7)
+    assert all(np.isnan(arr).all() for arr in out.values())
+
+
+def test_window_limits(monkeypatch):
+    assert rolling.parse_window("7") == (7, None)
+    assert rolling.parse_window("12h") == (None, 43200.0)
+    for bad in ("0", "7w", "", f"{rolling.MAX_WINDOW_POINTS + 1}", f"{int(rolling.MAX_WINDOW_DAYS) + 1}d"):
+        with pytest.raises(ValueError):
+            rolling.parse_window(bad)
+
+    monkeypatch.setattr(rolling, "MEDIAN_MAX_CELLS", 100)
+    times, values = _series()
+    with pytest.raises(ValueError):
+        rolling.rolling_stats(times, rolling.to_array(values), ("median",), points=7)
@@ -0,0 +1,100 @@
+# tests/test_sessions.py
+# utils/sessions.py refresh token rotation and reuse detection, against a real database (skipped
+# unless TEST_DATABASE_URL is set, see tests/test_appointment_overlap.py).
+import asyncio
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+import database, models
+from utils import sessions
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture
+def user_id():
+    engine = create_engine(TEST_DATABASE_URL)
+    tag = uuid.uuid4().hex[:12]
+    with Session(engine) as db:
+        user = models.User(email=f"sessions-{tag}@example.invalid", username=f"sessions-{tag}", password="!")
+        db.add(user)
+        db.commit()
+        uid = user.id
+    sessions.index.clear()
+    try:
+        yield uid
+    finally:
+        sessions.index.clear()
+        with Session(engine) as db:
+            db.execute(delete(models.User).where(models.User.id == uid))  # sessions cascade
+            db.commit()
+        engine.dispose()
+
+
+def _run(fn, *args):
+    """fn(AsyncSession, *args) on a fresh engine (own event loop)."""
+    async def main():
+        url, connect_args = database._async_url(TEST_DATABASE_URL)
+        engine = create_async_engine(url, connect_args=connect_args)
+        try:
+            async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as db:
+                return await fn(db, *args)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def _open_sessions(db, uid):
+    return (await db.execute(
+        select(func.count()).select_from(models.UserSession)
+        .where(models.UserSession.user_id == uid, models.UserSession.revoked_at.is_(None))
+    )).scalar()
+
+
+def test_previous_token_within_grace_is_refused_without_revoking(user_id):
+    async def scenario(db):
+        first = await sessions.issue(db, user_id)
+        uid, second = await sessions.rotate(db, first)
+        assert uid == user_id
+        assert await sessions.rotate(db, first) is None   # second tab / retried request
+        sessions.index.clear()                            # the same on another worker
+        assert await sessions.rotate(db, first) is None
+        assert await _open_sessions(db, user_id) == 1
+        assert (await sessions.rotate(db, second))[0] == user_id
+
+    _run(scenario)
+
+
+def test_concurrent_refresh_on_two_workers_keeps_the_sessions(user_id):
+    async def scenario(db):
+        token = await sessions.issue(db, user_id)
+        other_worker = sessions._Entry(**vars(sessions.index.get(sessions.token_hash(token))))
+        assert await sessions.rotate(db, token) is not None
+        # the other worker still has the token as unused: its UPDATE finds it rotated
+        sessions.index.add(sessions.token_hash(token), other_worker)
+        assert await sessions.rotate(db, token) is None
+        assert await _open_sessions(db, user_id) == 1
+
+    _run(scenario)
+
+
+def test_reuse_after_grace_revokes_every_session(user_id, monkeypatch):
+    monkeypatch.setattr(sessions, "REFRESH_REUSE_GRACE_SECONDS", 0)
+
+    async def scenario(db):
+        first = await sessions.issue(db, user_id)
+        await sessions.issue(db, user_id)                 # another device
+        _, second = await sessions.rotate(db, first)
+        assert await sessions.rotate(db, first) is None
+        assert await _open_sessions(db, user_id) == 0
+        assert await sessions.rotate(db, second) is None
+
+    _run(scenario)
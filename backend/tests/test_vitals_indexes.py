@@ -0,0 +1,24 @@
+# tests/test_vitals_indexes.py
+# After migrations/0003 the hot vitals reads (summary 7d / 30d edges, trends 7d, recent) use the
+# covering index, index-only where they only need metrics, and "rows added in the last hour" uses
+# the BRIN index on created_at (utils/explain.index_checks). Real database, skipped unless
+# TEST_DATABASE_URL is set.
+import pytest
+from sqlalchemy.orm import Session
+
+from conftest import apply_migration
+from utils import explain
+
+
+def test_hot_reads_use_the_covering_and_brin_indexes(vitals_user):
+    engine, user_id = vitals_user
+    apply_migration(engine, "0003_vitals_covering_indexes.sql")  # ends with VACUUM (ANALYZE) vitals
+
+    with Session(engine) as db:
+        results = explain.index_checks(db, user_id)
+        db.rollback()
+
+    assert [label for label, _, _ in results] == [
+        "summary 7d", "summary 30d edges", "trends 7d raw", "recent 10", "rows added 1h"]
+    bad = {label: types for label, good, types in results if not good}
+    assert not bad, f"plans not using their index: {bad}"
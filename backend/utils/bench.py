@@ -0,0 +1,328 @@
+# utils/bench.py
+# PURPOSE : before / after measurements of the vitals read paths, against the database in
+#           DATABASE_URL. Each run adds a throwaway patient with N synthetic readings (every 10
+#           minutes up to now, rollups rebuilt), times the previous and the current code path on
+#           it and deletes the patient again (vitals and rollups cascade).
+#
+#   - summary : GET /vitals/summary, every Vital of the window hydrated and reduced in Python
+#               (+ 3 more queries) vs compute_summary (one aggregate, rollups for 30d / all).
+#               Wall time is the best of --repeat runs, memory the tracemalloc peak of one more run.
+#   - rows    : per-row CPU and allocations of the list endpoints, query + JSON body:
+#               ORM entities -> Pydantic objects -> response_model validation -> json.dumps (as
+#               FastAPI does for a returned model) vs Core tuples -> dicts -> orjson (FastJSONResponse)
+#               for GET /vitals/trends?range=all&granularity=raw and GET /vitals/recent?limit=100.
+#   - export  : bytes and wall time of a patient's whole history as trends JSON (range=all, raw)
+#               vs GET /vitals/export as CSV / NDJSON / Arrow IPC / Parquet (all columns, and
+#               Parquet with only recorded_at + the metrics). Arrow / Parquet need pyarrow.
+#
+# Command line (run from the backend folder):
+#   python -m utils.bench summary [--rows 10000 100000] [--repeat 3]
+#   python -m utils.bench rows [--rows 100000] [--repeat 3]
+#   python -m utils.bench export [--rows 200000] [--repeat 3]
+import json
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models, schemas
+from utils import rollups
+
+
+@contextmanager
+def _patient(db: Session, rows: int) -> Iterator[int]:
+    """Id of a scratch user with `rows` readings 10 minutes apart up to now (deleted afterwards)."""
+    tag = uuid.uuid4().hex[:12]
+    user = models.User(email=f"bench-{tag}@example.invalid", username=f"bench-{tag}", password="!")
+    db.add(user)
+    db.flush()
+    user_id = user.id
+    db.execute(text(
+        "INSERT INTO vitals (user_id, recorded_at, created_at, systolic_bp, diastolic_bp, heart_rate, "
+        "                    temperature, glucose, notes) "
+        "SELECT :uid, t, t, 110 + (random() * 40)::int, 70 + (random() * 20)::int, 55 + (random() * 50)::int, "
+        "       CASE WHEN g % 4 = 0 THEN round((97.5 + random() * 3.5)::numeric, 1) END, "
+        "       CASE WHEN g % 6 = 0 THEN round((4 + random() * 4)::numeric, 1) END, "
+        "       CASE WHEN g % 50 = 0 THEN 'after a walk' END "
+        "FROM generate_series(1, :n) g, LATERAL (SELECT now() - (:n - g) * interval '10 minutes' AS t) s "
+        "ORDER BY t"
+    ), {"uid": user_id, "n": rows})
+    rollups.rebuild(db, user_id)
+    db.commit()
+    db.execute(text("ANALYZE vitals"))
+    db.execute(text("ANALYZE vital_daily_rollups"))
+    db.commit()
+    try:
+        yield user_id
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM users WHERE id = :uid"), {"uid": user_id})
+        db.commit()
+
+
+def _measure(fn: Callable[[], object], repeat: int) -> Tuple[float, float, object]:
+    """(best wall ms, tracemalloc peak KiB, result) of fn()."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best * 1000, peak / 1024, result
+
+
+# ---------------------------
+# summary
+# ---------------------------
+
+def _summary_loop(db: Session, user_id: int, range_param: str) -> dict:
+    """GET /vitals/summary before the aggregate query: hydrate the window, reduce in Python."""
+    from routers.summary import _date_window
+
+    V = models.Vital
+    q = db.query(V).filter(V.user_id == user_id)
+    start = _date_window(range_param)
+    if start:
+        q = q.filter(V.recorded_at >= start)
+    vitals = q.all()
+    if not vitals:
+        return dict(avg_bp=None, max_hr=None, avg_temp=None, temp_trend=None,
+                    entries_this_week=0, last_entry_at=None, flagged_entries=0)
+
+    systolics = [v.systolic_bp for v in vitals if v.systolic_bp is not None]
+    diastolics = [v.diastolic_bp for v in vitals if v.diastolic_bp is not None]
+    heart_rates = [v.heart_rate for v in vitals if v.heart_rate is not None]
+    temperatures = [v.temperature for v in vitals if v.temperature is not None]
+    avg_bp = None
+    if systolics and diastolics:
+        avg_bp = dict(systolic=round(sum(systolics) / len(systolics), 1),
+                      diastolic=round(sum(diastolics) / len(diastolics), 1))
+
+    temp_trend = None
+    if range_param in ("7d", "30d") and temperatures:
+        window_days = 7 if range_param == "7d" else 30
+        now = datetime.utcnow()
+        prev_start, mid = now - timedelta(days=2 * window_days), now - timedelta(days=window_days)
+        with_temp = db.query(V).filter(V.user_id == user_id, V.temperature.isnot(None))
+        prev_vals = [v.temperature for v in with_temp.filter(V.recorded_at >= prev_start, V.recorded_at < mid)]
+        curr_vals = [v.temperature for v in with_temp.filter(V.recorded_at >= mid)]
+        if prev_vals and curr_vals:
+            up = sum(curr_vals) / len(curr_vals) > sum(prev_vals) / len(prev_vals)
+            temp_trend = "up" if up else "down"
+
+    week_start = datetime.utcnow() - timedelta(days=7)
+    return dict(
+        avg_bp=avg_bp,
+        max_hr=max(heart_rates) if heart_rates else None,
+        avg_temp=round(sum(temperatures) / len(temperatures), 1) if temperatures else None,
+        temp_trend=temp_trend,
+        entries_this_week=db.query(V).filter(V.user_id == user_id, V.recorded_at >= week_start).count(),
+        last_entry_at=max(v.recorded_at for v in vitals),
+        flagged_entries=sum(1 for v in vitals if
+                            (v.systolic_bp is not None and v.systolic_bp >= models.FLAG_SYSTOLIC_BP) or
+                            (v.temperature is not None and v.temperature >= models.FLAG_TEMPERATURE)),
+    )
+
+
+def bench_summary(sizes: Sequence[int] = (10_000, 100_000), repeat: int = 3) -> None:
+    """Latency and peak Python memory of the summary, loop vs aggregate, per history size and range."""
+    from database import SessionLocal
+    from routers.summary import compute_summary
+
+    print(f"{'readings':>9} {'range':>5} {'loop':>20} {'aggregate':>20}  same")
+    for n in sizes:
+        with SessionLocal() as db, _patient(db, n) as user_id:
+            for range_param in ("7d", "30d", "all"):
+                def loop():
+                    db.expunge_all()  # a fresh request has an empty identity map
+                    return _summary_loop(db, user_id, range_param)
+
+                old_ms, old_kib, old = _measure(loop, repeat)
+                new_ms, new_kib, new = _measure(lambda: compute_summary(db, user_id, range_param), repeat)
+                db.rollback()
+                print(f"{n:>9} {range_param:>5} {old_ms:>9.1f} ms {old_kib:>6.0f} KiB "
+                      f"{new_ms:>9.1f} ms {new_kib:>6.0f} KiB  {'yes' if old == new else 'NO'}")
+
+
+# ---------------------------
+# rows
+# ---------------------------
+
+def _fastapi_body(model, response_model) -> bytes:
+    """What FastAPI sends for a returned Pydantic model: dump, validate against response_model,
+    serialize in JSON mode, then JSONResponse's json.dumps."""
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(response_model)
+    value = adapter.validate_python(model.model_dump(by_alias=True))
+    return json.dumps(adapter.dump_python(value, mode="json"), ensure_ascii=False,
+                      allow_nan=False, separators=(",", ":")).encode()
+
+
+def _trends_orm(db: Session, user_id: int) -> bytes:
+    """GET /vitals/trends?range=all&granularity=raw before the Core read path."""
+    from utils import rolling
+
+    V = models.Vital
+    rows = db.query(V).filter(V.user_id == user_id).order_by(V.recorded_at.asc()).all()
+    times = np.array([v.recorded_at.timestamp() for v in rows], dtype=float)
+    roll7 = rolling.rolling_stats(times, rolling.to_array(v.systolic_bp for v in rows), ("mean",), points=7)["mean"]
+    points = [
+        schemas.TrendPoint(
+            date=v.recorded_at, systolic=v.systolic_bp, diastolic=v.diastolic_bp, heart_rate=v.heart_rate,
+            temperature=v.temperature, glucose=v.glucose,
+            systolic_roll7=None if roll7[i] != roll7[i] else round(float(roll7[i]), 1),
+        )
+        for i, v in enumerate(rows)
+    ]
+    return _fastapi_body(schemas.TrendsResponse(points=points), schemas.TrendsResponse)
+
+
+def _recent_orm(db: Session, user_id: int, limit: int) -> bytes:
+    """GET /vitals/recent before the Core read path."""
+    V = models.Vital
+    rows = db.query(V).filter(V.user_id == user_id).order_by(V.recorded_at.desc()).limit(limit).all()
+    items = [
+        schemas.RecentEntry(id=v.id, date=v.recorded_at, systolic=v.systolic_bp, diastolic=v.diastolic_bp,
+                            heart_rate=v.heart_rate, temperature=v.temperature, notes=v.notes)
+        for v in rows
+    ]
+    return _fastapi_body(schemas.RecentResponse(items=items), schemas.RecentResponse)
+
+
+def _per_row(fn: Callable[[], bytes], rows: int, peak_rows: int, repeat: int) -> Tuple[float, float, bytes]:
+    """(CPU us per row, tracemalloc peak bytes per row, body) of fn(), CPU the best of `repeat`.
+    fn() handles `rows` rows in total, at most `peak_rows` of them at the same time."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    tracemalloc.start()
+    try:
+        body = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best / rows * 1e6, peak / peak_rows, body
+
+
+def bench_rows(rows: int = 100_000, repeat: int = 3) -> None:
+    """Per-row CPU / peak allocations of trends (range=all, raw) and recent, old vs current path."""
+    from database import SessionLocal
+    from routers.recent import compute_recent
+    from routers.trends import compute_trends
+    from utils import responses
+
+    recent_limit, recent_pages = 100, 50  # one page is too short to time, run it a few times
+    cases = [
+        ("trends all raw", rows, rows,
+         lambda db, uid: _trends_orm(db, uid),
+         lambda db, uid: responses.dumps(compute_trends(db, uid, "all", "raw"))),
+        (f"recent {recent_limit} x{recent_pages}", recent_limit * recent_pages, recent_limit,
+         lambda db, uid: [_recent_orm(db, uid, recent_limit) for _ in range(recent_pages)][-1],
+         lambda db, uid: [responses.dumps(compute_recent(db, uid, recent_limit)) for _ in range(recent_pages)][-1]),
+    ]
+
+    print(f"{'':<18} {'ORM + Pydantic':>26} {'Core + orjson':>26}  same JSON")
+    with SessionLocal() as db, _patient(db, rows) as user_id:
+        for label, n, peak_n, old_fn, new_fn in cases:
+            def old():
+                db.expunge_all()  # a fresh request has an empty identity map
+                return old_fn(db, user_id)
+
+            old_us, old_b, old_body = _per_row(old, n, peak_n, repeat)
+            new_us, new_b, new_body = _per_row(lambda: new_fn(db, user_id), n, peak_n, repeat)
+            db.rollback()
+            same = json.loads(old_body) == json.loads(new_body)
+            print(f"{label:<18} {old_us:>8.1f} us/row {old_b:>6.0f} B/row {new_us:>8.1f} us/row "
+                  f"{new_b:>6.0f} B/row  {'yes' if same else 'NO'}")
+
+
+# ---------------------------
+# export
+# ---------------------------
+
+def _rows_in(body: bytes, format: str) -> int:
+    """Rows an export body holds (read back, so a truncated body shows)."""
+    import io
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_metadata(io.BytesIO(body)).num_rows
+    if format == "arrow":
+        import pyarrow as pa
+        return pa.ipc.open_stream(body).read_all().num_rows
+    if format == "csv":
+        return body.count(b"\n") - 1  # header
+    return body.count(b"\n")
+
+
+def bench_export(rows: int = 200_000, repeat: int = 3) -> None:
+    """Download size and wall time of one patient's history: trends JSON vs the export formats."""
+    from database import SessionLocal
+    from routers.export import EXPORT_COLUMNS, stream_export
+    from routers.trends import compute_trends
+    from utils import columnar, responses
+
+    metrics = ("recorded_at", "systolic_bp", "diastolic_bp", "heart_rate", "temperature", "glucose")
+    with SessionLocal() as db, _patient(db, rows) as user_id:
+        def trends_json():
+            body = responses.dumps(compute_trends(db, user_id, "all", "raw"))
+            db.rollback()
+            return body
+
+        cases = [("trends JSON", trends_json, lambda body: body.count(b'"date"'))]
+        for label, format, columns in [
+            ("csv export", "csv", EXPORT_COLUMNS),
+            ("ndjson export", "ndjson", EXPORT_COLUMNS),
+            ("arrow", "arrow", EXPORT_COLUMNS),
+            ("parquet", "parquet", EXPORT_COLUMNS),
+            ("parquet, metrics only", "parquet", metrics),
+        ]:
+            if format in columnar.FORMATS and not columnar.available():
+                print(f"{label:<22} skipped, pip install pyarrow")
+                continue
+            cases.append((label,
+                          lambda format=format, columns=columns: b"".join(stream_export([user_id], format, columns)),
+                          lambda body, format=format: _rows_in(body, format)))
+
+        print(f"{'':<22} {'size':>10} {'wall':>10} {'rows':>9}")
+        for label, fn, count in cases:
+            wall, _, body = _measure(fn, repeat)
+            print(f"{label:<22} {len(body) / 1e6:>7.1f} MB {wall / 1000:>8.2f} s {count(body):>9}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Before / after benchmarks of the vitals read paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("summary", help="GET /vitals/summary: Python loop over every Vital vs one aggregate")
+    s.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="readings of the patient")
+    s.add_argument("--repeat", type=int, default=3, help="timed runs, the best one is reported")
+    r = sub.add_parser("rows", help="trends / recent: ORM + Pydantic vs Core + orjson, per row")
+    r.add_argument("--rows", type=int, default=100_000, help="readings of the patient")
+    r.add_argument("--repeat", type=int, default=3, help="timed runs, the best one is reported")
+    e = sub.add_parser("export", help="bytes / wall time: trends JSON vs CSV, NDJSON, Arrow, Parquet export")
+    e.add_argument("--rows", type=int, default=200_000, help="readings of the patient")
+    e.add_argument("--repeat", type=int, default=3, help="timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        bench_summary(args.rows, args.repeat)
+    elif args.command == "rows":
+        bench_rows(args.rows, args.repeat)
+    else:
+        bench_export(args.rows, args.repeat)
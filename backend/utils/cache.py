@@ -0,0 +1,248 @@
+# utils/cache.py
+# PURPOSE : per-user response cache for the vitals read endpoints (summary, trends, dashboard).
+#
+#   - key   = (user_id, endpoint, params), where params include the user's vitals_version,
+#             so an entry written by a request that raced a vitals write is never served
+#   - value = the serialized JSON body (bytes), returned as-is on a hit
+#   - LRU + TTL eviction, explicit invalidate_user() from the vitals write handlers
+#
+# Backends (env CACHE_BACKEND):
+#   memory (default) : in-process OrderedDict, one cache per uvicorn worker
+#   redis            : shared by every worker, env CACHE_URL (redis://host:6379/0),
+#                      needs the `redis` package; any client with the same few methods works
+#                      (e.g. a fakeredis / dict-based stand-in in tests)
+#   off              : no caching
+#
+# The async endpoints (cached_json_async / invalidate_user_async) call the memory backend straight
+# from the event loop (a dict access); a backend with `blocking = True` (Redis: a sync client, a
+# network round trip each call) is called in the threadpool, so a slow Redis only holds that
+# request, not every coroutine of the worker.
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils.principals import Principal
+from utils.responses import dumps
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+# ---------------------------
+# Backends
+# ---------------------------
+
+class MemoryBackend:
+    """In-process LRU + TTL cache (thread safe, the sync endpoints run in a threadpool)."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: int = CACHE_TTL_SECONDS, stats: Optional[CacheStats] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._data: "OrderedDict[tuple, tuple[float, bytes]]" = OrderedDict()  # (user_id, key) -> (expires, body)
+        self._by_user: Dict[int, set] = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, full_key: tuple) -> None:
+        self._data.pop(full_key, None)
+        keys = self._by_user.get(full_key[0])
+        if keys is not None:
+            keys.discard(full_key)
+            if not keys:
+                del self._by_user[full_key[0]]
+
+    def get(self, user_id: int, key: str) -> Optional[bytes]:
+        full_key = (user_id, key)
+        with self._lock:
+            item = self._data.get(full_key)
+            if item is None:
+                return None
+            expires, body = item
+            if expires < time.monotonic():
+                self._drop(full_key)
+                self.stats.incr("evictions")
+                return None
+            self._data.move_to_end(full_key)  # most recently used
+            return body
+
+    def set(self, user_id: int, key: str, body: bytes) -> None:
+        full_key = (user_id, key)
+        with self._lock:
+            self._data[full_key] = (time.monotonic() + self.ttl, body)
+            self._data.move_to_end(full_key)
+            self._by_user.setdefault(user_id, set()).add(full_key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.stats.incr("evictions")
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for full_key in list(self._by_user.get(user_id, ())):
+                self._drop(full_key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+
+
+class RedisBackend:
+    """
+    Shared cache on a Redis-compatible server.
+
+    One hash per user (`vitals-cache:<user_id>`, field = key) so invalidating a user is a single DEL.
+    Entries carry their own expiry (checked on read) and the hash gets an EXPIRE as a backstop;
+    LRU under memory pressure is left to the server (maxmemory-policy allkeys-lru).
+    """
+
+    PREFIX = "vitals-cache:"
+    blocking = True  # network I/O: async callers go through the threadpool
+
+    def __init__(self, client=None, url: str = CACHE_URL, ttl: int = CACHE_TTL_SECONDS, stats: Optional[CacheStats] = None):
+        if client is None:
+            import redis  # optional dependency, only needed for CACHE_BACKEND=redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+
+    def get(self, user_id: int, key: str) -> Optional[bytes]:
+        raw = self.client.hget(self.PREFIX + str(user_id), key)
+        if raw is None:
+            return None
+        expires, body = raw.split(b"|", 1)
+        if float(expires) < time.time():
+            self.client.hdel(self.PREFIX + str(user_id), key)
+            self.stats.incr("evictions")
+            return None
+        return body
+
+    def set(self, user_id: int, key: str, body: bytes) -> None:
+        name = self.PREFIX + str(user_id)
+        self.client.hset(name, key, b"%f|" % (time.time() + self.ttl) + body)
+        self.client.expire(name, self.ttl)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self.client.delete(self.PREFIX + str(user_id))
+
+    def clear(self) -> None:
+        for name in self.client.scan_iter(match=self.PREFIX + "*"):
+            self.client.delete(name)
+
+
+class NullBackend:
+    blocking = False
+
+    def __init__(self, stats: Optional[CacheStats] = None):
+        self.stats = stats or CacheStats()
+
+    def get(self, user_id, key):
+        return None
+
+    def set(self, user_id, key, body):
+        pass
+
+    def invalidate_user(self, user_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _make_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisBackend()
+    if CACHE_BACKEND == "off":
+        return NullBackend()
+    return MemoryBackend()
+
+
+backend = _make_backend()
+
+
+# ---------------------------
+# API used by the routers
+# ---------------------------
+
+def make_key(endpoint: str, version: int, params: dict) -> str:
+    parts = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    return f"{endpoint}:v{version}:{parts}"
+
+
+def cached_json(user: Principal, endpoint: str, params: dict, build: Callable[[], dict]) -> bytes:
+    """Serialized body from the cache, or build() it, serialize and store it."""
+    # read both up front: build() may end the session's transaction and expire `user`
+    user_id, key = user.id, make_key(endpoint, user.vitals_version, params)
+    body = backend.get(user_id, key)
+    if body is not None:
+        backend.stats.incr("hits")
+        return body
+    backend.stats.incr("misses")
+    body = dumps(build())
+    backend.set(user_id, key, body)
+    return body
+
+
+async def _call(fn, *args):
+    """A backend call from the event loop: directly, or in the threadpool if it blocks."""
+    if backend.blocking:
+        return await run_in_threadpool(fn, *args)
+    return fn(*args)
+
+
+async def cached_json_async(user: Principal, endpoint: str, params: dict, build: Callable[[], Awaitable[dict]]) -> bytes:
+    """cached_json() for the async endpoints: build() returns an awaitable."""
+    user_id, key = user.id, make_key(endpoint, user.vitals_version, params)
+    body = await _call(backend.get, user_id, key)
+    if body is not None:
+        backend.stats.incr("hits")
+        return body
+    backend.stats.incr("misses")
+    body = dumps(await build())
+    await _call(backend.set, user_id, key, body)
+    return body
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop every cached response of a user (call after a vitals write commits)."""
+    backend.invalidate_user(user_id)
+    backend.stats.incr("invalidations")
+
+
+async def invalidate_user_async(user_id: int) -> None:
+    """invalidate_user() for the async endpoints."""
+    await _call(backend.invalidate_user, user_id)
+    backend.stats.incr("invalidations")
+
+
+def stats() -> Dict[str, int]:
+    return backend.stats.snapshot()
+
+
+def collect():
+    """utils.metrics collector: this worker's cache counters."""
+    for event, n in stats().items():
+        yield "counter", "cache_events_total", (("event", event),), n
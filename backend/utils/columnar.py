@@ -0,0 +1,113 @@
+# utils/columnar.py
+# PURPOSE : Arrow IPC / Parquet encoding of streamed vitals rows (analytics export).
+#
+#   - one Arrow record batch per fetched chunk of rows (Parquet: one row group per batch)
+#   - the writer's output is drained after every batch, so the download streams with bounded memory
+#   - timestamps come in as epoch microseconds (BIGINT from PostgreSQL) and are typed as
+#     timestamp[us, UTC] without building a Python datetime per cell
+#
+# pyarrow is optional (pip install pyarrow), only needed for format=parquet / arrow.
+from typing import Iterable, Iterator, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the deployment
+    pa = pq = None
+
+FORMATS = ("parquet", "arrow")
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# column name -> arrow type name (see _arrow_type)
+COLUMN_TYPES = {
+    "id": "int32",
+    "user_id": "int32",
+    "recorded_at": "timestamp",
+    "systolic_bp": "int32",
+    "diastolic_bp": "int32",
+    "heart_rate": "int32",
+    "temperature": "float64",
+    "glucose": "float64",
+    "notes": "string",
+    "created_at": "timestamp",
+}
+TIMESTAMP_COLUMNS = tuple(c for c, t in COLUMN_TYPES.items() if t == "timestamp")
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _arrow_type(name: str):
+    if name == "timestamp":
+        return pa.timestamp("us", tz="UTC")
+    return getattr(pa, name)()
+
+
+def schema(columns: Sequence[str]):
+    return pa.schema([(c, _arrow_type(COLUMN_TYPES[c])) for c in columns])
+
+
+def record_batch(rows: Sequence[tuple], sch) -> "pa.RecordBatch":
+    """Row tuples (timestamps as epoch microseconds) -> one RecordBatch of the given schema."""
+    columns = list(zip(*rows)) if rows else [()] * len(sch)
+    arrays = []
+    for field, values in zip(sch, columns):
+        if pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(values, pa.int64()).cast(field.type))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=sch)
+
+
+class _Drain:
+    """Write-only file object for the pyarrow writers: keeps what was written until take()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet records row group offsets from tell(), so it must count everything ever written
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def take(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def stream(partitions: Iterable[Sequence[tuple]], columns: Sequence[str], format: str) -> Iterator[bytes]:
+    """Encode chunks of row tuples as an Arrow IPC stream or a Parquet file, yielding bytes as they're ready."""
+    sch = schema(columns)
+    sink = _Drain()
+    if format == "parquet":
+        writer = pq.ParquetWriter(sink, sch, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, sch)
+
+    try:
+        for rows in partitions:
+            writer.write_batch(record_batch(rows, sch))
+            yield sink.take()
+    finally:
+        writer.close()  # Parquet footer / Arrow end-of-stream marker
+    yield sink.take()
@@ -0,0 +1,70 @@
+# utils/conditional.py
+# PURPOSE : ETag / If-None-Match support for the per-user vitals read endpoints.
+#
+# Every user row carries a `vitals_version` counter that the vitals write handlers bump
+# in the same transaction as the write. The ETag of a read is derived from
+#   (user id, vitals_version, request path + query, current UTC hour)
+# so checking it needs nothing but the principal from oauth2.get_versioned_principal*
+# (cached user + a primary key lookup of vitals_version): a matching If-None-Match is
+# answered with 304 without touching the vitals table.
+#
+# The hour is part of the tag because 7d / 30d windows (and "entries this week") slide
+# with time even when nothing was written; a cached copy is revalidated at least hourly.
+import hashlib
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import models
+from utils.principals import Principal
+from utils.responses import FastJSONResponse
+
+# browsers keep the copy but always ask first (If-None-Match) before using it
+CACHE_CONTROL = "private, no-cache"
+
+
+def bump_version(db: Session, user_id: int) -> None:
+    """Invalidate every ETag of this user (call inside the write's transaction)."""
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(vitals_version=models.User.vitals_version + 1)
+    )
+
+
+def etag_for(user: Principal, request: Request) -> str:
+    hour = datetime.utcnow().strftime("%Y%m%d%H")
+    key = f"{user.id}:{user.vitals_version}:{request.url.path}?{request.url.query}:{hour}"
+    return 'W/"%s"' % hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison: W/"x" and "x" are the same tag
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def conditional_json(request: Request, user: Principal, build: Callable[[], dict]) -> Response:
+    """304 if the client's copy is current, otherwise build() the payload and tag it."""
+    etag = etag_for(user, request)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FastJSONResponse(build(), headers=headers)
+
+
+async def conditional_json_async(request: Request, user: Principal, build: Callable[[], Awaitable[dict]]) -> Response:
+    """conditional_json() for the async endpoints: build() returns an awaitable."""
+    etag = etag_for(user, request)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FastJSONResponse(await build(), headers=headers)
@@ -0,0 +1,120 @@
+# utils/dbpool.py
+# PURPOSE : connection pool settings from the environment + live pool metrics.
+#
+#   - settings()   : pool size / overflow / timeout / recycle / pre-ping / statement_timeout
+#                    read from env (see the table below), shared by the sync and async engines
+#   - TimedQueuePool / TimedAsyncQueuePool : the default SQLAlchemy pools, plus a histogram of
+#                    how long each checkout waited for a connection and a count of checkout timeouts
+#   - pool_status(): checked out / idle / overflow / wait histogram of an engine's pool
+#                    (served by GET /db/pool, and by /metrics through collect())
+#
+# Env variables (defaults in brackets):
+#   DB_POOL_SIZE [5]              connections kept open per engine, per worker process
+#   DB_MAX_OVERFLOW [10]          extra connections opened under load, closed when returned
+#   DB_POOL_TIMEOUT [30]          seconds a request waits for a connection before failing
+#   DB_POOL_RECYCLE [1800]        seconds before a connection is replaced (-1 = never); keeps
+#                                 connections younger than proxy / load balancer idle cut-offs
+#   DB_POOL_PRE_PING [true]       test each connection on checkout, reconnect if it went away
+#   DB_STATEMENT_TIMEOUT_MS [0]   server-side statement_timeout of every connection (0 = none);
+#                                 also applies to the python -m utils.* tools, unset it for a long rebuild
+#
+# Every uvicorn worker has its own pools, so the database sees up to
+#   workers * 2 engines * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+import os
+import time
+from typing import Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from utils.metrics import Histogram
+
+# upper bounds of the wait-time buckets, in milliseconds (the last bucket is +Inf)
+WAIT_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def settings() -> Dict[str, object]:
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "statement_timeout_ms": int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")),
+    }
+
+
+class _TimedPool:
+    """Mixin for a QueuePool: time every checkout, count the ones that time out."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_ms = Histogram(WAIT_BUCKETS_MS)
+        self.timeouts = 0
+
+    def _do_get(self):
+        # includes opening a new connection when the pool grows (that is waiting too)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait_ms.observe((time.perf_counter() - start) * 1000)
+
+    def recreate(self):
+        # engine.dispose() / a lost server swap the pool object: keep the metrics
+        new = super().recreate()
+        new.wait_ms, new.timeouts = self.wait_ms, self.timeouts
+        return new
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_kwargs(config: Dict[str, object]) -> Dict[str, object]:
+    """create_engine / create_async_engine keyword arguments for the pool part of `config`."""
+    return {k: config[k] for k in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping")}
+
+
+def pool_status(engine) -> dict:
+    """Live numbers of an engine's pool (sync Engine or AsyncEngine)."""
+    pool = getattr(engine, "sync_engine", engine).pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # QueuePool.overflow() is negative while the pool hasn't opened pool_size connections yet
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+    if isinstance(pool, _TimedPool):
+        status["timeouts"] = pool.timeouts
+        status["wait_ms"] = pool.wait_ms.snapshot()
+    return status
+
+
+def collect(engines: Dict[str, object]):
+    """utils.metrics collector: pool gauges, wait histogram and timeouts, labelled by engine name."""
+    for name, engine in engines.items():
+        pool = getattr(engine, "sync_engine", engine).pool
+        label = (("engine", name),)
+        yield "gauge", "db_pool_connections", label + (("state", "checked_out"),), pool.checkedout()
+        yield "gauge", "db_pool_connections", label + (("state", "idle"),), pool.checkedin()
+        yield "gauge", "db_pool_connections", label + (("state", "overflow"),), max(pool.overflow(), 0)
+        if isinstance(pool, _TimedPool):
+            yield "counter", "db_pool_checkout_timeouts_total", label, pool.timeouts
+            yield "histogram", "db_pool_checkout_wait_milliseconds", label, pool.wait_ms
@@ -0,0 +1,84 @@
+# utils/downsample.py
+# PURPOSE : shrink long chart series to a fixed number of points without losing their shape.
+#
+# Largest-Triangle-Three-Buckets (LTTB, Steinarsson 2013):
+#   - first and last points are always kept
+#   - the rest is split into equal buckets, and from each bucket we keep the point that forms
+#     the largest triangle with the previously kept point and the average of the next bucket
+#   - a spike is by definition far from its neighbours, so it wins its bucket and stays visible
+from typing import List, Optional, Sequence
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """Return the (sorted) indices of the points LTTB keeps out of xs / ys."""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)  # bucket size (without first / last point)
+    kept = [0]
+    a = 0  # index of the last kept point
+
+    for i in range(threshold - 2):
+        # average point of the NEXT bucket (the third corner of the triangle)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        # pick the point in THIS bucket with the largest triangle area
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+
+    kept.append(n - 1)
+    return kept
+
+
+def downsample_rows(rows: Sequence, x_of, series: dict, max_points: Optional[int]) -> List[int]:
+    """
+    Pick which rows to keep so every series is downsampled with LTTB.
+
+    Args:
+        rows: the full, time-ordered rows.
+        x_of: row -> x value (e.g. a timestamp as float).
+        series: name -> (row -> y value or None). None values are skipped for that series.
+        max_points: upper bound on the number of rows returned (None = keep everything).
+
+    Returns:
+        Sorted row indices. Each series gets an equal share of the budget and the union is
+        returned, so the result never exceeds max_points.
+    """
+    n = len(rows)
+    if not max_points or n <= max_points:
+        return list(range(n))
+    if max_points < 3:  # LTTB needs the first point, the last one and at least one bucket
+        return [0, n - 1][:max_points]
+
+    # only series that actually have data take a share of the budget
+    present = {}
+    for name, y_of in series.items():
+        idx = [i for i, r in enumerate(rows) if y_of(r) is not None]
+        if idx:
+            present[name] = (idx, y_of)
+    if not present:
+        return lttb_indices([x_of(r) for r in rows], [0.0] * n, max_points)
+
+    # every series needs a share of at least 3; with a tiny budget the last ones get none
+    names = list(present)[: max_points // 3]
+    share = max_points // len(names)
+    keep = set()
+    for idx, y_of in (present[name] for name in names):
+        xs = [x_of(rows[i]) for i in idx]
+        ys = [float(y_of(rows[i])) for i in idx]
+        keep.update(idx[k] for k in lttb_indices(xs, ys, share))
+
+    return sorted(keep)
@@ -0,0 +1,158 @@
+# utils/explain.py
+# PURPOSE : look at the query plans of the real endpoint statements (EXPLAIN).
+#           tests/test_vitals_indexes.py asserts the check_indexes plans against a real database.
+#
+#   - plan()        : EXPLAIN (FORMAT JSON) of a SQLAlchemy statement -> root plan node
+#   - walk()        : every node of a plan
+#   - index_checks  : the hot vitals reads must use the covering index (index-only where they
+#                     only need metrics), "rows added since" must use the BRIN index;
+#                     check_indexes prints them
+#   - check_directory : the user directory (GET /users/) pages never scan the whole users table
+#                     (trigram / username / (role, username) indexes), with their run time
+#
+# Command line (run from the backend folder):
+#   python -m utils.explain [--user 1] [--directory]
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Set, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+import models
+
+COVERING_INDEX = "ix_vitals_user_recorded_covering"
+BRIN_INDEX = "ix_vitals_created_at_brin"
+BRIN_PAGES_PER_RANGE = 128  # PostgreSQL's default
+
+
+def plan(db: Session, stmt) -> dict:
+    """Root node of the plan PostgreSQL picks for `stmt` (parameters are inlined by the driver)."""
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    raw = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    return (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+
+
+def walk(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def index_family(db: Session, name: str) -> Set[str]:
+    """An index plus the per-partition indexes attached to it (on a partitioned vitals table)."""
+    children = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:n)"
+    ), {"n": name}).scalars().all()
+    return {name, *children}
+
+
+def _small_relations(db: Session, max_pages: int = 0) -> Set[str]:
+    """vitals tables / partitions of at most `max_pages` data pages (per the last VACUUM / ANALYZE)."""
+    return set(db.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relpages <= :n AND relname LIKE :p"
+    ), {"n": max_pages, "p": models.Vital.__tablename__ + "%"}).scalars().all())
+
+
+def index_checks(db: Session, user_id: int = 1) -> List[Tuple[str, bool, List[str]]]:
+    """[(label, uses the expected index, scan nodes on vitals)] for each hot read."""
+    from routers import summary, trends, recent  # late import: routers import the app's models / utils
+
+    V = models.Vital
+    naive_now = datetime.utcnow()
+    cases = [
+        # (label, statement, index, index-only expected)
+        ("summary 7d", summary._summary_stmt(user_id, "7d", naive_now), COVERING_INDEX, True),
+        ("summary 30d edges", summary._rollup_summary_stmt(user_id, "30d", naive_now), COVERING_INDEX, True),
+        ("trends 7d raw", trends._raw_stmt(user_id, trends._date_window("7d")), COVERING_INDEX, True),
+        ("recent 10", recent._recent_stmt(user_id, 10), COVERING_INDEX, False),
+        ("rows added 1h", select(func.count()).where(
+            V.created_at >= datetime.now(timezone.utc) - timedelta(hours=1)), BRIN_INDEX, False),
+    ]
+
+    results = []
+    for label, stmt, index, index_only in cases:
+        family = index_family(db, index)
+        scans: List[dict] = [n for n in walk(plan(db, stmt))
+                             if n.get("Relation Name", "").startswith(V.__tablename__)
+                             or n.get("Index Name") in family]
+        used = [n for n in scans if n.get("Index Name") in family]
+        good = bool(used) and (not index_only or all(n["Node Type"] == "Index Only Scan" for n in used))
+        # anything reading vitals some other way (seq scan, another index) is a miss too,
+        # except on empty partitions (vitals_default, months ahead) where a seq scan is free, and
+        # for BRIN on partitions of a few block ranges, where skipping ranges saves next to
+        # nothing (created_at isn't the partition key, so "rows added since" visits every month)
+        skip = _small_relations(db, 4 * BRIN_PAGES_PER_RANGE if index == BRIN_INDEX else 0)
+        others = [n for n in scans if n not in used and n["Node Type"] != "Bitmap Heap Scan"
+                  and n.get("Relation Name") not in skip]
+        good &= not others
+        types = sorted({f'{n["Node Type"]} ({n.get("Index Name", "-")})' for n in scans})
+        results.append((label, good, types))
+    return results
+
+
+def check_indexes(db: Session, user_id: int = 1) -> bool:
+    """Print the vitals access path of each hot read; False if one doesn't use the expected index."""
+    ok = True
+    for label, good, types in index_checks(db, user_id):
+        ok &= good
+        print(f"{'ok ' if good else 'BAD'} {label:18s} {', '.join(types)}")
+    return ok
+
+
+def check_directory(db: Session, runs: int = 5) -> bool:
+    """Print the access path and median run time of directory pages; False on a users seq scan."""
+    from routers import user  # late import: routers import the app's models / utils
+
+    middle = db.execute(select(models.User.username).order_by(models.User.username)
+                        .offset(db.execute(select(func.count()).select_from(models.User)).scalar() // 2)
+                        .limit(1)).scalar()
+    cases = [
+        # (label, q, match, role, after)
+        ("browse first page", None, "substring", None, None),
+        ("browse middle page", None, "substring", None, middle),
+        ("role=provider", None, "substring", "provider", None),
+        ("substring common", "smith", "substring", None, None),
+        ("substring rare", "ith4242", "substring", None, None),
+        ("substring no match", "zzqx", "substring", None, None),
+        ("prefix", "karen_lee", "prefix", None, None),
+        ("email domain", "clinic.org", "substring", None, None),
+        ("role + substring", "nguyen77", "substring", "staff", None),
+    ]
+
+    ok = True
+    for label, q, match, role, after in cases:
+        stmt = user._directory_stmt(q, match, role, after, 50)
+        nodes = list(walk(plan(db, stmt)))
+        good = not any(n["Node Type"] == "Seq Scan" and n.get("Relation Name") == models.User.__tablename__
+                       for n in nodes)
+        ok &= good
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            rows = db.execute(stmt).all()
+            times.append((time.perf_counter() - start) * 1000)
+        types = sorted({f'{n["Node Type"]} ({n["Index Name"]})' for n in nodes if "Index Name" in n}
+                       | {n["Node Type"] for n in nodes if n["Node Type"] == "Seq Scan"})
+        print(f"{'ok ' if good else 'BAD'} {label:20s} {sorted(times)[runs // 2]:8.2f} ms  {len(rows):3d} rows  "
+              f"{', '.join(types)}")
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Check that the hot vitals reads use their indexes")
+    parser.add_argument("--user", type=int, default=1)
+    parser.add_argument("--directory", action="store_true", help="check the user directory queries instead")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.directory:
+            sys.exit(0 if check_directory(db) else 1)
+        sys.exit(0 if check_indexes(db, args.user) else 1)
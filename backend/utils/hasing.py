@@ -1,17 +1,131 @@
+# utils/hasing.py
+# PURPOSE : password hashing (passlib / bcrypt).
+#
+#   - hash_password / verify_password : blocking, for scripts and other sync code
+#   - hash_password_async / verify_and_update_async / hash_passwords_async (bulk provisioning) :
+#     for the request handlers. bcrypt runs in a small dedicated process pool (HASH_WORKERS
+#     processes), so a burst of logins holds neither the event loop nor the threadpool the sync
+#     endpoints run in, and can't take more than HASH_WORKERS CPUs away from them
+#   - at most HASH_MAX_PENDING hashes queued or running per API worker: beyond that HashingBusy
+#     is raised straight away (main.py answers 503 + Retry-After) instead of letting logins
+#     queue up for seconds. hash_passwords_async is exempt: it never has more than HASH_WORKERS
+#     hashes in the pool and waits its turn behind the logins, so a login burst slows a bulk
+#     upload down instead of failing it half way
+#   - rehash on login: verify_and_update_async also returns a new hash when the stored one uses
+#     a deprecated scheme (anything after the first of PASSWORD_SCHEMES) or fewer bcrypt rounds
+#     than BCRYPT_ROUNDS; the login route saves it
+#   - metrics (utils/metrics.py): password_hash_seconds{op} (queue wait + hashing),
+#     password_hash_rejected_total{op}, password_hash_in_flight
+#
+# Env: BCRYPT_ROUNDS [12], PASSWORD_SCHEMES [bcrypt] (comma separated, first one is used for new
+#      hashes), HASH_WORKERS [min(2, CPUs)], HASH_MAX_PENDING [32]
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
 
 from passlib.context import CryptContext
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
 
-from database import get_db
+from utils import metrics
 
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_SCHEMES = [s.strip() for s in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if s.strip()]
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "32"))
 
+HASH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=PASSWORD_SCHEMES,
+    deprecated="auto",                 # every scheme but the first needs a rehash
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,  # weaker hashes (older, lower setting) need a rehash
+)
 
 def hash_password(password: str):
     return pwd_context.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash to store or None)"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# ---------------------------
+# Process pool for the request handlers
+# ---------------------------
+
+class HashingBusy(Exception):
+    """Too many password hashes queued in this worker, try again shortly."""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn, not fork: the API process has an event loop, threads and open DB connections
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+async def _run(op: str, fn, *args, wait: bool = False):
+    """fn(*args) on the pool; HashingBusy if HASH_MAX_PENDING are pending, unless `wait`."""
+    global _pool, _pending
+    with _lock:
+        if _pending >= HASH_MAX_PENDING and not wait:
+            metrics.registry.inc("password_hash_rejected_total", (("op", op),))
+            raise HashingBusy()
+        _pending += 1
+
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor(), fn, *args)
+    except BrokenProcessPool:
+        with _lock:
+            _pool = None  # a hashing process died: start a fresh pool on the next call
+        raise
+    finally:
+        with _lock:
+            _pending -= 1
+        metrics.registry.observe("password_hash_seconds", (("op", op),), time.perf_counter() - start, HASH_BUCKETS)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run("hash", hash_password, password)
+
+
+async def verify_and_update_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    return await _run("verify", verify_and_update, plain_password, hashed_password)
+
+
+async def hash_passwords_async(passwords: List[str]) -> List[str]:
+    """
+    Hash many passwords (bulk provisioning) on all HASH_WORKERS processes. At most HASH_WORKERS
+    of them are queued at a time, so logins arriving meanwhile wait for one hash, not the batch.
+    Never raises HashingBusy: under login load each hash waits in the pool queue instead.
+    """
+    window = asyncio.Semaphore(HASH_WORKERS)
+
+    async def one(password: str) -> str:
+        async with window:
+            return await _run("hash", hash_password, password, wait=True)
+
+    return list(await asyncio.gather(*(one(p) for p in passwords)))
+
+
+def _collect():
+    yield "gauge", "password_hash_in_flight", (), _pending
+
+metrics.add_collector(_collect)
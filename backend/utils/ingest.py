@@ -0,0 +1,297 @@
+# utils/ingest.py
+# PURPOSE : bulk import of vitals (device history, spreadsheet export) for POST /vitals/bulk.
+#           read_upload / detect_format / parse_records are shared with POST /admin/users/bulk
+#           (utils/provisioning.py).
+#
+#   - parse    : JSON array, NDJSON (one object per line) or CSV with a header row
+#   - validate : every row goes through schemas.VitalsCreate, a bad row only rejects itself
+#   - insert   : COPY ... FROM STDIN per chunk of valid rows into a temp staging table, then one
+#                INSERT ... SELECT into vitals and one grouped rollup merge from the same staging
+#                rows, version bump, commit (one transaction per chunk, never one giant one)
+#   - limits   : UPLOAD_MAX_BYTES [20 MB] per body (413), INGEST_MAX_ROWS [100000] rows per upload
+#                (400, checked before the first chunk is written)
+#
+# A database error part way through can't undo the chunks already committed: IngestAborted carries
+# what was stored (inserted, and stopped_at_row, the first row not stored) so the client can resume.
+import csv
+import io
+import itertools
+import os
+from datetime import timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+import psycopg2
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, Table, Text, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+import models, schemas
+from utils import rollups, conditional, cache
+
+FORMATS = ("json", "ndjson", "csv")
+
+CHUNK_ROWS = 5000        # valid rows per COPY / commit
+MAX_REPORTED_ERRORS = 1000
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+INGEST_MAX_ROWS = int(os.getenv("INGEST_MAX_ROWS", "100000"))
+
+COLUMNS = ("user_id", "recorded_at", "systolic_bp", "diastolic_bp",
+           "heart_rate", "temperature", "glucose", "notes")
+
+# per-connection temp table the COPY lands in, emptied by every commit
+# (own MetaData so create_all() at startup never sees it)
+STAGING = Table(
+    "vitals_import", MetaData(),
+    Column("user_id", Integer),
+    Column("recorded_at", DateTime(timezone=True)),
+    Column("systolic_bp", Integer),
+    Column("diastolic_bp", Integer),
+    Column("heart_rate", Integer),
+    Column("temperature", Float),
+    Column("glucose", Float),
+    Column("notes", Text),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DELETE ROWS",
+)
+
+_CONTENT_TYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/jsonlines": "ndjson",
+    "text/csv": "csv",
+    "application/csv": "csv",
+}
+_EXTENSIONS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+
+
+def detect_format(content_type: Optional[str], filename: Optional[str] = None) -> Optional[str]:
+    """json / ndjson / csv from a Content-Type header or a file name, None if unknown."""
+    if content_type:
+        fmt = _CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+        if fmt:
+            return fmt
+    if filename:
+        for ext, fmt in _EXTENSIONS.items():
+            if filename.lower().endswith(ext):
+                return fmt
+    return None
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload larger than {max_bytes} bytes",
+    )
+
+
+async def read_upload(request: Request, format: Optional[str] = None,
+                      max_bytes: int = UPLOAD_MAX_BYTES) -> Tuple[bytes, str]:
+    """
+    (body, format) of an upload sent raw or as a multipart `file` field. `format` (query
+    parameter) overrides the Content-Type / file name. 400 / 413 / 415 HTTPException otherwise.
+    """
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise _too_large(max_bytes)
+
+    content_type = request.headers.get("content-type", "")
+    filename = None
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing file upload")
+        if upload.size is not None and upload.size > max_bytes:  # chunked, no Content-Length
+            raise _too_large(max_bytes)
+        body = await upload.read()
+        content_type, filename = upload.content_type, upload.filename
+    else:
+        # streamed so a chunked body without Content-Length stops at the limit too
+        parts, size = [], 0
+        async for part in request.stream():
+            size += len(part)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            parts.append(part)
+        body = b"".join(parts)
+
+    fmt = format or detect_format(content_type, filename)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send application/json, application/x-ndjson or text/csv",
+        )
+    return body, fmt
+
+
+# ---------------------------
+# Parsing
+# ---------------------------
+
+class RowError(Exception):
+    """A single row that can't be parsed (reported, the rest of the upload goes on)."""
+
+
+def parse_records(body: bytes, fmt: str, required_column: str = "recorded_at") -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (row number, record) pairs, row numbers start at 1 (CSV: first line after the header).
+    A record that can't be decoded is yielded as a RowError. A body that isn't the announced
+    format at all (or a CSV header without `required_column`) raises ValueError.
+    """
+    if fmt == "json":
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e}")
+        if not isinstance(data, list):
+            raise ValueError("expected a JSON array")
+        yield from enumerate(data, start=1)
+
+    elif fmt == "ndjson":
+        row = 0
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                yield row, orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                yield row, RowError(f"invalid JSON: {e}")
+
+    elif fmt == "csv":
+        try:
+            text = body.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise ValueError("CSV must be UTF-8")
+        reader = csv.DictReader(io.StringIO(text, newline=""))
+        if not reader.fieldnames or required_column not in [f.strip() for f in reader.fieldnames]:
+            raise ValueError(f"CSV header must include a {required_column} column")
+        for row, rec in enumerate(reader, start=1):
+            # empty cells are missing values, unknown columns are ignored like in the JSON body
+            yield row, {k.strip(): (v if v != "" else None) for k, v in rec.items() if k is not None}
+
+    else:
+        raise ValueError(f"unsupported format {fmt!r}")
+
+
+# ---------------------------
+# Validation
+# ---------------------------
+
+def error_messages(err: ValidationError) -> List[str]:
+    out = []
+    for e in err.errors(include_url=False, include_input=False, include_context=False):
+        loc = ".".join(str(p) for p in e["loc"])
+        out.append(f"{loc}: {e['msg']}" if loc else e["msg"])
+    return out
+
+
+def validate_batch(user_id: int, batch: Iterable[Tuple[int, Any]]):
+    """Validated COPY tuples and [(row, [messages])] for the rows that were rejected."""
+    rows, errors = [], []
+    for row, rec in batch:
+        if isinstance(rec, RowError):
+            errors.append((row, [str(rec)]))
+            continue
+        if not isinstance(rec, dict):
+            errors.append((row, ["expected an object"]))
+            continue
+        try:
+            v = schemas.VitalsCreate.model_validate(rec)
+        except ValidationError as e:
+            errors.append((row, error_messages(e)))
+            continue
+        recorded_at = v.recorded_at
+        if recorded_at.tzinfo is None:
+            recorded_at = recorded_at.replace(tzinfo=timezone.utc)  # same rule as rollups.day_of
+        rows.append((user_id, recorded_at, v.systolic_bp, v.diastolic_bp,
+                     v.heart_rate, v.temperature, v.glucose, v.notes or None))
+    return rows, errors
+
+
+# ---------------------------
+# Insert
+# ---------------------------
+
+def copy_rows(db: Session, rows: List[tuple], table: Table = models.Vital.__table__) -> None:
+    """COPY the rows into `table` on the session's connection (part of its transaction)."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)  # None -> unquoted empty field -> NULL
+    buf.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+    finally:
+        cursor.close()
+
+
+def _chunks(records: Iterator[Tuple[int, Any]], size: int):
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestAborted(Exception):
+    """A database error stopped the import; `result` is what was committed before it."""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(f"import stopped at row {result['stopped_at_row']}")
+        self.result = result
+
+
+def ingest(db: Session, user_id: int, records: Iterator[Tuple[int, Any]], chunk_rows: int = CHUNK_ROWS,
+           max_rows: int = INGEST_MAX_ROWS) -> Dict[str, Any]:
+    """
+    Validate and insert parsed records for one user, committing after every chunk.
+
+    Returns {"inserted", "failed", "errors"}; errors lists at most MAX_REPORTED_ERRORS rows.
+    More than `max_rows` records raise ValueError before anything is written, a database
+    error raises IngestAborted with the counts so far and the first row that wasn't stored.
+    """
+    # the body is already in memory (UPLOAD_MAX_BYTES), count the rows before the first commit
+    records = list(itertools.islice(records, max_rows + 1))
+    if len(records) > max_rows:
+        raise ValueError(f"at most {max_rows} rows per upload")
+
+    inserted, failed, errors = 0, 0, []
+    try:
+        for batch in _chunks(iter(records), chunk_rows):
+            rows, bad = validate_batch(user_id, batch)
+            if rows:
+                try:
+                    db.execute(CreateTable(STAGING, if_not_exists=True))
+                    copy_rows(db, rows, STAGING)
+                    cols = [STAGING.c[c] for c in COLUMNS]
+                    db.execute(insert(models.Vital.__table__).from_select(list(COLUMNS), select(*cols)))
+                    rollups.record_staged(db, user_id, STAGING)
+                    conditional.bump_version(db, user_id)
+                    db.commit()
+                except (SQLAlchemyError, psycopg2.Error) as e:  # COPY runs on the raw cursor
+                    db.rollback()
+                    # counts cover the committed chunks only, resending from stopped_at_row is safe
+                    raise IngestAborted({"inserted": inserted, "failed": failed, "errors": errors,
+                                         "stopped_at_row": batch[0][0]}) from e
+                inserted += len(rows)
+
+            failed += len(bad)
+            for row, messages in bad[: max(MAX_REPORTED_ERRORS - len(errors), 0)]:
+                errors.append({"row": row, "errors": messages})
+    finally:
+        if inserted:
+            cache.invalidate_user(user_id)
+
+    return {"inserted": inserted, "failed": failed, "errors": errors}
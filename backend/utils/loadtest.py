@@ -0,0 +1,112 @@
+# utils/loadtest.py
+# PURPOSE : small HTTP load generator to compare endpoint throughput and tail latency
+#           (e.g. the sync vs async routers, pool settings, cache on / off).
+#
+#   - `concurrency` clients (asyncio + aiohttp, one connection each) send requests back to back
+#     for `duration` seconds, cycling through the given paths
+#   - several --token values spread the clients over several users (round robin)
+#   - reports requests/sec, p50 / p90 / p99 / max latency and the non-2xx / failed requests
+#
+# Command line (API running separately, e.g. uvicorn main:app --workers 1):
+#   python -m utils.loadtest --url http://127.0.0.1:8000 --token <JWT> \
+#       --path "/vitals/summary?range=30d" --path /vitals/recent --concurrency 200 --duration 30
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence
+
+import aiohttp
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def _client(client: aiohttp.ClientSession, paths: Sequence[str], headers: dict, offset: int,
+                  until: float, warmup_until: float, latencies: List[float], errors: Dict[str, int]) -> None:
+    i = offset
+    while True:
+        started = time.perf_counter()
+        if started >= until:
+            return
+        path = paths[i % len(paths)]
+        i += 1
+        try:
+            async with client.get(path, headers=headers) as r:
+                await r.read()
+                outcome = None if r.status < 400 else str(r.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            outcome = type(e).__name__
+        finished = time.perf_counter()
+        if outcome:
+            # a failure is counted when it surfaces (a timeout may have started during the warmup)
+            if finished >= warmup_until:
+                errors[outcome] = errors.get(outcome, 0) + 1
+        elif started >= warmup_until:  # connections / caches warm up first, not measured
+            latencies.append(finished - started)
+
+
+async def run(url: str, paths: Sequence[str], tokens: Sequence[str] = (), concurrency: int = 100,
+              duration: float = 10.0, warmup: float = 2.0, timeout: float = 30.0) -> dict:
+    """Run the load and return the measured numbers (latencies in milliseconds)."""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(url, connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as client:
+        start = time.perf_counter()
+        warmup_until = start + warmup
+        until = warmup_until + duration
+        await asyncio.gather(*[
+            _client(client, paths,
+                    {"Authorization": f"Bearer {tokens[n % len(tokens)]}"} if tokens else {},
+                    n, until, warmup_until, latencies, errors)
+            for n in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - warmup_until
+
+    ms = sorted(x * 1000 for x in latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": len(ms),
+        "errors": errors,
+        "rps": round(len(ms) / elapsed, 1),
+        "p50_ms": percentile(ms, 50),
+        "p90_ms": percentile(ms, 90),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": ms[-1] if ms else None,
+    }
+
+
+def format_result(result: dict) -> str:
+    def f(v):
+        return "-" if v is None else f"{v:.1f}"
+    line = (f"c={result['concurrency']:<5d} {result['rps']:>9.1f} req/s  "
+            f"p50 {f(result['p50_ms'])} ms  p90 {f(result['p90_ms'])} ms  "
+            f"p99 {f(result['p99_ms'])} ms  max {f(result['max_ms'])} ms  ({result['requests']} ok)")
+    if result["errors"]:
+        line += "  errors: " + ", ".join(f"{k}={v}" for k, v in sorted(result["errors"].items()))
+    return line
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Measure requests/sec and latency percentiles of API endpoints")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", action="append", required=True, help="path to request (repeatable)")
+    parser.add_argument("--token", action="append", default=[], help="bearer token (repeatable, round robin)")
+    parser.add_argument("--concurrency", "-c", type=int, action="append",
+                        help="concurrent clients (repeatable: one run per value), default 100")
+    parser.add_argument("--duration", "-d", type=float, default=10.0, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each run")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+    args = parser.parse_args()
+
+    for c in args.concurrency or [100]:
+        result = asyncio.run(run(args.url, args.path, args.token, c, args.duration, args.warmup))
+        print(json.dumps(result) if args.json else format_result(result), flush=True)
@@ -0,0 +1,367 @@
+# utils/metrics.py
+# PURPOSE : per-route latency + per-request SQL instrumentation, exported in Prometheus text
+#           format (GET /metrics).
+#
+#   - MetricsMiddleware : ASGI middleware; per route template (/vitals/{vital_id}, not the raw
+#                         path) a request counter by status and latency histogram, plus the number
+#                         of SQL statements each request ran and the time spent in them
+#   - instrument_engine : before/after_cursor_execute listeners (both engines, see database.py);
+#                         they add to the current request's RequestStats, found through a
+#                         ContextVar (threadpool calls and AsyncSession.run_sync see the same object)
+#   - add_collector     : extra values read at export time (response cache counters, pools)
+#   - render()          : Prometheus text exposition
+#
+# Several uvicorn workers (env METRICS_DIR = a directory shared by the workers of one deployment):
+#   each worker writes its numbers to METRICS_DIR/worker-<pid>.json (from a background thread,
+#   about a second after it served requests, and whenever it serves /metrics), and /metrics adds
+#   up the files of every worker, so a scrape sees the whole deployment whichever worker answers
+#   it (other workers' numbers are about a second old).
+#   Counters of stopped workers stay in the totals (like prometheus_client's multiprocess mode),
+#   their gauges are dropped; empty the directory when deploying.
+#   Without METRICS_DIR each worker reports only itself.
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+DUMP_INTERVAL_SECONDS = 1.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+HELP = {
+    "http_requests_total": ("counter", "HTTP requests by route template and status"),
+    "http_request_duration_seconds": ("histogram", "Time to the last byte of the response"),
+    "http_request_db_queries": ("histogram", "SQL statements run by one request"),
+    "http_request_db_seconds": ("histogram", "Time one request spent executing SQL"),
+    "db_queries_total": ("counter", "SQL statements executed"),
+    "db_query_seconds_total": ("counter", "Time spent executing SQL"),
+    "cache_events_total": ("counter", "Response cache hits / misses / evictions / invalidations"),
+    "db_pool_checkout_wait_milliseconds": ("histogram", "Wait for a pooled connection"),
+    "db_pool_checkout_timeouts_total": ("counter", "Checkouts that gave up after DB_POOL_TIMEOUT"),
+    "db_pool_connections": ("gauge", "Pooled connections by state"),
+    "password_hash_seconds": ("histogram", "Password hash / verify time, queue wait included"),
+    "password_hash_rejected_total": ("counter", "Password hashes refused because HASH_MAX_PENDING were queued"),
+    "password_hash_in_flight": ("gauge", "Password hashes queued or running"),
+    "schedule_index_loads_total": ("counter", "Provider schedules loaded into the interval index"),
+    "schedule_index_mismatches_total": ("counter", "Interval index answers the database disagreed with"),
+    "schedule_index_providers": ("gauge", "Provider schedules in the interval index"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram (Prometheus style: cumulative counts in snapshot())."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def state(self) -> Tuple[List[int], float]:
+        """Per-bucket (not cumulative) counts, last one = +Inf, and the sum."""
+        with self._lock:
+            return list(self._counts), self._sum
+
+    def snapshot(self) -> dict:
+        counts, total = self.state()
+        cumulative, running = {}, 0
+        for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": running, "sum": round(total, 3)}
+
+
+class Registry:
+    """Counters and histograms of this process, keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, labels: Labels = (), n: float = 1) -> None:
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + n
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: Sequence[float]) -> None:
+        h = self.histograms.get((name, labels))
+        if h is None:
+            with self._lock:
+                h = self.histograms.setdefault((name, labels), Histogram(buckets))
+        h.observe(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = Registry()
+
+# ("counter" | "gauge" | "histogram", name, labels, value or Histogram), read at export time
+Collector = Callable[[], Iterable[Tuple[str, str, Labels, object]]]
+_collectors: List[Collector] = []
+
+
+def add_collector(fn: Collector) -> None:
+    _collectors.append(fn)
+
+
+# ---------------------------
+# Per-request SQL counting
+# ---------------------------
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# set by the middleware for the duration of a request; the object is shared (not copied)
+# with the threadpool / greenlet contexts the request's code runs in
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    registry.inc("db_queries_total")
+    registry.inc("db_query_seconds_total", n=elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine) -> None:
+    """Count / time every statement of a sync Engine (for an AsyncEngine pass .sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ---------------------------
+# Middleware
+# ---------------------------
+
+def record_request(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+    by_route = (("method", method), ("route", route))
+    registry.inc("http_requests_total", by_route + (("status", str(status)),))
+    registry.observe("http_request_duration_seconds", by_route, seconds, LATENCY_BUCKETS)
+    registry.observe("http_request_db_queries", by_route, stats.queries, QUERY_COUNT_BUCKETS)
+    registry.observe("http_request_db_seconds", by_route, stats.db_seconds, DB_TIME_BUCKETS)
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (not BaseHTTPMiddleware): the clock stops when the last body chunk
+    is sent, so streamed exports are measured whole, and the SQL of their generators counts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500  # unless the app starts a response
+
+        async def send_and_watch(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_watch)
+        finally:
+            _request_stats.reset(token)
+            # the router stores the matched route in the scope; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            record_request(scope["method"], route, status_code, time.perf_counter() - start, stats)
+            mark_dirty()
+
+
+# ---------------------------
+# Snapshot / multi-worker merge
+# ---------------------------
+
+def snapshot() -> dict:
+    """JSON-able numbers of this worker (registry + collectors)."""
+    with registry._lock:
+        counters = [[n, list(l), v] for (n, l), v in registry.counters.items()]
+        histograms = list(registry.histograms.items())
+    hists = []
+    for (n, l), h in histograms:
+        counts, total = h.state()
+        hists.append([n, list(l), list(h.buckets), counts, total])
+    gauges = []
+    for collect in _collectors:
+        for kind, n, l, v in collect():
+            if kind == "histogram":
+                counts, total = v.state()
+                hists.append([n, list(l), list(v.buckets), counts, total])
+            elif kind == "counter":
+                counters.append([n, list(l), v])
+            else:
+                gauges.append([n, list(l), v])
+    return {"pid": os.getpid(), "counters": counters, "histograms": hists, "gauges": gauges}
+
+
+def dump() -> None:
+    """Write this worker's snapshot to METRICS_DIR (atomic replace)."""
+    path = os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+_dirty = threading.Event()
+_flusher: Optional[threading.Thread] = None
+
+
+def _flush_loop() -> None:
+    while True:
+        _dirty.wait()
+        time.sleep(DUMP_INTERVAL_SECONDS)  # batch everything recorded in the meantime
+        _dirty.clear()
+        try:
+            dump()
+        except OSError:
+            pass  # METRICS_DIR gone / full: try again after the next request
+
+
+def mark_dirty() -> None:
+    """Schedule a dump (background thread, file I/O stays off the event loop)."""
+    global _flusher
+    if not METRICS_DIR:
+        return
+    if _flusher is None:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _flusher = threading.Thread(target=_flush_loop, name="metrics-dump", daemon=True)
+        _flusher.start()
+    _dirty.set()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _worker_snapshots() -> List[dict]:
+    if not METRICS_DIR:
+        return [snapshot()]
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    dump()
+    out = []
+    for name in sorted(os.listdir(METRICS_DIR)):
+        if name.startswith("worker-") and name.endswith(".json"):
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced right now, or a partial file from a crash
+    return out
+
+
+def merge(snapshots: Sequence[dict]):
+    """Sum counters and histograms over workers; gauges of live workers get a pid label."""
+    counters: Dict[tuple, float] = {}
+    histograms: Dict[tuple, list] = {}
+    gauges: Dict[tuple, float] = {}
+    for snap in snapshots:
+        for n, l, v in snap["counters"]:
+            key = (n, tuple(map(tuple, l)))
+            counters[key] = counters.get(key, 0) + v
+        for n, l, buckets, counts, total in snap["histograms"]:
+            key = (n, tuple(map(tuple, l)))
+            cur = histograms.get(key)
+            if cur is None or cur[0] != buckets:
+                histograms[key] = [buckets, list(counts), total]
+            else:
+                cur[1] = [a + b for a, b in zip(cur[1], counts)]
+                cur[2] += total
+        if len(snapshots) > 1 and not _alive(snap["pid"]):
+            continue
+        for n, l, v in snap["gauges"]:
+            labels = tuple(map(tuple, l)) + ((("pid", str(snap["pid"])),) if len(snapshots) > 1 else ())
+            gauges[(n, labels)] = v
+    return counters, histograms, gauges
+
+
+# ---------------------------
+# Prometheus text format
+# ---------------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render() -> str:
+    counters, histograms, gauges = merge(_worker_snapshots())
+    by_name: Dict[str, List[str]] = {}
+
+    for (n, l), v in sorted(counters.items()):
+        by_name.setdefault(n, []).append(f"{n}{_labels(l)} {_num(v)}")
+    for (n, l), v in sorted(gauges.items()):
+        by_name.setdefault(n, []).append(f"{n}{_labels(l)} {_num(v)}")
+    for (n, l), (buckets, counts, total) in sorted(histograms.items()):
+        lines = by_name.setdefault(n, [])
+        running = 0
+        for bound, c in zip(list(buckets) + ["+Inf"], counts):
+            running += c
+            lines.append(f"{n}_bucket{_labels(l, (('le', str(bound)),))} {running}")
+        lines.append(f"{n}_sum{_labels(l)} {_num(float(total))}")
+        lines.append(f"{n}_count{_labels(l)} {running}")
+
+    out = []
+    for n in sorted(by_name):
+        kind, text = HELP.get(n, ("untyped", n))
+        out += [f"# HELP {n} {text}", f"# TYPE {n} {kind}", *by_name[n]]
+    return "\n".join(out) + "\n"
@@ -0,0 +1,91 @@
+# utils/partitions.py
+# PURPOSE : maintenance + sanity check of the monthly vitals partitions (migrations/0002).
+#
+#   - maintain() : create the next months' partitions, move rows out of vitals_default,
+#                  optionally detach old months (runs at startup, no-op on an unpartitioned table)
+#   - scanned_partitions() : which vitals partitions a statement's plan really reads (EXPLAIN);
+#                  tests/test_partitions.py asserts that the 7d / 30d summary + trends queries
+#                  skip every month before their window
+#
+# Command line (run from the backend folder):
+#   python -m utils.partitions maintain [--ahead 3] [--retain 24]
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from utils import explain
+
+PARENT = "vitals"
+DEFAULT_PARTITION = "vitals_default"
+
+
+def is_partitioned(db: Session) -> bool:
+    return bool(db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"
+    ), {"t": PARENT}).scalar())
+
+
+def partitions(db: Session) -> List[str]:
+    """Attached partitions of vitals, oldest month first (vitals_default last)."""
+    rows = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t) ORDER BY c.relname"
+    ), {"t": PARENT}).scalars().all()
+    return sorted(rows, key=lambda n: (n == DEFAULT_PARTITION, n))
+
+
+def maintain(db: Session, months_ahead: int = 3, retain_months: Optional[int] = None) -> List[tuple]:
+    """Run vitals_maintain_partitions() -> [(action, partition)]. Caller commits."""
+    if not is_partitioned(db):
+        return []
+    return [tuple(r) for r in db.execute(
+        text("SELECT * FROM vitals_maintain_partitions(:ahead, :retain)"),
+        {"ahead": months_ahead, "retain": retain_months},
+    ).all()]
+
+
+# ---------------------------
+# EXPLAIN based check
+# ---------------------------
+
+def scanned_partitions(db: Session, stmt) -> Dict[str, object]:
+    """
+    EXPLAIN a SQLAlchemy statement and report the vitals partitions its plan reads.
+    Partitions removed at executor start-up (parameters compared to timestamptz) don't appear
+    in the plan, they are only counted in "Subplans Removed".
+    """
+    found: Set[str] = set()
+    removed = 0
+    for node in explain.walk(explain.plan(db, stmt)):
+        removed += node.get("Subplans Removed", 0)
+        rel = node.get("Relation Name")
+        if rel and (rel == PARENT or rel.startswith(PARENT + "_p") or rel == DEFAULT_PARTITION):
+            found.add(rel)
+    return {"scanned": sorted(found), "removed_at_runtime": removed}
+
+
+def _older_than(name: str, lo: datetime) -> bool:
+    """True for a month partition that ends before `lo` (i.e. should have been pruned)."""
+    if not name.startswith(PARENT + "_p"):
+        return False
+    month = datetime.strptime(name[len(PARENT) + 2:], "%Y%m").date()
+    return month < date(lo.year, lo.month, 1)
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the monthly vitals partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("maintain", help="create upcoming partitions, detach old ones")
+    m.add_argument("--ahead", type=int, default=3, help="months to create ahead of the current one")
+    m.add_argument("--retain", type=int, default=None, help="detach partitions older than N months")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        for action, name in maintain(db, args.ahead, args.retain):
+            print(action, name)
+        db.commit()
@@ -0,0 +1,212 @@
+# utils/principals.py
+# PURPOSE : per-worker cache of the authenticated user, so an authenticated request doesn't
+#           have to load the users row every time.
+#
+#   - Principal  : the few user fields the routes actually need (id / role / email / username),
+#                  plus vitals_version when the route asked for it (never cached, see below)
+#   - cache      : LRU + TTL, keyed by user id
+#   - invalidation: ORM after_update / after_delete on models.User drop the entry in this worker;
+#                  other workers pick the change up within PRINCIPAL_TTL_SECONDS
+#
+# vitals_version is bumped by every vitals write, from any worker, with a Core UPDATE (no ORM
+# event), so it is NOT part of the cached principal: routes that build ETags / cache keys from it
+# read it fresh with a one-column primary key lookup (oauth2.get_versioned_principal*).
+#
+# Env: PRINCIPAL_TTL_SECONDS [60], PRINCIPAL_CACHE_SIZE [10000], PRINCIPAL_TTL_SECONDS=0 disables
+#
+# VerifiedTokenCache (used by oauth2.verify_access_token): the claims of a JWT whose signature
+# was already checked, keyed by SHA-256 of the token and kept until the token's own `exp`, so
+# the same bearer token presented again skips jwt.decode. The key is a hash of the whole token:
+# a modified / re-signed token is a different key and goes through full verification.
+# Env: TOKEN_CACHE_SIZE [50000], 0 disables
+#
+# Command line (run from the backend folder), auth cost per request with / without the caches:
+#   python -m utils.principals bench [--n 20000]
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+import models
+
+PRINCIPAL_TTL_SECONDS = float(os.getenv("PRINCIPAL_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "50000"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    role: str
+    email: str
+    username: str
+    vitals_version: Optional[int] = None
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, role=user.role, email=user.email, username=user.username)
+
+
+class PrincipalCache:
+    """Thread-safe LRU + TTL map user id -> Principal (the sync routes run in a threadpool)."""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return item[1]
+
+    def set(self, principal: Principal) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._data.move_to_end(principal.id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+cache = PrincipalCache()
+
+
+class VerifiedTokenCache:
+    """Thread-safe LRU map sha256(token) -> claims, each entry valid until the token's exp."""
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[bytes, tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():  # expired: jwt.decode would reject it now
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, token: str, expires_at: Optional[float], claims) -> None:
+        if self.max_entries <= 0 or expires_at is None:
+            return  # no exp claim: always verify
+        key = self._key(token)
+        with self._lock:
+            self._data[key] = (float(expires_at), claims)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+tokens = VerifiedTokenCache()
+
+
+# a user row changed (role, email, ...) or was deleted through the ORM: forget it here, at flush
+# and again once committed (a request of this worker may re-cache the old row in between)
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        cache.invalidate(user_id)
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+
+def bench(n: int = 20000, user_id: Optional[int] = None) -> None:
+    """Time the auth part of a request (token check + principal) with and without the caches."""
+    import oauth2  # late import: oauth2 imports this module
+    from database import SessionLocal
+    from utils.principals import cache, tokens  # the instances oauth2 uses (not __main__'s under -m)
+
+    with SessionLocal() as db:
+        user = db.get(models.User, user_id) if user_id else db.query(models.User).first()
+        if user is None:
+            raise SystemExit("no user in the database")
+        token = oauth2.create_access_token({"sub": user.id, "role": user.role})
+
+        def per_call_us(fn, rounds):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                fn()
+            return (time.perf_counter() - start) / rounds * 1e6
+
+        def verify():
+            oauth2.verify_access_token(token, oauth2._credentials_exception())
+
+        def principal():
+            db.expunge_all()  # like a new request's session: a miss has to query users
+            return oauth2.get_principal(token, db)
+
+        rows = []
+        for label, fn, rounds in (("verify_access_token", verify, n), ("get_principal", principal, n // 10)):
+            tokens.clear(); cache.clear()
+            saved = tokens.max_entries, cache.ttl
+            tokens.max_entries, cache.ttl = 0, 0  # caches off = the old behaviour
+            try:
+                cold = per_call_us(fn, rounds)
+            finally:
+                tokens.max_entries, cache.ttl = saved
+            fn()  # fill the caches
+            warm = per_call_us(fn, rounds)
+            rows.append((label, cold, warm))
+        db.rollback()
+
+    for label, cold, warm in rows:
+        print(f"{label:20s} uncached {cold:8.1f} us   cached {warm:6.1f} us   ({cold / warm:.0f}x)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Auth caches")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench", help="auth cost per request with / without the caches")
+    b.add_argument("--n", type=int, default=20000)
+    b.add_argument("--user", type=int, default=None)
+    args = parser.parse_args()
+    bench(args.n, args.user)
@@ -0,0 +1,130 @@
+# utils/provisioning.py
+# PURPOSE : bulk creation of patient / provider accounts (clinic onboarding) for
+#           POST /admin/users/bulk, instead of one /admin/providers or /users/ call per account.
+#
+#   - parse    : JSON array, NDJSON or CSV with a header row (email, username, password[, role]),
+#                see utils/ingest.py
+#   - validate : every row goes through schemas.UserProvision (role defaults to the endpoint's
+#                ?role=), a bad row only rejects itself. A row repeating an email / username of
+#                an earlier row of the same upload is a duplicate
+#   - per batch of BATCH_ROWS rows:
+#       one SELECT of the emails / usernames that already exist (no bcrypt spent on those)
+#       bcrypt of the rest on the hashing process pool (hasing.hash_passwords_async)
+#       one INSERT ... ON CONFLICT DO NOTHING RETURNING id, email: a row missing from RETURNING
+#       was taken meanwhile by another request and is reported as a duplicate too
+#       commit
+#
+# Sending the same file again is safe: the accounts created the first time come back as
+# duplicates. bcrypt dominates the time (BCRYPT_ROUNDS 12 ~ 0.3 s per password and process),
+# hence the PROVISION_MAX_ROWS [2000] limit per upload.
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models, schemas
+from utils import hasing
+from utils.ingest import MAX_REPORTED_ERRORS, RowError, error_messages
+
+BATCH_ROWS = 500
+PROVISION_MAX_ROWS = int(os.getenv("PROVISION_MAX_ROWS", "2000"))
+
+
+def validate(records: Iterable[Tuple[int, Any]], default_role: str):
+    """[(row, UserProvision)] to create, [(row, [messages])] rejected, [(row, email, reason)] repeated."""
+    rows, errors, duplicates = [], [], []
+    emails, usernames = set(), set()
+    for row, rec in records:
+        if row > PROVISION_MAX_ROWS:
+            raise ValueError(f"at most {PROVISION_MAX_ROWS} users per upload")
+        if isinstance(rec, RowError):
+            errors.append((row, [str(rec)]))
+            continue
+        if not isinstance(rec, dict):
+            errors.append((row, ["expected an object"]))
+            continue
+        try:
+            u = schemas.UserProvision.model_validate({"role": default_role, **{k: v for k, v in rec.items() if v is not None}})
+        except ValidationError as e:
+            errors.append((row, error_messages(e)))
+            continue
+        if u.email in emails or u.username in usernames:
+            duplicates.append((row, u.email, "repeated in upload"))
+            continue
+        emails.add(u.email)
+        usernames.add(u.username)
+        rows.append((row, u))
+    return rows, errors, duplicates
+
+
+async def _create_batch(db: AsyncSession, batch: List[Tuple[int, schemas.UserProvision]]):
+    """Insert one batch (commits): [(row, id, email)] created, [(row, email, reason)] duplicates."""
+    existing = (await db.execute(
+        select(models.User.email, models.User.username).where(or_(
+            models.User.email.in_([u.email for _, u in batch]),
+            models.User.username.in_([u.username for _, u in batch]),
+        ))
+    )).all()
+    taken_emails = {e for e, _ in existing}
+    taken_usernames = {n for _, n in existing}
+
+    duplicates, todo = [], []
+    for row, u in batch:
+        if u.email in taken_emails:
+            duplicates.append((row, u.email, "email exists"))
+        elif u.username in taken_usernames:
+            duplicates.append((row, u.email, "username exists"))
+        else:
+            todo.append((row, u))
+    if not todo:
+        return [], duplicates
+
+    hashes = await hasing.hash_passwords_async([u.password for _, u in todo])
+    returned = (await db.execute(
+        insert(models.User)
+        .values([{"email": u.email, "username": u.username, "password": h, "role": u.role}
+                 for (_, u), h in zip(todo, hashes)])
+        .on_conflict_do_nothing()
+        .returning(models.User.id, models.User.email)
+    )).all()
+    await db.commit()
+
+    ids = {email: user_id for user_id, email in returned}
+    created = []
+    for row, u in todo:
+        if u.email in ids:
+            created.append((row, ids[u.email], u.email))
+        else:
+            duplicates.append((row, u.email, "email or username exists"))
+    return created, duplicates
+
+
+async def provision(db: AsyncSession, records: Iterable[Tuple[int, Any]], default_role: str = "patient") -> Dict[str, Any]:
+    """
+    Validate and create the parsed users, committing after every batch.
+
+    Returns the schemas.BulkUsersResult fields; duplicate_rows / errors list at most
+    MAX_REPORTED_ERRORS rows each. ValueError if the upload has too many rows.
+    """
+    # parsing / validation are blocking CPU work: off the event loop
+    rows, errors, duplicates = await run_in_threadpool(validate, records, default_role)
+
+    created = []
+    for start in range(0, len(rows), BATCH_ROWS):
+        batch_created, batch_duplicates = await _create_batch(db, rows[start:start + BATCH_ROWS])
+        created += batch_created
+        duplicates += batch_duplicates
+
+    duplicates.sort()
+    return {
+        "created": len(created),
+        "duplicates": len(duplicates),
+        "failed": len(errors),
+        "users": [{"row": r, "id": i, "email": e} for r, i, e in created],
+        "duplicate_rows": [{"row": r, "email": e, "reason": why} for r, e, why in duplicates[:MAX_REPORTED_ERRORS]],
+        "errors": [{"row": r, "errors": m} for r, m in errors[:MAX_REPORTED_ERRORS]],
+    }
@@ -0,0 +1,30 @@
+# utils/responses.py
+# PURPOSE : JSON response that serializes plain dicts / rows straight to bytes.
+#
+# Returning a Response from an endpoint skips FastAPI's response_model validation + jsonable_encoder,
+# which for list endpoints means no Pydantic object per row. The response_model on the route
+# is still used for the OpenAPI docs, so keep the payload shaped like it.
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+# OPT_UTC_Z : "2025-08-03T10:00:00Z", same as the Pydantic output the frontend already parses
+_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=_OPTIONS)
+
+
+def dumps_lines(items) -> bytes:
+    """One JSON document per line (NDJSON), e.g. a chunk of a streamed export."""
+    option = _OPTIONS | orjson.OPT_APPEND_NEWLINE
+    return b"".join(orjson.dumps(item, option=option) for item in items)
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        # already serialized (e.g. a body from utils/cache.py) -> send as-is
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -0,0 +1,218 @@
+# utils/rolling.py
+# PURPOSE : vectorized rolling statistics (mean / median / std) for the trends chart.
+#
+#   - values are float arrays with NaN for "no reading"; a window only looks at real readings
+#   - window by point count ("last 7 readings") or by time ("last 7 days")
+#   - everything is NumPy: cumulative sums for mean / std, a padded index matrix
+#     (processed in chunks to bound memory) for the median
+#   - bounded work per request: windows of at most MAX_WINDOW_POINTS readings / MAX_WINDOW_DAYS,
+#     and a median only if its padded matrix (readings x largest window) stays within
+#     MEDIAN_MAX_CELLS, otherwise ValueError (the route answers 400)
+#
+# Env: ROLLING_MAX_WINDOW_POINTS [500], ROLLING_MAX_WINDOW_DAYS [90], ROLLING_MEDIAN_MAX_CELLS [20000000]
+#
+# Command line (run from the backend folder), synthetic series, no database:
+#   python -m utils.rolling bench [--sizes 10000 100000 1000000]
+#     the old per-row list.pop(0) loop vs the vectorized 7-point mean, 5 metrics x mean + std
+#     over 7 days, and the median (7 points / 1 day)
+import os
+import re
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+STATS = ("mean", "median", "std")
+
+_WINDOW_RE = re.compile(r"^(\d+)([dh]?)$")
+_UNIT_SECONDS = {"d": 86400, "h": 3600}
+
+# max cells of the padded matrix used for one median chunk (~32 MB of float64)
+_MEDIAN_CHUNK_CELLS = 4_000_000
+
+MAX_WINDOW_POINTS = int(os.getenv("ROLLING_MAX_WINDOW_POINTS", "500"))
+MAX_WINDOW_DAYS = float(os.getenv("ROLLING_MAX_WINDOW_DAYS", "90"))
+# sorting cost of one median (all chunks): ~1 s of CPU at the default
+MEDIAN_MAX_CELLS = int(os.getenv("ROLLING_MEDIAN_MAX_CELLS", "20000000"))
+
+
+def parse_window(window: str) -> Tuple[Optional[int], Optional[float]]:
+    """
+    "7"  -> (7, None)      : last 7 readings
+    "7d" -> (None, 604800) : readings in the last 7 days (up to and including the point)
+    "12h"-> (None, 43200)
+    """
+    m = _WINDOW_RE.match(window.strip())
+    if not m or int(m.group(1)) < 1:
+        raise ValueError(f"invalid window {window!r}, expected e.g. '7', '7d' or '12h'")
+    size, unit = int(m.group(1)), m.group(2)
+    if unit:
+        seconds = float(size * _UNIT_SECONDS[unit])
+        if seconds > MAX_WINDOW_DAYS * 86400:
+            raise ValueError(f"window {window!r} too long, at most {MAX_WINDOW_DAYS:g} days")
+        return None, seconds
+    if size > MAX_WINDOW_POINTS:
+        raise ValueError(f"window {window!r} too long, at most {MAX_WINDOW_POINTS} readings")
+    return size, None
+
+
+def _bounds(times: np.ndarray, points: Optional[int], seconds: Optional[float]):
+    """[left, right) slice of each point's window (indices into the compressed series)."""
+    m = len(times)
+    right = np.arange(1, m + 1)
+    if points is not None:
+        left = np.maximum(right - points, 0)
+    else:
+        left = np.searchsorted(times, times - seconds, side="right")
+    return left, right
+
+
+def _median(v: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    m = len(v)
+    k = int((right - left).max())
+    out = np.empty(m)
+    offsets = np.arange(k)
+    step = max(_MEDIAN_CHUNK_CELLS // k, 1)
+    for s in range(0, m, step):
+        e = min(s + step, m)
+        idx = (right[s:e, None] - 1) - offsets[None, :]
+        valid = idx >= left[s:e, None]
+        # NaN pads sort to the end, so the median sits at the middle of the first `count` cells
+        cells = np.sort(np.where(valid, v[np.clip(idx, 0, None)], np.nan), axis=1)
+        counts = (right[s:e] - left[s:e])[:, None]
+        lo = np.take_along_axis(cells, (counts - 1) // 2, axis=1)
+        hi = np.take_along_axis(cells, counts // 2, axis=1)
+        out[s:e] = ((lo + hi) / 2)[:, 0]
+    return out
+
+
+def rolling_stats(
+    times: np.ndarray,
+    values: np.ndarray,
+    stats: Iterable[str] = ("mean",),
+    points: Optional[int] = None,
+    seconds: Optional[float] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Rolling statistics of one metric.
+
+    Args:
+        times: ascending timestamps (seconds), same length as values.
+        values: float array, NaN where the metric wasn't recorded.
+        stats: any of "mean", "median", "std" (population std).
+        points / seconds: window size as a point count OR a time span (exactly one).
+
+    Returns:
+        stat name -> array aligned with `values` (NaN where the metric is missing).
+
+    Raises:
+        ValueError: a median larger than MEDIAN_MAX_CELLS.
+    """
+    stats = tuple(stats)
+    n = len(values)
+    present = ~np.isnan(values)
+    t, v = times[present], values[present]
+    out = {s: np.full(n, np.nan) for s in stats}
+    if len(v) == 0:
+        return out
+
+    left, right = _bounds(t, points, seconds)
+    counts = right - left
+
+    if "mean" in stats or "std" in stats:
+        # shift by the series mean so the cumulative sums keep their precision
+        shift = v.mean()
+        d = v - shift
+        c1 = np.concatenate(([0.0], np.cumsum(d)))
+        mean_d = (c1[right] - c1[left]) / counts
+        if "mean" in stats:
+            out["mean"][present] = mean_d + shift
+        if "std" in stats:
+            c2 = np.concatenate(([0.0], np.cumsum(d * d)))
+            var = (c2[right] - c2[left]) / counts - mean_d * mean_d
+            var[counts == 1] = 0.0  # exact: the cumulative sums leave ~1e-13, sqrt makes that 1e-7
+            out["std"][present] = np.sqrt(np.clip(var, 0.0, None))
+
+    if "median" in stats:
+        cells = len(v) * int(counts.max())
+        if cells > MEDIAN_MAX_CELLS:
+            raise ValueError(f"median over {len(v)} readings with windows of up to {int(counts.max())} "
+                             "is too much work, use a shorter range or window")
+        out["median"][present] = _median(v, left, right)
+
+    return out
+
+
+def to_array(values: Iterable[Optional[float]]) -> np.ndarray:
+    """Python values (None = missing) -> float array with NaN."""
+    return np.array([np.nan if x is None else x for x in values], dtype=float)
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+
+def _loop_roll7(values) -> list:
+    """The per-row loop routers/trends.py had before this module: 7-reading systolic mean."""
+    rolls, window = [], []
+    for x in values:
+        if x is not None:
+            window.append(x)
+            if len(window) > 7:
+                window.pop(0)
+            rolls.append(sum(window) / len(window))
+        else:
+            rolls.append(None)
+    return rolls
+
+
+def _series(n: int, seed: int = 0) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """n readings every 10 minutes, each metric missing about half the time."""
+    rng = np.random.default_rng(seed)
+    times = np.arange(n, dtype=float) * 600
+    metrics = {}
+    for name, mean, sd in (("systolic", 125, 15), ("diastolic", 80, 10), ("heart_rate", 72, 12),
+                           ("temperature", 98.6, 0.8), ("glucose", 110, 25)):
+        v = rng.normal(mean, sd, n)
+        v[rng.random(n) < 0.5] = np.nan
+        metrics[name] = v
+    return times, metrics
+
+
+def bench(sizes: Iterable[int] = (10_000, 100_000, 1_000_000)) -> None:
+    def best_ms(fn, rounds=3):
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    print(f"{'points':>9}  {'old loop':>10}  {'mean7':>10}  {'5x mean+std 7d':>15}  "
+          f"{'median 7':>10}  {'median 1d':>10}")
+    for n in sizes:
+        times, metrics = _series(n)
+        systolic = metrics["systolic"]
+        as_list = [None if np.isnan(x) else float(x) for x in systolic]
+
+        loop = best_ms(lambda: _loop_roll7(as_list))
+        mean7 = best_ms(lambda: rolling_stats(times, systolic, ("mean",), points=7))
+        week = best_ms(lambda: [rolling_stats(times, v, ("mean", "std"), seconds=7 * 86400)
+                                for v in metrics.values()])
+        median7 = best_ms(lambda: rolling_stats(times, systolic, ("median",), points=7), rounds=1)
+        try:
+            median_day = f"{best_ms(lambda: rolling_stats(times, systolic, ('median',), seconds=86400), rounds=1):8.1f} ms"
+        except ValueError:
+            median_day = "  rejected"  # over MEDIAN_MAX_CELLS, the route answers 400
+        print(f"{n:>9}  {loop:7.1f} ms  {mean7:7.1f} ms  {week:12.1f} ms  {median7:7.1f} ms  {median_day:>10}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rolling statistics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench", help="old per-row loop vs the vectorized rolling statistics")
+    b.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    bench(args.sizes)
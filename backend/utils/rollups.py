@@ -0,0 +1,214 @@
+# utils/rollups.py
+# PURPOSE : keep the per-user daily rollup table (models.VitalDailyRollup) in sync with the vitals table.
+#
+#   - record_insert() : incremental upsert for a single new reading (create_vital)
+#   - record_staged() : the same for a staged batch of new readings (bulk import)
+#   - refresh_days()  : recompute a few (user, day) rows from raw vitals (update / delete)
+#   - rebuild()       : full backfill, also runnable from the command line
+#   - backfill_if_empty() : rebuild() on startup when the rollups are still empty but vitals
+#                       aren't (first start after upgrading an existing database)
+#
+# All helpers only add statements to the caller's session, the caller commits,
+# so the rollup changes land in the same transaction as the vitals change.
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import Date, cast, delete, func, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import models
+
+METRICS = ("systolic_bp", "diastolic_bp", "heart_rate", "temperature", "glucose")
+
+
+# ---------------------------
+# Helpers
+# ---------------------------
+
+def day_of(dt: datetime) -> date:
+    """UTC calendar day a reading falls in (naive datetimes are treated as UTC)."""
+    if dt.tzinfo is None:
+        return dt.date()
+    return dt.astimezone(timezone.utc).date()
+
+
+def day_start(d: date) -> datetime:
+    """Midnight UTC at the start of the given day."""
+    return datetime.combine(d, time(), tzinfo=timezone.utc)
+
+
+def _lock_user(db: Session, user_id: int) -> None:
+    # serialize rollup maintenance per user for the rest of the transaction,
+    # so a concurrent insert can't be lost by a refresh that read an older snapshot
+    db.execute(select(func.pg_advisory_xact_lock(user_id)))
+
+
+def _flagged(V=models.Vital):
+    return or_(
+        V.systolic_bp >= models.FLAG_SYSTOLIC_BP,
+        V.temperature >= models.FLAG_TEMPERATURE,
+    )
+
+
+def _aggregate_select(V=models.Vital):
+    """SELECT user_id, day, <rollup columns> FROM vitals GROUP BY user_id, day"""
+    day = cast(func.timezone("UTC", V.recorded_at), Date)
+
+    cols = [
+        V.user_id.label("user_id"),
+        day.label("day"),
+        func.count().label("entries"),
+        func.count().filter(_flagged(V)).label("flagged_entries"),
+        func.max(V.recorded_at).label("last_recorded_at"),
+    ]
+    for m in METRICS:
+        c = getattr(V, m)
+        cols += [
+            func.count(c).label(f"{m}_count"),
+            func.sum(c).label(f"{m}_sum"),
+            func.min(c).label(f"{m}_min"),
+            func.max(c).label(f"{m}_max"),
+        ]
+    return select(*cols).group_by(V.user_id, day)
+
+
+def _upsert_from_select(sel):
+    R = models.VitalDailyRollup.__table__
+    names = [c.name for c in sel.selected_columns]
+    stmt = pg_insert(R).from_select(names, sel)
+    return stmt.on_conflict_do_update(
+        index_elements=[R.c.user_id, R.c.day],
+        set_={n: stmt.excluded[n] for n in names if n not in ("user_id", "day")},
+    )
+
+
+# ---------------------------
+# Write-path maintenance
+# ---------------------------
+
+def _increments(R, ex) -> dict:
+    """ON CONFLICT SET clause adding the excluded (new) aggregates onto the existing row."""
+    updates = {
+        "entries": R.c.entries + ex.entries,
+        "flagged_entries": R.c.flagged_entries + ex.flagged_entries,
+        "last_recorded_at": func.greatest(R.c.last_recorded_at, ex.last_recorded_at),
+    }
+    for m in METRICS:
+        # LEAST / GREATEST ignore NULLs in PostgreSQL, a sum plus NULL falls back to either side
+        s = R.c[f"{m}_sum"]
+        updates[f"{m}_count"] = R.c[f"{m}_count"] + ex[f"{m}_count"]
+        updates[f"{m}_sum"] = func.coalesce(s + ex[f"{m}_sum"], s, ex[f"{m}_sum"])
+        updates[f"{m}_min"] = func.least(R.c[f"{m}_min"], ex[f"{m}_min"])
+        updates[f"{m}_max"] = func.greatest(R.c[f"{m}_max"], ex[f"{m}_max"])
+    return updates
+
+
+def record_insert(db: Session, vital: models.Vital) -> None:
+    """Add one freshly inserted reading to its day's rollup (insert or increment)."""
+    _lock_user(db, vital.user_id)
+
+    R = models.VitalDailyRollup.__table__
+    is_flagged = (
+        (vital.systolic_bp is not None and vital.systolic_bp >= models.FLAG_SYSTOLIC_BP) or
+        (vital.temperature is not None and vital.temperature >= models.FLAG_TEMPERATURE)
+    )
+    values = {
+        "user_id": vital.user_id,
+        "day": day_of(vital.recorded_at),
+        "entries": 1,
+        "flagged_entries": 1 if is_flagged else 0,
+        "last_recorded_at": vital.recorded_at,
+    }
+    for m in METRICS:
+        v = getattr(vital, m)
+        values.update({f"{m}_count": 0 if v is None else 1,
+                       f"{m}_sum": v, f"{m}_min": v, f"{m}_max": v})
+
+    stmt = pg_insert(R).values(**values)
+    db.execute(stmt.on_conflict_do_update(index_elements=[R.c.user_id, R.c.day],
+                                          set_=_increments(R, stmt.excluded)))
+
+
+def record_staged(db: Session, user_id: int, staged) -> None:
+    """
+    Add a batch of new readings of one user to their days' rollups (bulk import).
+    staged: a table holding just the new rows, with the vitals column names (e.g. a COPY target).
+    """
+    _lock_user(db, user_id)
+
+    R = models.VitalDailyRollup.__table__
+    sel = _aggregate_select(staged.c)
+    stmt = pg_insert(R).from_select([c.name for c in sel.selected_columns], sel)
+    db.execute(stmt.on_conflict_do_update(index_elements=[R.c.user_id, R.c.day],
+                                          set_=_increments(R, stmt.excluded)))
+
+
+def refresh_days(db: Session, user_id: int, days: Iterable[date]) -> None:
+    """Recompute the given days for one user from the raw vitals (min/max can't be decremented)."""
+    days = sorted(set(days))
+    if not days:
+        return
+    _lock_user(db, user_id)
+
+    V = models.Vital
+    R = models.VitalDailyRollup
+
+    # only the raw rows of the touched days (range predicates so the recorded_at index is used)
+    in_days = or_(*[
+        (V.recorded_at >= day_start(d)) & (V.recorded_at < day_start(d + timedelta(days=1)))
+        for d in days
+    ])
+    sel = _aggregate_select().where(V.user_id == user_id, in_days)
+
+    # days that no longer have any reading disappear, the rest are overwritten
+    db.execute(delete(R).where(R.user_id == user_id, R.day.in_(days)))
+    db.execute(_upsert_from_select(sel))
+
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    """Backfill / rebuild rollups from scratch for one user (or everyone). Returns rows written."""
+    V = models.Vital
+    R = models.VitalDailyRollup
+
+    sel = _aggregate_select()
+    wipe = delete(R)
+    if user_id is not None:
+        _lock_user(db, user_id)
+        sel = sel.where(V.user_id == user_id)
+        wipe = wipe.where(R.user_id == user_id)
+    else:
+        # block concurrent rollup writers until the rebuild commits
+        db.execute(text(f"LOCK TABLE {R.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+
+    db.execute(wipe)
+    return db.execute(_upsert_from_select(sel)).rowcount
+
+
+def backfill_if_empty(db: Session) -> Optional[int]:
+    """rebuild() if vital_daily_rollups has no rows while vitals has some; rows written or None."""
+    R = models.VitalDailyRollup
+    # the table lock makes other workers starting at the same time wait here, then skip
+    db.execute(text(f"LOCK TABLE {R.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+    if db.execute(select(R.user_id).limit(1)).first() is not None:
+        return None
+    if db.execute(select(models.Vital.id).limit(1)).first() is None:
+        return None
+    return rebuild(db)
+
+
+if __name__ == "__main__":
+    # Backfill command (run from the backend folder):
+    #   python -m utils.rollups            -> rebuild every user's rollups
+    #   python -m utils.rollups --user 42  -> rebuild a single user
+    import argparse
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild vital_daily_rollups from the vitals table")
+    parser.add_argument("--user", type=int, default=None, help="only rebuild this user id")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        n = rebuild(db, args.user)
+        db.commit()
+    print(f"rebuilt {n} rollup rows")
@@ -0,0 +1,523 @@
+# utils/schedule.py
+# PURPOSE : provider schedules — overlap checks and free time without a range query per check,
+#           and no double-booked provider.
+#
+# Interval index (per API worker):
+#   - index       : provider id -> ProviderSchedule, the provider's requested / confirmed
+#                   appointments and availabilities as sorted (start, end, id) arrays. Loaded on
+#                   first use (2 queries, everything ending after now - SCHEDULE_LOOKBACK_HOURS),
+#                   LRU of SCHEDULE_INDEX_SIZE providers, reloaded after SCHEDULE_TTL_SECONDS
+#   - free_slots  : availability minus confirmed appointments between two times, from memory,
+#                   O(log n + k) (GET /appointments/providers/{id}/free, vapi list_free_slots)
+#   - has_overlap : the overlap check of booking / reschedule / approval (routers/appointment.py,
+#                   routers/vapi.py). Always answered by the database: an index that hasn't seen
+#                   another worker's booking yet would let a requested appointment in over it,
+#                   and APPOINTMENT_OVERLAP_CONSTRAINT only covers confirmed ones
+#   - coherence   : ORM after_insert / after_update / after_delete on models.Appointment and
+#                   models.Availability, applied to this worker's index once the session commits.
+#                   Writes of other workers show up within SCHEDULE_TTL_SECONDS, so free_slots may
+#                   be that much behind; a booking made from it still goes through has_overlap
+#   - loading     : through a session of its own, so a request's uncommitted changes never end
+#                   up in the index
+#   - SCHEDULE_INDEX_VERIFY=1 : consistency-check mode, every overlap check / free_slots also
+#                   asks the index and counts disagreements with the database
+#                   (schedule_index_mismatches_total; the provider is then reloaded).
+#                   `python -m utils.schedule check` does the same for random windows of every
+#                   provider and times both
+#
+# Env: SCHEDULE_INDEX_SIZE [2000] (0 = always query), SCHEDULE_TTL_SECONDS [60],
+#      SCHEDULE_LOOKBACK_HOURS [24], SCHEDULE_INDEX_VERIFY [0]
+#
+# Double booking: routers/appointment.py (approve / reschedule) and the vapi update_appointment
+# tool check for an overlapping confirmed appointment, then write. Check and write are separate
+# statements, so two approvals of overlapping slots running at the same time both pass the check.
+# The authority is the database: models.APPOINTMENT_OVERLAP_CONSTRAINT (EXCLUDE USING gist, see
+# migrations/0005_appointments_no_overlap.sql) makes the second commit fail, and
+# is_overlap_violation() lets the routes turn that into their usual 409 "Time slot not available".
+# The pre-check stays: it answers the common, non-racing case without a failed write.
+#
+# Why a constraint and not a lock (SELECT ... FOR UPDATE / advisory lock per provider around
+# check + write): the lock serializes every approval of a provider for the whole transaction,
+# the constraint only makes the loser of a real conflict fail. tests/test_appointment_overlap.py
+# runs many threads of approve_appointment against the real table to show it holds.
+#
+# Command line (run from the backend folder):
+#   python -m utils.schedule check [--providers 200] [--probes 50]
+#     index vs database for random windows of each provider: disagreements, time per check
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, exists, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+import models
+from utils import metrics
+
+SCHEDULE_INDEX_SIZE = int(os.getenv("SCHEDULE_INDEX_SIZE", "2000"))
+SCHEDULE_TTL_SECONDS = float(os.getenv("SCHEDULE_TTL_SECONDS", "60"))
+SCHEDULE_LOOKBACK_HOURS = float(os.getenv("SCHEDULE_LOOKBACK_HOURS", "24"))
+SCHEDULE_INDEX_VERIFY = os.getenv("SCHEDULE_INDEX_VERIFY", "0").lower() in ("1", "true", "yes")
+
+ACTIVE = (models.ApptStatus.requested, models.ApptStatus.confirmed)
+
+Span = Tuple[float, float]  # [start, end) in epoch seconds
+
+
+def _ts(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)  # naive = UTC, like the columns
+    return dt.timestamp()
+
+
+def _dt(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+# ---------------------------
+# Interval index
+# ---------------------------
+
+class _Intervals:
+    """
+    Sorted (start, end, id) tuples plus the longest duration ever added: whatever overlaps
+    [start, end) starts in (start - longest, end), a bisect range.
+    """
+
+    __slots__ = ("items", "longest")
+
+    def __init__(self, rows: Iterable[Tuple[float, float, int]] = ()):
+        self.items = sorted(rows)
+        self.longest = max((e - s for s, e, _ in self.items), default=0.0)
+
+    def add(self, start: float, end: float, key: int) -> None:
+        insort(self.items, (start, end, key))
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, start: float, end: float, key: int) -> None:
+        i = bisect_left(self.items, (start, end, key))
+        if i < len(self.items) and self.items[i] == (start, end, key):
+            del self.items[i]
+
+    def overlapping(self, start: float, end: float):
+        lo = bisect_right(self.items, (start - self.longest, float("inf")))
+        hi = bisect_left(self.items, (end,))
+        for item in self.items[lo:hi]:
+            if item[1] > start:
+                yield item
+
+
+def _subtract(windows: List[Span], busy: Iterable[Span]) -> List[Span]:
+    """Sorted, disjoint `windows` minus the `busy` spans (sorted by start)."""
+    out, i = [], 0
+    windows = list(windows)
+    for b_start, b_end in busy:
+        while i < len(windows) and windows[i][1] <= b_start:
+            out.append(windows[i]); i += 1
+        while i < len(windows) and windows[i][0] < b_end:
+            w_start, w_end = windows[i]
+            if w_start < b_start:
+                out.append((w_start, b_start))
+            if w_end > b_end:
+                windows[i] = (b_end, w_end)
+                break
+            i += 1
+    return out + windows[i:]
+
+
+def _merge(spans: Iterable[Span]) -> List[Span]:
+    """Union of spans sorted by start, as sorted disjoint spans."""
+    out: List[Span] = []
+    for start, end in spans:
+        if out and start <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], end))
+        else:
+            out.append((start, end))
+    return out
+
+
+class ProviderSchedule:
+    """One provider's active appointments (per status) and availabilities, ending after `horizon`."""
+
+    def __init__(self, horizon: float, appointments=(), availabilities=()):
+        self.horizon = horizon
+        self.expires = time.monotonic() + SCHEDULE_TTL_SECONDS
+        self._appts: Dict[int, Tuple[models.ApptStatus, float, float]] = {
+            appt_id: (status, start, end) for appt_id, status, start, end in appointments}
+        self._by_status = {status: _Intervals((s, e, i) for i, (st, s, e) in self._appts.items() if st == status)
+                           for status in ACTIVE}
+        self._avail: Dict[int, Span] = {avail_id: (start, end) for avail_id, start, end in availabilities}
+        self._availability = _Intervals((s, e, i) for i, (s, e) in self._avail.items())
+
+    def put_appointment(self, appt_id: int, status, start: float, end: float) -> None:
+        self.drop_appointment(appt_id)
+        if status in ACTIVE and end > self.horizon:
+            self._appts[appt_id] = (status, start, end)
+            self._by_status[status].add(start, end, appt_id)
+
+    def drop_appointment(self, appt_id: int) -> None:
+        old = self._appts.pop(appt_id, None)
+        if old is not None:
+            self._by_status[old[0]].remove(old[1], old[2], appt_id)
+
+    def put_availability(self, avail_id: int, start: float, end: float) -> None:
+        self.drop_availability(avail_id)
+        if end > self.horizon:
+            self._avail[avail_id] = (start, end)
+            self._availability.add(start, end, avail_id)
+
+    def drop_availability(self, avail_id: int) -> None:
+        old = self._avail.pop(avail_id, None)
+        if old is not None:
+            self._availability.remove(old[0], old[1], avail_id)
+
+    def overlaps(self, start: float, end: float, statuses: Sequence = ACTIVE,
+                 exclude_id: Optional[int] = None) -> Optional[bool]:
+        """None if [start, end) reaches before the loaded range."""
+        if start < self.horizon:
+            return None
+        return any(item[2] != exclude_id
+                   for status in statuses for item in self._by_status[status].overlapping(start, end))
+
+    def free(self, start: float, end: float) -> Optional[List[Span]]:
+        if start < self.horizon:
+            return None
+        windows = _merge((max(s, start), min(e, end)) for s, e, _ in self._availability.overlapping(start, end))
+        busy = sorted((s, e) for s, e, _ in self._by_status[models.ApptStatus.confirmed].overlapping(start, end))
+        return _subtract(windows, busy)
+
+
+class ScheduleIndex:
+    """
+    Thread-safe LRU + TTL map provider id -> ProviderSchedule. Every committed change bumps the
+    provider's stamp, so a schedule loaded while a change committed isn't installed (it may
+    predate the change).
+    """
+
+    def __init__(self, max_providers: int = SCHEDULE_INDEX_SIZE):
+        self.max_providers = max_providers
+        self._data: "OrderedDict[int, ProviderSchedule]" = OrderedDict()
+        self._stamps: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def stamp(self, provider_id: int) -> int:
+        with self._lock:
+            return self._stamps.get(provider_id, 0)
+
+    def install(self, provider_id: int, stamp: int, schedule: ProviderSchedule) -> None:
+        if self.max_providers <= 0:
+            return
+        with self._lock:
+            if self._stamps.get(provider_id, 0) != stamp:
+                return
+            self._data[provider_id] = schedule
+            self._data.move_to_end(provider_id)
+            while len(self._data) > self.max_providers:
+                self._data.popitem(last=False)
+
+    def run(self, schedule: ProviderSchedule, fn):
+        """fn(schedule) under the lock (a schedule just loaded may already be installed)."""
+        with self._lock:
+            return fn(schedule)
+
+    def read(self, provider_id: int, fn):
+        """fn(schedule) under the lock, or _MISSING if the provider isn't loaded (or expired)."""
+        with self._lock:
+            schedule = self._data.get(provider_id)
+            if schedule is None or schedule.expires < time.monotonic():
+                return _MISSING
+            self._data.move_to_end(provider_id)
+            return fn(schedule)
+
+    def apply(self, changes: Iterable[tuple]) -> None:
+        with self._lock:
+            for kind, provider_ids, key, *values in changes:
+                for provider_id in provider_ids:
+                    self._stamps[provider_id] = self._stamps.get(provider_id, 0) + 1
+                    schedule = self._data.get(provider_id)
+                    if schedule is None:
+                        continue
+                    if kind == "appointment":
+                        schedule.drop_appointment(key)
+                    else:
+                        schedule.drop_availability(key)
+                if values and provider_ids:
+                    schedule = self._data.get(provider_ids[-1])  # the row's current provider
+                    if schedule is None:
+                        continue
+                    if kind == "appointment":
+                        schedule.put_appointment(key, *values)
+                    else:
+                        schedule.put_availability(key, *values)
+
+    def forget(self, provider_id: int) -> None:
+        with self._lock:
+            self._data.pop(provider_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+index = ScheduleIndex()
+
+
+def _load(db: Session, provider_id: int) -> ProviderSchedule:
+    stamp = index.stamp(provider_id)
+    horizon = datetime.now(timezone.utc) - timedelta(hours=SCHEDULE_LOOKBACK_HOURS)
+    A, Av = models.Appointment, models.Availability
+    # own session on the same engine (inside AsyncSession.run_sync that is the async engine's
+    # sync facade): committed rows only, not whatever the request has flushed so far
+    with Session(db.get_bind()) as fresh:
+        appointments = fresh.execute(
+            select(A.id, A.status, A.start_at, A.end_at)
+            .where(A.provider_id == provider_id, A.status.in_(ACTIVE), A.end_at > horizon)
+        ).all()
+        availabilities = fresh.execute(
+            select(Av.id, Av.start_at, Av.end_at).where(Av.provider_id == provider_id, Av.end_at > horizon)
+        ).all()
+    schedule = ProviderSchedule(
+        _ts(horizon),
+        [(i, st, _ts(s), _ts(e)) for i, st, s, e in appointments],
+        [(i, _ts(s), _ts(e)) for i, s, e in availabilities],
+    )
+    index.install(provider_id, stamp, schedule)
+    metrics.registry.inc("schedule_index_loads_total")
+    return schedule
+
+
+def _from_index(db: Session, provider_id: int, fn):
+    """fn(schedule) from the index, loading the provider first if needed; None if the index is off."""
+    if index.max_providers <= 0:
+        return None
+    found = index.read(provider_id, fn)
+    if found is _MISSING:
+        found = index.run(_load(db, provider_id), fn)
+    return found
+
+
+def _mismatch(check: str, provider_id: int) -> None:
+    metrics.registry.inc("schedule_index_mismatches_total", (("check", check),))
+    index.forget(provider_id)
+
+
+def overlap_stmt(provider_id: int, start: datetime, end: datetime,
+                 statuses: Optional[Sequence] = None, exclude_id: Optional[int] = None):
+    q = exists().where(
+        models.Appointment.provider_id == provider_id,
+        models.Appointment.start_at < end,
+        models.Appointment.end_at > start,
+    )
+    if statuses:
+        q = q.where(models.Appointment.status.in_(statuses))
+    if exclude_id:
+        q = q.where(models.Appointment.id != exclude_id)
+    return select(q)
+
+
+def has_overlap(db: Session, provider_id: int, start: datetime, end: datetime,
+                statuses: Optional[Sequence] = None, exclude_id: Optional[int] = None) -> bool:
+    """
+    Does [start, end) overlap an appointment of the provider in `statuses` (default: any status)
+    other than `exclude_id`? Asks the database, this decides a write. Sync Session; from an
+    AsyncSession use db.run_sync.
+    """
+    in_db = db.execute(overlap_stmt(provider_id, start, end, statuses, exclude_id)).scalar()
+    if SCHEDULE_INDEX_VERIFY and statuses and all(s in ACTIVE for s in statuses):
+        found = _from_index(db, provider_id,
+                            lambda sch: sch.overlaps(_ts(start), _ts(end), statuses, exclude_id))
+        if found is not None and found != in_db:
+            _mismatch("overlap", provider_id)
+    return in_db
+
+
+def _free_in_db(db: Session, provider_id: int, start: datetime, end: datetime) -> List[Span]:
+    """free_slots straight from the database (consistency checks)."""
+    A, Av = models.Appointment, models.Availability
+    avail = db.execute(
+        select(Av.start_at, Av.end_at)
+        .where(Av.provider_id == provider_id, Av.start_at < end, Av.end_at > start)
+        .order_by(Av.start_at)
+    ).all()
+    busy = db.execute(
+        select(A.start_at, A.end_at)
+        .where(A.provider_id == provider_id, A.status == models.ApptStatus.confirmed,
+               A.start_at < end, A.end_at > start)
+        .order_by(A.start_at)
+    ).all()
+    lo, hi = _ts(start), _ts(end)
+    windows = _merge((max(_ts(s), lo), min(_ts(e), hi)) for s, e in avail)
+    return _subtract(windows, [(_ts(s), _ts(e)) for s, e in busy])
+
+
+def free_slots(db: Session, provider_id: int, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    The provider's availability between `start` and `end` minus its confirmed appointments, as
+    sorted disjoint (start, end) pairs. Sync Session; from an AsyncSession use db.run_sync.
+    """
+    spans = _from_index(db, provider_id, lambda sch: sch.free(_ts(start), _ts(end)))
+    if spans is None or SCHEDULE_INDEX_VERIFY:
+        in_db = _free_in_db(db, provider_id, start, end)
+        if spans is not None and spans != in_db:
+            _mismatch("free", provider_id)
+        spans = in_db
+    return [(_dt(s), _dt(e)) for s, e in spans]
+
+
+# writes through the ORM: remembered at flush, applied to the index once the session commits
+def _remember(session, change) -> None:
+    if session is not None:
+        session.info.setdefault("schedule_changes", []).append(change)
+
+
+def _provider_ids(target) -> Tuple[int, ...]:
+    """(old provider, current provider) if the row moved, else (current provider,)."""
+    history = inspect(target).attrs.provider_id.history
+    old = [p for p in history.deleted or () if p is not None and p != target.provider_id]
+    return (*old, target.provider_id)
+
+
+@event.listens_for(models.Appointment, "after_insert")
+@event.listens_for(models.Appointment, "after_update")
+def _appointment_written(mapper, connection, target):
+    _remember(object_session(target), ("appointment", _provider_ids(target), target.id,
+                                       models.ApptStatus(target.status), _ts(target.start_at), _ts(target.end_at)))
+
+
+@event.listens_for(models.Appointment, "after_delete")
+def _appointment_deleted(mapper, connection, target):
+    _remember(object_session(target), ("appointment", (target.provider_id,), target.id))
+
+
+@event.listens_for(models.Availability, "after_insert")
+@event.listens_for(models.Availability, "after_update")
+def _availability_written(mapper, connection, target):
+    _remember(object_session(target), ("availability", _provider_ids(target), target.id,
+                                       _ts(target.start_at), _ts(target.end_at)))
+
+
+@event.listens_for(models.Availability, "after_delete")
+def _availability_deleted(mapper, connection, target):
+    _remember(object_session(target), ("availability", (target.provider_id,), target.id))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    changes = session.info.pop("schedule_changes", None)
+    if changes:
+        index.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("schedule_changes", None)
+
+
+def _collect():
+    yield "gauge", "schedule_index_providers", (), len(index)
+
+metrics.add_collector(_collect)
+
+
+# ---------------------------
+# Database constraint
+# ---------------------------
+
+EXCLUSION_VIOLATION = "23P01"  # SQLSTATE exclusion_violation
+
+
+def is_overlap_violation(err: IntegrityError) -> bool:
+    """True if `err` is models.APPOINTMENT_OVERLAP_CONSTRAINT failing (psycopg2 or asyncpg)."""
+    orig = err.orig
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if code is not None and code != EXCLUSION_VIOLATION:
+        return False
+    return models.APPOINTMENT_OVERLAP_CONSTRAINT in str(orig)
+
+
+# ---------------------------
+# Consistency check
+# ---------------------------
+
+def check(providers: int = 200, probes: int = 50, seed: int = 0) -> int:
+    """
+    Load the schedules of up to `providers` providers and compare the index with the database
+    for `probes` random windows each (overlap with each status set, free time over a day).
+    Returns the number of disagreements.
+    """
+    import random
+
+    from sqlalchemy import func, union
+
+    from database import SessionLocal
+
+    rng = random.Random(seed)
+    A, Av = models.Appointment, models.Availability
+    horizon = datetime.now(timezone.utc) - timedelta(hours=SCHEDULE_LOOKBACK_HOURS)
+    spans = union(
+        select(A.provider_id, A.start_at, A.end_at).where(A.status.in_(ACTIVE), A.end_at > horizon),
+        select(Av.provider_id, Av.start_at, Av.end_at).where(Av.end_at > horizon),
+    ).subquery()
+
+    checks = mismatches = 0
+    memory_s = database_s = load_s = 0.0
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(spans.c.provider_id, func.min(spans.c.start_at), func.max(spans.c.end_at))
+            .group_by(spans.c.provider_id).order_by(spans.c.provider_id).limit(providers)
+        ).all()
+        for provider_id, first, last in rows:
+            start = time.perf_counter()
+            _from_index(db, provider_id, lambda sch: None)
+            load_s += time.perf_counter() - start
+            lo, hi = max(_ts(first), _ts(horizon)) - 3600, _ts(last) + 3600
+
+            for _ in range(probes):
+                s = float(int(rng.uniform(max(lo, _ts(horizon)), hi)))  # whole seconds: exact as datetime
+                e = s + rng.choice((15, 30, 45, 60, 120)) * 60
+                for statuses in (ACTIVE, (models.ApptStatus.confirmed,)):
+                    t0 = time.perf_counter()
+                    mem = _from_index(db, provider_id, lambda sch: sch.overlaps(s, e, statuses))
+                    t1 = time.perf_counter()
+                    in_db = db.execute(overlap_stmt(provider_id, _dt(s), _dt(e), statuses)).scalar()
+                    t2 = time.perf_counter()
+                    memory_s += t1 - t0; database_s += t2 - t1; checks += 1
+                    if mem != in_db:
+                        mismatches += 1
+                        print(f"  provider {provider_id} {_dt(s)} .. {_dt(e)} {[st.value for st in statuses]}: "
+                              f"index {mem}, database {in_db}")
+                day = (s, s + 86400)
+                mem = _from_index(db, provider_id, lambda sch: sch.free(*day))
+                if mem != _free_in_db(db, provider_id, _dt(day[0]), _dt(day[1])):
+                    mismatches += 1
+                    print(f"  provider {provider_id} free time from {_dt(day[0])}: index and database differ")
+        db.rollback()
+
+    print(f"{len(rows)} providers, {checks} overlap checks + {len(rows) * probes} free-time checks: "
+          f"{mismatches} disagreements")
+    if checks:
+        print(f"  overlap check: index {memory_s / checks * 1e6:.1f} us, database {database_s / checks * 1000:.2f} ms"
+              f"   (loading a provider: {load_s / max(len(rows), 1) * 1000:.2f} ms)")
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Provider schedules")
+    sub = parser.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("check", help="compare the interval index with the database")
+    c.add_argument("--providers", type=int, default=200)
+    c.add_argument("--probes", type=int, default=50, help="random windows per provider")
+    args = parser.parse_args()
+
+    raise SystemExit(1 if check(args.providers, args.probes) else 0)
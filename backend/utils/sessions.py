@@ -0,0 +1,303 @@
+# utils/sessions.py
+# PURPOSE : rotating refresh tokens, so an expired access token is renewed at /token/refresh
+#           without a password (no bcrypt) instead of a full /login.
+#
+#   - issue()       : new login session -> opaque refresh token (random, 256 bits). Only its
+#                     SHA-256 is stored, in user_sessions (models.UserSession)
+#   - rotate()      : refresh token -> (user id, new refresh token). The old token is revoked in
+#                     the same transaction, so every refresh token works exactly once
+#   - reuse         : a revoked token presented again (stolen and already used by someone, or the
+#                     other way round) revokes every session of that user. Except within
+#                     REFRESH_REUSE_GRACE_SECONDS of its rotation: two tabs refreshing with the
+#                     same token, or a client retrying a refresh whose response it lost, get None
+#                     (401, use the new token or log in again) and nothing else is revoked
+#   - revoke() / revoke_user() : logout of one session / of all sessions of a user
+#
+# The database is the authority: a token is only rotated by
+#   UPDATE user_sessions SET revoked_at = now() WHERE id = ? AND revoked_at IS NULL AND expires_at > now()
+# so a token rotated or revoked by another worker fails here too. `index` (per worker) keeps
+# hash -> (session id, user id, expiry, revoked) of the sessions this worker issued / saw, so
+# a refresh skips the lookup by hash and expired / already rotated tokens are answered without a
+# query. Access tokens already handed out stay valid until their exp (JWT_ACCESS_TOKEN_EXPIRE_MINUTES).
+#
+# Env: REFRESH_TOKEN_EXPIRE_DAYS [14] (sliding: every refresh starts a new period),
+#      REFRESH_REUSE_GRACE_SECONDS [10], SESSION_INDEX_SIZE [100000]
+#
+# Command line (run from the backend folder):
+#   python -m utils.sessions bench [--n 50]     # bcrypt login vs refresh cost, per active user per day
+#   python -m utils.sessions purge              # delete expired / revoked sessions older than a day
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+SESSION_INDEX_SIZE = int(os.getenv("SESSION_INDEX_SIZE", "100000"))
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+@dataclass
+class _Entry:
+    session_id: int
+    user_id: int
+    expires_at: float  # epoch seconds
+    revoked_at: Optional[float] = None  # epoch seconds, None while the token is usable
+
+    @property
+    def revoked(self) -> bool:
+        return self.revoked_at is not None
+
+
+def _in_grace(revoked_at: float) -> bool:
+    """Revoked less than REFRESH_REUSE_GRACE_SECONDS ago: a race, not a stolen token."""
+    return time.time() - revoked_at < REFRESH_REUSE_GRACE_SECONDS
+
+
+class SessionIndex:
+    """Thread-safe LRU map token hash -> session, with a per-user set for bulk revocation."""
+
+    def __init__(self, max_entries: int = SESSION_INDEX_SIZE):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def add(self, key: str, entry: _Entry) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            self._by_user.setdefault(entry.user_id, set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._forget(*self._data.popitem(last=False))
+
+    def mark_revoked(self, key: str, at: Optional[float] = None) -> None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.revoked_at is None:
+                entry.revoked_at = at or time.time()
+
+    def revoke_user(self, user_id: int) -> None:
+        now = time.time()
+        with self._lock:
+            for key in self._by_user.get(user_id, ()):
+                entry = self._data[key]
+                if entry.revoked_at is None:
+                    entry.revoked_at = now
+
+    def _forget(self, key: str, entry: _Entry) -> None:
+        keys = self._by_user.get(entry.user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry.user_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+
+
+index = SessionIndex()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def _insert(db: AsyncSession, user_id: int) -> str:
+    token = secrets.token_urlsafe(32)
+    key = token_hash(token)
+    expires_at = _now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    session_id = (await db.execute(
+        insert(models.UserSession)
+        .values(user_id=user_id, token_hash=key, expires_at=expires_at)
+        .returning(models.UserSession.id)
+    )).scalar_one()
+    index.add(key, _Entry(session_id, user_id, expires_at.timestamp()))
+    return token
+
+
+async def issue(db: AsyncSession, user_id: int) -> str:
+    """Start a session for `user_id` (commits) and return its refresh token."""
+    token = await _insert(db, user_id)
+    await db.commit()
+    return token
+
+
+async def rotate(db: AsyncSession, token: str) -> Optional[Tuple[int, str]]:
+    """(user id, new refresh token), or None if the token is unknown, expired or revoked (commits)."""
+    key = token_hash(token)
+    entry = index.get(key)
+    if entry is None:
+        row = (await db.execute(
+            select(models.UserSession.id, models.UserSession.user_id,
+                   models.UserSession.expires_at, models.UserSession.revoked_at)
+            .where(models.UserSession.token_hash == key)
+        )).first()
+        if row is None:
+            return None
+        entry = _Entry(row.id, row.user_id, row.expires_at.timestamp(),
+                       row.revoked_at.timestamp() if row.revoked_at is not None else None)
+        index.add(key, entry)
+
+    if entry.revoked:
+        if not _in_grace(entry.revoked_at):
+            await revoke_user(db, entry.user_id)  # reuse of a used / revoked token
+        return None
+    if entry.expires_at <= time.time():
+        return None
+
+    rotated = (await db.execute(
+        update(models.UserSession)
+        .where(models.UserSession.id == entry.session_id,
+               models.UserSession.revoked_at.is_(None),
+               models.UserSession.expires_at > _now())
+        .values(revoked_at=_now())
+        .returning(models.UserSession.id)
+    )).first()
+    if rotated is None:
+        # rotated / revoked by another worker since this one saw it (or expired just now)
+        revoked_at = (await db.execute(
+            select(models.UserSession.revoked_at).where(models.UserSession.id == entry.session_id)
+        )).scalar()
+        await db.rollback()
+        if revoked_at is None:
+            return None  # expired just now
+        index.mark_revoked(key, revoked_at.timestamp())
+        if not _in_grace(revoked_at.timestamp()):
+            await revoke_user(db, entry.user_id)
+        return None
+
+    new_token = await _insert(db, entry.user_id)
+    await db.commit()
+    index.mark_revoked(key)
+    return entry.user_id, new_token
+
+
+async def revoke(db: AsyncSession, token: str) -> bool:
+    """Logout of one session (commits). False if the token was unknown or already revoked."""
+    key = token_hash(token)
+    result = await db.execute(
+        update(models.UserSession)
+        .where(models.UserSession.token_hash == key, models.UserSession.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+    await db.commit()
+    index.mark_revoked(key)
+    return result.rowcount > 0
+
+
+async def revoke_user(db: AsyncSession, user_id: int) -> int:
+    """Revoke every open session of `user_id` (commits), return how many there were."""
+    result = await db.execute(
+        update(models.UserSession)
+        .where(models.UserSession.user_id == user_id, models.UserSession.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+    await db.commit()
+    index.revoke_user(user_id)
+    return result.rowcount
+
+
+def purge(db, older_than: timedelta = timedelta(days=1)) -> int:
+    """Delete sessions expired or revoked more than `older_than` ago (sync Session, commits)."""
+    cutoff = _now() - older_than
+    result = db.execute(
+        delete(models.UserSession).where(or_(models.UserSession.expires_at < cutoff,
+                                             models.UserSession.revoked_at < cutoff))
+    )
+    db.commit()
+    return result.rowcount
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+
+async def _bench_refresh(n: int, user_id: int) -> Tuple[float, float]:
+    from database import AsyncSessionLocal
+    from utils.sessions import issue, revoke_user, rotate  # the module instance the app uses (not __main__'s)
+
+    async with AsyncSessionLocal() as db:
+        token = await issue(db, user_id)
+        wall, cpu = time.perf_counter(), time.process_time()
+        for _ in range(n):
+            token = (await rotate(db, token))[1]
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        await revoke_user(db, user_id)
+    return wall / n * 1000, cpu / n * 1000
+
+
+def bench(n: int = 50, active_hours: float = 8.0) -> None:
+    """bcrypt CPU per active user per day: re-login at every access token expiry vs refresh tokens."""
+    import asyncio
+
+    from database import SessionLocal
+    from oauth2 import ACCESS_TOKEN_EXPIRE_MINUTES
+    from utils import hasing
+
+    with SessionLocal() as db:
+        user = db.query(models.User).first()
+        if user is None:
+            raise SystemExit("no user in the database")
+        user_id = user.id
+
+    stored = hasing.hash_password("bench-password")
+    start = time.process_time()
+    for _ in range(n):
+        hasing.verify_password("bench-password", stored)
+    bcrypt_ms = (time.process_time() - start) / n * 1000
+
+    refresh_ms, refresh_cpu_ms = asyncio.run(_bench_refresh(n * 10, user_id))
+
+    renewals = active_hours * 60 / int(ACCESS_TOKEN_EXPIRE_MINUTES)
+    logins_with_refresh = 1 / REFRESH_TOKEN_EXPIRE_DAYS  # sliding: at most one login per period
+    print(f"bcrypt verify (rounds {hasing.BCRYPT_ROUNDS}): {bcrypt_ms:.1f} ms CPU   "
+          f"refresh: {refresh_ms:.2f} ms wall, {refresh_cpu_ms:.2f} ms CPU (2 statements, no bcrypt)")
+    print(f"active user, {active_hours:g} h/day, access tokens of {ACCESS_TOKEN_EXPIRE_MINUTES} min: "
+          f"{renewals:.0f} renewals/day")
+    print(f"  re-login every time : {renewals * bcrypt_ms:8.1f} ms bcrypt CPU per user per day")
+    print(f"  refresh tokens      : {logins_with_refresh * bcrypt_ms:8.1f} ms bcrypt CPU "
+          f"+ {renewals * refresh_cpu_ms:.1f} ms refresh CPU per user per day")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Login sessions / refresh tokens")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench", help="bcrypt cost of re-logins vs refresh tokens per active user per day")
+    b.add_argument("--n", type=int, default=50, help="bcrypt verifications timed (10x as many refreshes)")
+    b.add_argument("--active-hours", type=float, default=8.0)
+    sub.add_parser("purge", help="delete sessions expired / revoked more than a day ago")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.n, args.active_hours)
+    else:
+        from database import SessionLocal
+        with SessionLocal() as db:
+            print(f"{purge(db)} sessions deleted")
@@ -160,9 +160,10 @@ export async function fetchSummary() {
   return res.json();
 }
 
-export async function fetchTrends(range = "7d") {
+// maxPoints : let the backend downsample long histories (keeps spikes, bounds the payload)
+export async function fetchTrends(range = "7d", maxPoints) {
   const token = getToken();
-  const res = await fetch(`${BASE_URL}/vitals/trends?range=${range}`, {
+  const res = await fetch(`${BASE_URL}/vitals/trends${qs({ range, max_points: maxPoints })}`, {
     headers: { Authorization: `Bearer ${token}` }
   });
   return res.json();
@@ -176,6 +177,30 @@ export async function fetchRecent(limit = 10) {
   return res.json();
 }
 
+// full history, one page at a time (pass the previous page's next_cursor to continue)
+export async function fetchHistory({ cursor, limit = 50, direction = "older", start, end } = {}) {
+  return request(`/vitals/history${qs({ cursor, limit, direction, start, end })}`);
+}
+
+// whole history as a file download ("csv" or "ndjson"), streamed by the backend -> returns a Blob
+export async function exportVitals({ format = "csv", start, end } = {}) {
+  const token = getToken();
+  const res = await fetch(`${BASE_URL}/vitals/export${qs({ format, start, end })}`, {
+    headers: { Authorization: `Bearer ${token}` }
+  });
+  if (!res.ok) throw new Error(`GET /vitals/export ${res.status}`);
+  return res.blob();
+}
+
+// summary + trend points + recent entries in a single round trip
+export async function fetchDashboard({ range = "7d", limit = 10, maxPoints } = {}) {
+  const token = getToken();
+  const res = await fetch(`${BASE_URL}/vitals/dashboard${qs({ range, limit, max_points: maxPoints })}`, {
+    headers: { Authorization: `Bearer ${token}` }
+  });
+  return res.json();
+}
+
 export async function postVital(data) {
   const token = getToken();
   const res = await fetch(`${BASE_URL}/vitals`, {
@@ -189,6 +214,24 @@ export async function postVital(data) {
   return res.json();
 }
 
+// import many readings at once : a .csv / .json / .ndjson file from a device or spreadsheet
+// returns { inserted, failed, errors: [{ row, errors }] }
+export async function uploadVitals(file) {
+  const token = getToken();
+  const form = new FormData();
+  form.append("file", file);
+  const res = await fetch(`${BASE_URL}/vitals/bulk`, {
+    method: "POST",
+    headers: { Authorization: `Bearer ${token}` },
+    body: form,
+  });
+  if (!res.ok) {
+    const text = await res.text();
+    throw new Error(`POST /vitals/bulk ${res.status}: ${text}`);
+  }
+  return res.json();
+}
+
 export async function updateVital(id, data) {
   const token = getToken();
   const res = await fetch(`${BASE_URL}/vitals/${id}`, {
@@ -7,9 +7,7 @@ import EditVitalModal from "../components/EditVitalModal";
 
 import { Link } from "react-router-dom";
 import {
-  fetchSummary,
-  fetchTrends,
-  fetchRecent,
+  fetchDashboard,
   updateVital,
   deleteVital,
 } from "../lib/api";
@@ -26,17 +24,16 @@ export default function Dashboard() {
   const [editOpen, setEditOpen] = useState(false);
   const [editing, setEditing] = useState(null);
 
-  // Reload all dashboard data (summary, trends, recent) from backend
+  // Reload all dashboard data (summary, trends, recent) from backend in one request
   const reloadData = async () => {
-    const summaryData = await fetchSummary();
-    const trendData = await fetchTrends();
-    const recentData = await fetchRecent();
+    // maxPoints ~ chart width, more points aren't visible anyway
+    const data = await fetchDashboard({ range: "7d", limit: 10, maxPoints: 500 });
 
-    setSummary(summaryData);
-    setTrends(trendData.points || []);
+    setSummary(data.summary);
+    setTrends(data.points || []);
 
     // Normalize recent entries for EntryTable compatibility
-    const formattedRecent = recentData.items || recentData;
+    const formattedRecent = data.items || [];
 
     setRecent(Array.isArray(formattedRecent) ? formattedRecent : []);
 };